@@ -0,0 +1,339 @@
+import argparse
+import json
+import math
+import os
+import string
+import time
+
+import numpy as np
+import pandas as pd
+
+from parallel import default_workers, parallel_map
+from stabilization_grid import run_energies
+from sweep import DEFAULT_JAR, DEFAULT_MANIFEST, RUNS_FOLDER, Manifest, expand_variations, load_sweep, \
+    run_is_complete, run_jobs, variation_jobs
+
+PLANS_FOLDER = "./out/sweeps"
+METRICS = ["stabilization_time", "final_energy"]
+# Cuantiles de la t de Student para un intervalo de confianza del 95 %, de 1 a 30 grados de libertad; con más se usa
+# el de la normal
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+        2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def t_quantile(degrees):
+    return T_95[degrees - 1] if degrees <= len(T_95) else 1.96
+
+
+def confidence_width(values):
+    # Ancho total del intervalo de confianza del 95 % de la media
+    if len(values) < 2:
+        return math.inf
+    return 2 * t_quantile(len(values) - 1) * float(np.std(values, ddof=1)) / math.sqrt(len(values))
+
+
+def run_metrics(filename):
+    # El simulador corta la corrida cuando la energía se estabiliza: el último frame da el tiempo de estabilización
+    # y la energía cinética final. La serie de energías se memoriza igual que en stabilization_grid.
+    times, energies = run_energies(filename)
+    return {"stabilization_time": float(times[-1]), "final_energy": float(energies[-1])}
+
+
+def parse_target(text):
+    # "métrica=ancho"; si el ancho termina en % es relativo a la media
+    metric, _, width = text.partition("=")
+    if metric not in METRICS or not width:
+        raise argparse.ArgumentTypeError(f"Objetivo inválido {text}: se espera {'|'.join(METRICS)}=ancho[%]")
+    return metric, (float(width[:-1]) / 100, True) if width.endswith("%") else (float(width), False)
+
+
+class PlanState:
+    # Estado persistente del planificador: los puntos de la grilla, con el valor del parámetro y las repeticiones
+    # pedidas, y el historial de rondas. Se guarda en cada paso, así que una ejecución interrumpida se retoma.
+    def __init__(self, path, sweep_name, parameter, points=None, rounds=None):
+        self.path = path
+        self.sweep_name = sweep_name
+        self.parameter = parameter
+        self.points = points or {}
+        self.rounds = rounds or []
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            stored = json.load(file)
+        return cls(path, stored["sweep"], stored["parameter"], stored["points"], stored["rounds"])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as file:
+            json.dump({"sweep": self.sweep_name, "parameter": self.parameter, "points": self.points,
+                       "rounds": self.rounds}, file, indent=2)
+        os.replace(tmp, self.path)
+
+    def variations(self):
+        return [{"name": name, "args": point["args"]}
+                for name, point in sorted(self.points.items(), key=lambda item: item[1]["value"])]
+
+    def sweep_definition(self, sweep):
+        # Barrido con las variaciones explícitas, para analizar los puntos agregados con variation_analysis y el resto
+        # de los scripts; las repeticiones que no se pidieron se informan como faltantes y se saltean
+        definition = {key: value for key, value in sweep.items() if key not in ("grid", "variations")}
+        definition["variations"] = self.variations()
+        definition["repetitions"] = max(point["repetitions"] for point in self.points.values())
+        return definition
+
+
+def sweep_parameter(sweep):
+    grid = sweep.get("grid", {})
+    if len(grid) != 1 or sweep.get("variations"):
+        raise ValueError(f"El barrido {sweep['name']} no es una grilla de un único parámetro")
+    return next(iter(grid))
+
+
+def completed_repetitions(sweep, variation, manifest, limit):
+    # Repeticiones completas consecutivas desde la 0, para reutilizar lo que ya se simuló
+    count = 0
+    for job in variation_jobs(sweep, variation, range(limit)):
+        if not run_is_complete(job, manifest):
+            break
+        count += 1
+    return count
+
+
+def initial_state(path, sweep, manifest, min_repetitions):
+    parameter = sweep_parameter(sweep)
+    state = PlanState(path, sweep["name"], parameter)
+    for variation in expand_variations(sweep):
+        existing = completed_repetitions(sweep, variation, manifest, sweep.get("repetitions", 1))
+        state.points[variation["name"]] = {"args": variation["args"], "value": float(variation["args"][parameter]),
+                                           "repetitions": max(min_repetitions, existing)}
+    return state
+
+
+def point_jobs(sweep, state, name):
+    point = state.points[name]
+    return variation_jobs(sweep, {"name": name, "args": point["args"]}, range(point["repetitions"]))
+
+
+def measure(sweep, state, manifest, workers=None):
+    # Métricas de cada repetición completa de cada punto; las corridas que faltan o fallaron no cuentan
+    complete = {name: [job for job in point_jobs(sweep, state, name) if run_is_complete(job, manifest)]
+                for name in state.points}
+    filenames = [os.path.join(RUNS_FOLDER, job["output"]) for jobs in complete.values() for job in jobs]
+    metrics = iter(parallel_map(run_metrics, filenames, workers))
+    return {name: pd.DataFrame([next(metrics) for _ in jobs], columns=METRICS) for name, jobs in complete.items()}
+
+
+def summarize(state, measurements, targets):
+    rows = []
+    for name, point in sorted(state.points.items(), key=lambda item: item[1]["value"]):
+        values = measurements[name]
+        row = {"variation": name, "value": point["value"], "requested": point["repetitions"], "completed": len(values)}
+        converged = True
+        for metric, (width, relative) in targets.items():
+            mean = float(values[metric].mean()) if len(values) else math.nan
+            row[f"{metric}_mean"] = mean
+            row[f"{metric}_width"] = confidence_width(values[metric].to_numpy())
+            row[f"{metric}_target"] = width * abs(mean) if relative else width
+            converged &= bool(row[f"{metric}_width"] <= row[f"{metric}_target"])
+        row["converged"] = converged
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("variation")
+
+
+def needed_repetitions(row, targets):
+    # Con el desvío observado, el ancho baja como 1/sqrt(n): estimamos cuántas repeticiones alcanzan el objetivo
+    needed = row["completed"]
+    for metric in targets:
+        width, target = row[f"{metric}_width"], row[f"{metric}_target"]
+        if math.isfinite(width) and target > 0:
+            needed = max(needed, math.ceil(row["completed"] * (width / target) ** 2))
+        elif width > target:
+            needed = max(needed, row["completed"] + 1)
+    return needed
+
+
+def record_failures(sweep, state, manifest):
+    # Repeticiones que el simulador terminó con error (ya con sus reintentos): quedan anotadas en el estado y no se
+    # vuelven a planificar, para no repetir en cada ronda un trabajo que siempre falla
+    failed = {}
+    for name, point in state.points.items():
+        for job in point_jobs(sweep, state, name):
+            entry = manifest.entries.get(job["output"])
+            if entry is not None and entry.get("exit_status") not in (None, 0) and job["repetition"] not in \
+                    point.get("failed", []):
+                point["failed"] = sorted(point.get("failed", []) + [job["repetition"]])
+                failed.setdefault(name, []).append(job["repetition"])
+    return failed
+
+
+def plan_repetitions(state, summary, targets, max_repetitions, step):
+    # Más repeticiones sólo para los puntos que no convergieron y ya terminaron lo que tenían pedido; las que
+    # fallaron cuentan como terminadas, y el reemplazo es una repetición nueva
+    added = {}
+    for name, row in summary.iterrows():
+        failed = len(state.points[name].get("failed", []))
+        if row["converged"] or row["completed"] + failed < row["requested"] or row["requested"] >= max_repetitions:
+            continue
+        extra = min(max(needed_repetitions(row, targets) - row["completed"], 1), step)
+        state.points[name]["repetitions"] = int(min(row["requested"] + extra, max_repetitions))
+        added[name] = state.points[name]["repetitions"] - int(row["requested"])
+    return added
+
+
+def midpoint(grid, low, high):
+    # Punto medio con el tipo de la grilla: con valores enteros (como -n, que el simulador lee como Int) se redondea,
+    # y si no queda lugar entre los vecinos no hay punto nuevo
+    if all(isinstance(value, int) for value in grid):
+        value = int((low + high) // 2)
+        return value if low < value < high else None
+    return (low + high) / 2
+
+
+def names_value(template, parameter, value):
+    # El nombre tiene que identificar al punto: el parámetro formateado como en la plantilla vuelve a dar su valor
+    fields = {field: spec for _, field, spec, _ in string.Formatter().parse(template) if field is not None}
+    key = parameter.lstrip('-')
+    if key not in fields:
+        return False
+    try:
+        return float(format(value, fields[key])) == value
+    except ValueError:
+        return False
+
+
+def plan_refinement(sweep, state, summary, metric, fraction, min_spacing, min_repetitions, max_points):
+    # Un punto nuevo en el medio de cada par de vecinos donde la respuesta cambia rápido: el salto de la media supera
+    # una fracción del rango de todo el barrido y también a la incertidumbre de ambos puntos
+    measured = summary[summary["completed"] >= 2].sort_values("value")
+    means = measured[f"{metric}_mean"].to_numpy()
+    if len(measured) < 2 or not np.isfinite(means).all():
+        return []
+    spread = means.max() - means.min()
+    added = []
+    for (_, low), (_, high) in zip(measured.iterrows(), measured.iloc[1:].iterrows()):
+        if len(state.points) >= max_points:
+            break
+        jump = abs(high[f"{metric}_mean"] - low[f"{metric}_mean"])
+        uncertainty = (low[f"{metric}_width"] + high[f"{metric}_width"]) / 2
+        if jump <= fraction * spread or jump <= uncertainty or high["value"] - low["value"] < 2 * min_spacing:
+            continue
+        value = midpoint(sweep["grid"][state.parameter], low["value"], high["value"])
+        if value is None:
+            continue
+        args = {**state.points[low.name]["args"], state.parameter: value}
+        name = sweep["name_template"].format(**{option.lstrip('-'): value for option, value in args.items()})
+        if not names_value(sweep["name_template"], state.parameter, value):
+            print(f"No se agrega el punto {state.parameter} = {value}: la plantilla {sweep['name_template']} lo "
+                  f"nombra {name}, que no coincide con su valor; usá una plantilla con más decimales")
+            continue
+        state.points[name] = {"args": args, "value": value, "repetitions": min_repetitions}
+        added.append(name)
+    return added
+
+
+def pending_jobs(sweep, state, manifest):
+    return [job for name, point in state.points.items() for job in point_jobs(sweep, state, name)
+            if job["repetition"] not in point.get("failed", []) and not run_is_complete(job, manifest)]
+
+
+def simulation_hours(manifest, jobs):
+    return sum(manifest.entries.get(job["output"], {}).get("wall_time", 0.0) for job in jobs) / 3600
+
+
+def run_planner(sweep, targets, state_path, refine_metric=None, min_repetitions=3, max_repetitions=10, step=2,
+                refine_fraction=0.25, min_spacing=0.0, max_points=50, max_rounds=10, jar=DEFAULT_JAR,
+                manifest_path=DEFAULT_MANIFEST, workers=None, analysis_workers=None, memory_per_job="2g",
+                cores_per_job=4, retries=0, dry_run=False):
+    manifest = Manifest(manifest_path)
+    state = PlanState.load(state_path) if os.path.exists(state_path) else \
+        initial_state(state_path, sweep, manifest, min_repetitions)
+    refine_metric = refine_metric or next(iter(targets))
+    full_sweep = len(expand_variations(sweep)) * max_repetitions
+    for _ in range(max_rounds):
+        failed = record_failures(sweep, state, manifest)
+        for name, repetitions in failed.items():
+            print(f"{name}: las repeticiones {repetitions} fallaron y no se vuelven a correr")
+        summary = summarize(state, measure(sweep, state, manifest, analysis_workers), targets)
+        print(summary.to_string(float_format=lambda value: f"{value:.4g}"))
+        added_repetitions = plan_repetitions(state, summary, targets, max_repetitions, step)
+        added_points = plan_refinement(sweep, state, summary, refine_metric, refine_fraction, min_spacing,
+                                       min_repetitions, max_points)
+        jobs = pending_jobs(sweep, state, manifest)
+        state.rounds.append({"round": len(state.rounds) + 1, "planned_at": time.time(),
+                             "converged": summary.index[summary["converged"]].tolist(),
+                             "added_repetitions": added_repetitions, "added_points": added_points, "failed": failed,
+                             "jobs": [job["output"] for job in jobs]})
+        if not dry_run:
+            # Con --dry-run no se guarda nada, así los puntos planificados no aparecen como parte del barrido
+            state.save()
+            with open(definition_file(state_path), "w") as file:
+                json.dump(state.sweep_definition(sweep), file, indent=2)
+        requested = sum(point["repetitions"] for point in state.points.values())
+        print(f"Ronda {len(state.rounds)}: {len(added_points)} puntos nuevos, {sum(added_repetitions.values())} "
+              f"repeticiones nuevas, {len(jobs)} corridas pendientes; {requested} corridas pedidas contra "
+              f"{full_sweep} de la grilla completa con {max_repetitions} repeticiones")
+        if not jobs:
+            print("Todos los puntos convergieron o alcanzaron el máximo de repeticiones")
+            break
+        if dry_run:
+            for job in jobs:
+                print(job["output"], job["args"])
+            break
+        run_jobs(jobs, jar, workers, manifest_path, resume=True, retries=retries, memory_per_job=memory_per_job,
+                 cores_per_job=cores_per_job)
+        manifest = Manifest(manifest_path)
+    all_jobs = [job for name in state.points for job in point_jobs(sweep, state, name)]
+    print(f"Horas de simulación registradas en el manifiesto: {simulation_hours(manifest, all_jobs):.1f}")
+    return state
+
+
+def definition_file(state_path):
+    # El barrido equivalente queda al lado del estado: adaptive_<barrido>.json junto a adaptive_<barrido>.state.json
+    if state_path.endswith(".state.json"):
+        return state_path[:-len(".state.json")] + ".json"
+    return os.path.splitext(state_path)[0] + "_sweep.json"
+
+
+def state_file(sweep):
+    return os.path.join(PLANS_FOLDER, f"adaptive_{sweep['name']}.state.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Planifica un barrido de a rondas: agrega repeticiones hasta que el "
+                                                 "intervalo de confianza alcanza el ancho pedido y refina la grilla "
+                                                 "donde la respuesta cambia rápido")
+    parser.add_argument("sweep", help="Archivo .json de barrido o nombre de la carpeta sweeps")
+    parser.add_argument("--target", type=parse_target, action="append", required=True,
+                        help="Ancho del intervalo de confianza del 95 %%, por ejemplo stabilization_time=0.02 o "
+                             "final_energy=10%%")
+    parser.add_argument("--refine-metric", choices=METRICS, default=None,
+                        help="Métrica con la que se refina la grilla (por defecto la del primer objetivo)")
+    parser.add_argument("--refine-fraction", type=float, default=0.25,
+                        help="Fracción del rango de la métrica a partir de la cual se agrega un punto intermedio")
+    parser.add_argument("--min-spacing", type=float, default=0.0, help="Separación mínima entre puntos de la grilla")
+    parser.add_argument("--max-points", type=int, default=50)
+    parser.add_argument("--min-repetitions", type=int, default=3)
+    parser.add_argument("--max-repetitions", type=int, default=10)
+    parser.add_argument("--step", type=int, default=2, help="Repeticiones nuevas por punto y por ronda, como máximo")
+    parser.add_argument("--max-rounds", type=int, default=10)
+    parser.add_argument("--state", default=None, help="Archivo de estado (por defecto out/sweeps/adaptive_<barrido>)")
+    parser.add_argument("--jar", default=DEFAULT_JAR)
+    parser.add_argument("--workers", type=int, default=None, help="Simulaciones simultáneas")
+    parser.add_argument("--analysis-workers", type=int, default=None, help="Procesos para medir las corridas")
+    parser.add_argument("--cores-per-job", type=int, default=4)
+    parser.add_argument("--memory-per-job", default="2g")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="Sólo planifica la próxima ronda y lista sus corridas")
+    args = parser.parse_args()
+
+    sweep = load_sweep(args.sweep)
+    if args.min_repetitions < 2:
+        parser.error("Hacen falta al menos 2 repeticiones para estimar un intervalo de confianza")
+    run_planner(sweep, dict(args.target), args.state or state_file(sweep), args.refine_metric, args.min_repetitions,
+                args.max_repetitions, args.step, args.refine_fraction, args.min_spacing, args.max_points,
+                args.max_rounds, args.jar, args.manifest, args.workers,
+                default_workers() if args.analysis_workers is None else args.analysis_workers, args.memory_per_job,
+                args.cores_per_job, args.retries, args.dry_run)
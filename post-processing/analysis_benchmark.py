@@ -0,0 +1,214 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from dem import CannonballFileGenerator, ParticleState
+from dem.system import DEFAULTS
+from dem_benchmark import BENCHMARKS_FOLDER
+from instrumentation import PeakMemory
+from kinetic_energy_avg import get_kinetic_energy_avg, get_kinetic_energy_avg_streaming, plot_kinetic_energy_avg
+from parallel import parallel_map
+from read_xyz import combine_repetitions, read_xyz, repetition_filenames, snap_to_time_grid
+from rendering import configure_batch
+from xyz_format import xyz_path
+
+SYNTHETIC_FOLDER = os.path.join(BENCHMARKS_FOLDER, "runs")
+BASELINE_FILE = os.path.join(BENCHMARKS_FOLDER, "analysis_baseline.json")
+
+
+def synthetic_run(folder, filename, particles, frames, seed=0):
+    # Corrida con el mismo formato que escribe CannonballFileGenerator: la cama en una grilla con algo de desorden,
+    # velocidades que decaen como durante el asentamiento y la bala (id 0) cayendo, escrita al final de cada frame.
+    # El tiempo se acumula sumando dt2 como timeToSave, así que arrastra la misma deriva que una corrida real.
+    rng = np.random.default_rng(seed)
+    p = DEFAULTS
+    bed = particles - 1
+    spacing = p["-pud"]
+    side = max(int(p["-bw"] / spacing), 1)
+    cells = np.arange(bed)
+    positions = np.column_stack([cells % side, (cells // side) % side, cells // (side * side)]) * spacing + \
+        spacing / 2 + rng.uniform(-0.1, 0.1, size=(bed, 3)) * spacing
+    radius = rng.uniform(p["-pld"], p["-pud"], size=bed) / 2
+    ball_height = positions[:, 2].max() + p["-ballHeight"] if bed else p["-ballHeight"]
+    ids = np.concatenate([np.arange(1, particles), [0]])
+    positions = np.vstack([positions, [[p["-bw"] / 2, p["-bw"] / 2, ball_height]]])
+    radius = np.concatenate([radius, [p["-ballDiameter"] / 2]])
+    mass = np.concatenate([np.full(bed, p["-pMass"]), [p["-ballMass"]]])
+    state = ParticleState(ids, positions, np.zeros((particles, 3)), radius, mass, p["-pKn"], p["-pKt"], p["-pGamma"])
+
+    generator = CannonballFileGenerator(folder, filename)
+    save_interval = p["-dt2"]
+    current_time = 0.0
+    for _ in range(frames):
+        velocities = rng.normal(scale=0.1 * np.exp(-current_time / 0.05), size=(particles, 3))
+        velocities[-1] = [0.0, 0.0, -p["-ballVelocity"] * np.exp(-current_time / 0.02)]
+        state = state.moved(state.positions + velocities * save_interval, velocities, state.previous_acceleration)
+        state.pressure = rng.exponential(1E3, size=particles)
+        generator.add_to_file(state, current_time)
+        current_time += save_interval
+    generator.close_file()
+
+
+def generate_synthetic_run(job):
+    synthetic_run(*job)
+
+
+def synthetic_runs(particles, frames, repetitions, seed=0, folder=SYNTHETIC_FOLDER, workers=None):
+    # Las corridas se generan una vez por configuración y se reutilizan entre mediciones
+    variation = f"synthetic_n_{particles}_f_{frames}_s_{seed}"
+    filenames = repetition_filenames(os.path.join(folder, variation), repetitions)
+    missing = [rep for rep, filename in enumerate(filenames) if not os.path.exists(xyz_path(filename))]
+    if missing:
+        print(f"Generando {len(missing)} corridas sintéticas de {particles} partículas y {frames} frames")
+        parallel_map(generate_synthetic_run, [(folder, os.path.basename(filenames[rep]), particles, frames, seed + rep)
+                                              for rep in missing], workers)
+    return os.path.join(folder, variation), filenames
+
+
+@contextmanager
+def measure(stages, name):
+    # Tiempo de reloj y de CPU, filas procesadas y pico de memoria de una etapa; la etapa completa stage["rows"]
+    gc.collect()
+    stage = {"stage": name, "rows": 0}
+    with PeakMemory() as memory:
+        start, cpu_start = time.perf_counter(), time.process_time()
+        yield stage
+        stage["seconds"] = time.perf_counter() - start
+        stage["cpu_seconds"] = time.process_time() - cpu_start
+    stage["rows_per_second"] = stage["rows"] / stage["seconds"] if stage["seconds"] > 0 else float('inf')
+    stage["peak_rss_mb"] = memory.peak / 1E6
+    stage["rss_growth_mb"] = (memory.peak - memory.start) / 1E6
+    stages.append(stage)
+
+
+def run_pipeline(variation, filenames, time_interval, workers, plot_folder):
+    # Las mismas etapas que recorre el análisis de energía cinética con read_xyz_repetitions, medidas por separado,
+    # seguidas de get_kinetic_energy_avg completo, la versión por streaming y el gráfico
+    stages = []
+    with measure(stages, "parse") as stage:
+        repetitions = parallel_map(partial(read_xyz, use_cache=False), filenames, workers)
+        stage["rows"] = sum(len(data) for data, _ in repetitions)
+    with measure(stages, "concat") as stage:
+        data, _ = combine_repetitions(repetitions)
+        stage["rows"] = len(data)
+    del repetitions
+    with measure(stages, "filter") as stage:
+        stage["rows"] = len(data)
+        snapped = snap_to_time_grid(data, time_interval)
+    with measure(stages, "groupby") as stage:
+        stage["rows"] = len(snapped)
+        snapped['kinetic_energy'] = 0.5 * snapped['mass'] * (snapped['xVelocity'] ** 2 + snapped['yVelocity'] ** 2 +
+                                                             snapped['zVelocity'] ** 2)
+        grouped = snapped.groupby(['time', 'repetition'])['kinetic_energy'].sum().reset_index()
+    del snapped
+    with measure(stages, "aggregate") as stage:
+        stage["rows"] = len(grouped)
+        staged_stats = grouped.groupby('time')['kinetic_energy'].agg(['mean', 'std'])
+    with measure(stages, "kinetic_energy_avg") as stage:
+        stage["rows"] = len(data)
+        stats = get_kinetic_energy_avg(data, time_interval)
+    del data
+    with measure(stages, "streaming") as stage:
+        streaming_stats = get_kinetic_energy_avg_streaming(variation, len(filenames), time_interval, workers)
+        stage["rows"] = stages[0]["rows"]
+    with measure(stages, "plot") as stage:
+        configure_batch(plot_folder)
+        plot_kinetic_energy_avg(stats, "Energía cinética sintética")
+        stage["rows"] = len(stats)
+    # Las tres formas de calcular la energía cinética tienen que dar lo mismo, si no la medición no sirve
+    pd.testing.assert_frame_equal(stats, staged_stats)
+    pd.testing.assert_frame_equal(stats, streaming_stats, check_names=False)
+    return stages
+
+
+def best_of(runs):
+    # Por etapa, el menor tiempo y el menor pico de memoria entre repeticiones de la medición
+    best = []
+    for stages in zip(*runs):
+        stage = dict(min(stages, key=lambda stage: stage["seconds"]))
+        stage["peak_rss_mb"] = min(stage["peak_rss_mb"] for stage in stages)
+        stage["rss_growth_mb"] = min(stage["rss_growth_mb"] for stage in stages)
+        best.append(stage)
+    return best
+
+
+def compare(results, baseline, tolerance):
+    # Regresión: menos filas por segundo o más pico de memoria que la base, más allá de la tolerancia relativa
+    regressions = []
+    if baseline["config"] != results["config"]:
+        print("Aviso: la base se midió con otra configuración, la comparación puede no ser válida")
+    reference = {stage["stage"]: stage for stage in baseline["stages"]}
+    for stage in results["stages"]:
+        base = reference.get(stage["stage"])
+        if base is None:
+            continue
+        if stage["rows_per_second"] < base["rows_per_second"] * (1 - tolerance):
+            regressions.append({"stage": stage["stage"], "metric": "rows_per_second",
+                                "baseline": base["rows_per_second"], "value": stage["rows_per_second"]})
+        if stage["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append({"stage": stage["stage"], "metric": "peak_rss_mb",
+                                "baseline": base["peak_rss_mb"], "value": stage["peak_rss_mb"]})
+    return regressions
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide cada etapa del análisis de energía cinética sobre corridas "
+                                                 "sintéticas y lo compara con una medición base")
+    parser.add_argument("--particles", type=int, default=1000)
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--time-interval", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Mediciones por etapa; se queda con la mejor")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para leer las repeticiones; con más de uno la memoria de los hijos no se mide")
+    parser.add_argument("--folder", default=SYNTHETIC_FOLDER, help="Carpeta de las corridas sintéticas")
+    parser.add_argument("--output", default=None, help="Archivo .json con los resultados")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Medición base contra la que se compara")
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda esta medición como la nueva base")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Variación relativa permitida en filas por segundo y en pico de memoria")
+    args = parser.parse_args()
+
+    variation, filenames = synthetic_runs(args.particles, args.frames, args.repetitions, args.seed, args.folder)
+    with tempfile.TemporaryDirectory() as plot_folder:
+        runs = [run_pipeline(variation, filenames, args.time_interval, args.workers, plot_folder)
+                for _ in range(args.repeat)]
+    config = {"particles": args.particles, "frames": args.frames, "repetitions": args.repetitions,
+              "time_interval": args.time_interval, "seed": args.seed, "workers": args.workers}
+    results = {"config": config, "environment": environment(), "created_at": time.time(), "stages": best_of(runs)}
+    for stage in results["stages"]:
+        print(f"{stage['stage']:20s} {stage['seconds']:8.3f} s  {stage['rows_per_second']:14,.0f} filas/s  "
+              f"pico {stage['peak_rss_mb']:8.1f} MB  (+{stage['rss_growth_mb']:.1f} MB)")
+
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            results["regressions"] = compare(results, json.load(file), args.tolerance)
+        for regression in results["regressions"]:
+            print(f"REGRESIÓN en {regression['stage']}: {regression['metric']} {regression['baseline']:,.1f} -> "
+                  f"{regression['value']:,.1f}")
+    output = args.output or os.path.join(BENCHMARKS_FOLDER, f"analysis_n_{args.particles}_f_{args.frames}_r_"
+                                                            f"{args.repetitions}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Base guardada en {args.baseline}")
+    sys.exit(1 if results.get("regressions") else 0)
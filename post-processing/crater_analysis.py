@@ -0,0 +1,145 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from dem.cells import cell_pairs
+from instrumentation import traced
+from parallel import default_workers
+from read_xyz import iter_xyz_frames
+from rendering import add_batch_arguments, configure_from_args, finish_figure, render_figures
+from stabilization_grid import ANALYSIS_FOLDER
+from sweep import expand_variations, load_sweep
+from variation_analysis import memoized_map, variation_runs, variation_text
+
+CRATER_COLUMNS = ["id", "xPosition", "yPosition", "zPosition", "radius"]
+METRICS = {
+    "surface_height": ("Altura de la superficie [m]", "Altura media de la superficie"),
+    "crater_depth": ("Profundidad [m]", "Profundidad del cráter"),
+    "crater_radius": ("Radio [m]", "Radio del cráter"),
+    "penetration": ("Penetración [m]", "Penetración de la bala"),
+    "ball_contacts": ("Contactos", "Contactos de la bala"),
+    "coordination": ("Contactos por partícula", "Número de coordinación de la cama"),
+}
+
+
+class HeightMap:
+    # Grilla de columnas sobre el piso de la caja; cada columna guarda la altura del tope de la partícula más alta.
+    # La grilla se fija con el primer frame y las partículas que salen de la caja no cuentan.
+    def __init__(self, positions, radius, column_size):
+        self.column_size = column_size
+        self.origin = (positions[:, :2] - radius[:, None]).min(axis=0)
+        self.shape = np.maximum(np.ceil(((positions[:, :2] + radius[:, None]).max(axis=0) - self.origin)
+                                        / column_size).astype(int), 1)
+
+    def heights(self, positions, radius):
+        columns = np.floor((positions[:, :2] - self.origin) / self.column_size).astype(int)
+        inside = np.all((columns >= 0) & (columns < self.shape), axis=1)
+        heights = np.zeros(self.shape[0] * self.shape[1])
+        tops = (positions[:, 2] + radius)[inside]
+        np.maximum.at(heights, columns[inside, 0] * self.shape[1] + columns[inside, 1], tops)
+        return heights
+
+
+def coordination_number(positions, radius):
+    # Contactos por partícula de la cama, con los pares candidatos de la grilla de celdas (O(N log N) por el orden)
+    if len(positions) < 2:
+        return 0.0
+    i, j = cell_pairs(positions, 2 * radius.max())
+    touching = np.linalg.norm(positions[j] - positions[i], axis=1) < radius[i] + radius[j]
+    return 2 * np.count_nonzero(touching) / len(positions)
+
+
+@traced("crater_metrics", rows=lambda result, *args, **kwargs: len(result))
+def crater_metrics(filename, time_interval=None):
+    # Recorre la corrida de a un frame y devuelve una fila de métricas por frame. La superficie de referencia es la
+    # del primer frame, antes del impacto; la bala (id 0) no cuenta para la superficie.
+    rows = []
+    height_map = reference = None
+    for time, block in iter_xyz_frames(filename, columns=CRATER_COLUMNS, time_interval=time_interval):
+        ball = block[:, 0] == 0
+        bed = block[~ball]
+        positions, radius = bed[:, 1:4], bed[:, 4]
+        if height_map is None:
+            height_map = HeightMap(positions, radius, 2 * radius.max())
+            reference = height_map.heights(positions, radius)
+            reference_surface = reference.mean()
+            depression_threshold = radius.mean()
+            column_area = height_map.column_size ** 2
+        heights = height_map.heights(positions, radius)
+        depression = reference - heights
+        row = {
+            "time": time,
+            "surface_height": heights.mean(),
+            "crater_depth": max(depression.max(), 0.0),
+            # Radio del círculo con la misma área que las columnas que bajaron más de medio diámetro medio
+            "crater_radius": np.sqrt(np.count_nonzero(depression > depression_threshold) * column_area / np.pi),
+            "penetration": np.nan,
+            "ball_contacts": np.nan,
+            "coordination": coordination_number(positions, radius),
+        }
+        if ball.any():
+            ball_position, ball_radius = block[ball][0, 1:4], block[ball][0, 4]
+            row["penetration"] = reference_surface - (ball_position[2] - ball_radius)
+            distance = np.linalg.norm(positions - ball_position, axis=1)
+            row["ball_contacts"] = np.count_nonzero(distance < ball_radius + radius)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["time", *METRICS])
+
+
+def crater_stats(repetitions):
+    # Media y desvío de cada métrica por tiempo, hasta el menor tiempo final entre repeticiones
+    data = pd.concat([metrics.assign(repetition=rep) for rep, metrics in enumerate(repetitions)], ignore_index=True)
+    data = data[data['time'] <= min(metrics['time'].max() for metrics in repetitions)]
+    return data.groupby('time')[list(METRICS)].agg(['mean', 'std'])
+
+
+def analyze_sweep(sweep, time_interval=0.01, workers=None):
+    runs = variation_runs(sweep)
+    filenames = [filename for variation_files in runs.values() for filename in variation_files]
+    print(f"Analizando el cráter en {len(filenames)} corridas de {sweep['name']}")
+    metrics = dict(zip(filenames, memoized_map(crater_metrics, filenames, {"time_interval": time_interval}, workers)))
+    return {name: crater_stats([metrics[filename] for filename in variation_files])
+            for name, variation_files in runs.items() if variation_files}
+
+
+def plot_crater_metric(stats_by_label, metric, filename):
+    y_label, title = METRICS[metric]
+    fig, ax = plt.subplots()
+    for label, stats in stats_by_label.items():
+        ax.plot(stats.index, stats[(metric, 'mean')], label=label)
+        ax.fill_between(stats.index, stats[(metric, 'mean')] - stats[(metric, 'std')],
+                        stats[(metric, 'mean')] + stats[(metric, 'std')], alpha=0.2)
+    ax.set_xlabel('Tiempo [s]', fontsize=16)
+    ax.set_ylabel(y_label, fontsize=16)
+    ax.set_title(title, fontsize=20)
+    ax.legend()
+    plt.tight_layout()
+    finish_figure(fig, title, filename)
+
+
+def plot_sweep(sweep, results, workers=None):
+    label_template = sweep.get("analysis", {}).get("label", "{name}")
+    stats_by_label = {variation_text(label_template, variation): results[variation["name"]]
+                      for variation in expand_variations(sweep) if variation["name"] in results}
+    render_figures([(plot_crater_metric, (stats_by_label, metric, f"crater_{metric}_{sweep['name']}"))
+                    for metric in METRICS], workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el cráter y la estructura de la cama en cada frame")
+    parser.add_argument("sweeps", nargs="+", help="Archivos .json de barrido o nombres de la carpeta sweeps")
+    parser.add_argument("--time-interval", type=float, default=0.01)
+    parser.add_argument("--output", default=ANALYSIS_FOLDER, help="Carpeta donde se guardan las tablas .csv")
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    workers = default_workers() if args.workers is None else args.workers
+    os.makedirs(args.output, exist_ok=True)
+    for name in args.sweeps:
+        sweep = load_sweep(name)
+        results = analyze_sweep(sweep, args.time_interval, workers)
+        pd.concat(results, names=["variation"]).to_csv(os.path.join(args.output, f"crater_{sweep['name']}.csv"))
+        plot_sweep(sweep, results, workers)
@@ -0,0 +1,9 @@
+from .cells import NeighborList, cell_pairs
+from .cut_condition import KineticEnergyAndTimeCutCondition, TimeCutCondition
+from .file_generator import CannonballFileGenerator
+from .forces import CannonballForcesCalculator, Wall, box_walls
+from .generator import generate_particles
+from .integrator import BeemanIntegrator
+from .simulator import TimeStepSimulator
+from .state import ParticleState
+from .system import DEFAULTS, CannonballSystem, contact_constants, parse_args
@@ -0,0 +1,90 @@
+import numpy as np
+
+# Desplazamientos a las celdas vecinas que alcanzan para ver cada par una sola vez: la propia celda y la mitad de las
+# 26 que la rodean
+HALF_SHELL = [(0, 0, 0)] + [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                            if (dx, dy, dz) > (0, 0, 0)]
+
+
+def expand_ranges(starts, counts):
+    # Concatena range(start, start + count) para cada par, sin un bucle de Python
+    total = int(counts.sum())
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(total) - offsets
+
+
+def cell_pairs(positions, cell_size):
+    # Pares (i, j), con cada par una sola vez, de partículas en la misma celda o en celdas vecinas de una grilla
+    # uniforme de lado cell_size. Las celdas se numeran linealmente y se ordenan las partículas por celda, así que los
+    # ocupantes de cada celda quedan contiguos y se ubican con searchsorted.
+    cells = np.floor(positions / cell_size).astype(np.int64)
+    # Un margen de una celda en cada borde evita que los vecinos se salgan de la numeración
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    first, second = [], []
+    for dx, dy, dz in HALF_SHELL:
+        neighbor_keys = keys + (dx * dims[1] + dy) * dims[2] + dz
+        starts = np.searchsorted(sorted_keys, neighbor_keys, side='left')
+        counts = np.searchsorted(sorted_keys, neighbor_keys, side='right') - starts
+        i = np.repeat(np.arange(len(keys)), counts)
+        j = order[expand_ranges(starts, counts)]
+        if (dx, dy, dz) == (0, 0, 0):
+            # En la misma celda cada par aparece dos veces (y cada partícula consigo misma)
+            keep = i < j
+            i, j = i[keep], j[keep]
+        first.append(i)
+        second.append(j)
+    return np.concatenate(first), np.concatenate(second)
+
+
+class NeighborList:
+    # Lista de Verlet armada con la grilla de celdas: guarda los pares a menos de r_i + r_j + skin y la reutiliza
+    # mientras el desplazamiento acumulado no alcance para que entre en contacto un par que no está en la lista
+    def __init__(self, radius, skin):
+        self.radius = radius
+        self.skin = skin
+        self.reference = None
+        self.current_skin = skin
+        self.first = self.second = None
+        self.builds = 0
+
+    def build(self, positions, extra=0.0):
+        self.current_skin = max(self.skin, 2 * extra)
+        # La celda tiene el tamaño del mayor diámetro más el margen, así que todo par candidato está en celdas vecinas
+        cell_size = 2 * self.radius.max() + self.current_skin
+        i, j = cell_pairs(positions, cell_size)
+        distance = np.linalg.norm(positions[j] - positions[i], axis=1)
+        keep = distance < self.radius[i] + self.radius[j] + self.current_skin
+        i, j = i[keep], j[keep]
+        # Cada contacto se evalúa desde las dos partículas, con las constantes de cada una. Ordenados por partícula,
+        # las fuerzas se suman siempre en el mismo orden aunque la lista se rearme.
+        first, second = np.concatenate([i, j]), np.concatenate([j, i])
+        order = np.lexsort((second, first))
+        self.first, self.second = first[order], second[order]
+        self.reference = positions.copy()
+        self.builds += 1
+
+    def displacement(self, positions):
+        return np.sqrt(np.max(np.einsum('ij,ij->i', positions - self.reference, positions - self.reference),
+                              initial=0.0))
+
+    def ensure(self, positions, query=None):
+        # Deja la lista válida para evaluar fuerzas de las partículas en query (o positions) contra las demás en
+        # positions: ningún par fuera de la lista puede acercarse más que skin entre ambos desplazamientos
+        if self.reference is None or len(self.reference) != len(positions):
+            self.build(positions, 0.0 if query is None else self.step_length(positions, query))
+            return
+        moved = self.displacement(positions)
+        reach = moved if query is None else self.displacement(query)
+        if moved + reach >= self.current_skin:
+            self.build(positions, 0.0 if query is None else self.step_length(positions, query))
+
+    @staticmethod
+    def step_length(positions, query):
+        return np.sqrt(np.max(np.einsum('ij,ij->i', query - positions, query - positions), initial=0.0))
+
+    def pairs(self):
+        return self.first, self.second
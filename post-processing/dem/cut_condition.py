@@ -0,0 +1,42 @@
+from collections import deque
+
+import numpy as np
+
+
+class TimeCutCondition:
+    def __init__(self, time_to_cut):
+        self.time_to_cut = time_to_cut
+
+    def is_finished(self, state, time):
+        return time >= self.time_to_cut
+
+
+class KineticEnergyAndTimeCutCondition(TimeCutCondition):
+    # Misma lógica que KineticEnergyAndTimeCutCondition.kt, incluida la ventana que no avanza en los pasos en los que
+    # la variación ya es chica pero todavía no se llegó a minimum_time
+    def __init__(self, energy_threshold, time_to_cut, minimum_time, average_size, bounds_limit):
+        super().__init__(time_to_cut)
+        self.energy_threshold = energy_threshold
+        self.minimum_time = minimum_time
+        self.average_size = average_size
+        self.bounds_limit = bounds_limit
+        self.last_kinetic_energies = deque()
+
+    def is_finished(self, state, time):
+        if super().is_finished(state, time):
+            return True
+        if self.out_of_bounds(state):
+            return True
+        kinetic_energy = state.kinetic_energy()
+        if len(self.last_kinetic_energies) < self.average_size:
+            self.last_kinetic_energies.append(kinetic_energy)
+        else:
+            average = sum(self.last_kinetic_energies) / self.average_size
+            if abs(average - kinetic_energy) < self.energy_threshold:
+                return time > self.minimum_time
+            self.last_kinetic_energies.popleft()
+            self.last_kinetic_energies.append(kinetic_energy)
+        return time > self.minimum_time and kinetic_energy <= self.energy_threshold
+
+    def out_of_bounds(self, state):
+        return bool(np.any(np.abs(state.positions[:, :2]) > self.bounds_limit))
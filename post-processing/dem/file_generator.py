@@ -0,0 +1,27 @@
+import os
+
+from xyz_format import HEADERS
+
+ROW_FORMAT = "%d" + " %r" * (len(HEADERS) - 1) + "\n"
+
+
+class CannonballFileGenerator:
+    # Escribe el mismo .xyz que CannonballFileGenerator.kt: cantidad de partículas, encabezado y una fila por partícula
+    def __init__(self, folder, filename):
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{filename}.xyz")
+        if os.path.exists(path):
+            os.replace(path, os.path.join(folder, f"{filename}.old.xyz"))
+        self.file = open(path, "w")
+
+    def add_to_file(self, state, time):
+        block = state.frame(time)
+        rows = [block[:, 0].astype(int).tolist()] + [block[:, k].tolist() for k in range(1, len(HEADERS))]
+        # Un único formateo por frame; %r da la representación más corta que vuelve al mismo double
+        values = [value for row in zip(*rows) for value in row]
+        self.file.write(f"{len(state)}\n{' '.join(HEADERS)}\n")
+        self.file.write((ROW_FORMAT * len(state)) % tuple(values))
+        self.file.flush()
+
+    def close_file(self):
+        self.file.close()
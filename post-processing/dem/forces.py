@@ -0,0 +1,103 @@
+import numpy as np
+
+
+class Wall:
+    def __init__(self, position, normal, kn, kt, gamma, wall_id):
+        self.position = np.asarray(position, dtype=np.float64)
+        self.normal = np.asarray(normal, dtype=np.float64)
+        self.kn = kn
+        self.kt = kt
+        self.gamma = gamma
+        self.id = wall_id
+
+    def overlaps_with(self, positions, radius):
+        return (positions - self.position) @ self.normal < radius
+
+    def __repr__(self):
+        return f"Wall(id='{self.id}')"
+
+
+def box_walls(box_width, kn, kt, gamma):
+    # Las mismas cinco paredes que CannonballSystem.createBoxWalls; la caja no tiene tapa
+    return [
+        Wall((0.0, 0.0, 0.0), (1.0, 0.0, 0.0), kn, kt, gamma, "FRONT"),
+        Wall((box_width, 0.0, 0.0), (-1.0, 0.0, 0.0), kn, kt, gamma, "BACK"),
+        Wall((0.0, 0.0, 0.0), (0.0, 1.0, 0.0), kn, kt, gamma, "LEFT"),
+        Wall((0.0, box_width, 0.0), (0.0, -1.0, 0.0), kn, kt, gamma, "RIGHT"),
+        Wall((0.0, 0.0, 0.0), (0.0, 0.0, 1.0), kn, kt, gamma, "BOTTOM"),
+    ]
+
+
+def normalize(vectors):
+    # Como Vector.normalize: el vector nulo queda nulo
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def accumulate(indices, values, size):
+    # Suma por partícula de las fuerzas de sus contactos (np.add.at es mucho más lento que bincount)
+    return np.stack([np.bincount(indices, weights=values[:, k], minlength=size) for k in range(3)], axis=1)
+
+
+class CannonballForcesCalculator:
+    # Misma física que CannonballForcesCalculator.kt, para todas las partículas a la vez
+    def __init__(self, gravity, walls):
+        self.gravity = gravity
+        self.walls = walls
+        self.wall_positions = np.array([wall.position for wall in walls]).reshape(-1, 3)
+        self.wall_normals = np.array([wall.normal for wall in walls]).reshape(-1, 3)
+        self.wall_kn = np.array([wall.kn for wall in walls])
+        self.wall_kt = np.array([wall.kt for wall in walls])
+        self.wall_gamma = np.array([wall.gamma for wall in walls])
+
+    def interaction_forces(self, state, positions, velocities, pairs):
+        # Fuerza sobre cada partícula i (en positions/velocities) de sus vecinas j (en el estado actual), con las
+        # constantes de i. Las dos listas de pares ya traen cada contacto en ambos sentidos.
+        i, j = pairs
+        relative_position = state.positions[j] - positions[i]
+        distance = np.linalg.norm(relative_position, axis=1)
+        overlap = state.radius[i] + state.radius[j] - distance
+        touching = overlap > 0.0
+        i, j, relative_position, distance, overlap = \
+            i[touching], j[touching], relative_position[touching], distance[touching], overlap[touching]
+
+        normal = normalize(relative_position)
+        relative_velocity = velocities[i] - state.velocities[j]
+        normal_velocity = np.einsum('ij,ij->i', relative_velocity, normal)
+        tangential_velocity = relative_velocity - normal * normal_velocity[:, None]
+
+        normal_magnitude = -state.kn[i] * overlap - state.gamma[i] * normal_velocity
+        tangential_magnitude = -state.kt[i] * overlap
+        force = normal * normal_magnitude[:, None] + normalize(tangential_velocity) * tangential_magnitude[:, None]
+        return accumulate(i, force, len(state))
+
+    def wall_forces(self, state, positions, velocities):
+        distance = np.einsum('pwk,wk->pw', positions[:, None, :] - self.wall_positions[None, :, :], self.wall_normals)
+        overlap = state.radius[:, None] - distance
+        particle, wall = np.nonzero(overlap > 0.0)
+        if not len(particle):
+            return np.zeros_like(positions)
+        overlap = overlap[particle, wall]
+        normal = self.wall_normals[wall]
+        normal_velocity = np.einsum('ij,ij->i', velocities[particle], normal)
+        tangential_velocity = velocities[particle] - normal * normal_velocity[:, None]
+
+        normal_magnitude = -self.wall_kn[wall] * overlap - self.wall_gamma[wall] * normal_velocity
+        tangential_magnitude = -self.wall_kt[wall] * overlap
+        force = -normal * normal_magnitude[:, None] + normalize(tangential_velocity) * tangential_magnitude[:, None]
+        return accumulate(particle, force, len(state))
+
+    def get_forces(self, state, pairs, positions=None, velocities=None):
+        # Por defecto evalúa el estado actual; con positions/velocities evalúa esas partículas (por ejemplo las
+        # predichas por Beeman) contra las demás en su estado actual, igual que el simulador de Kotlin
+        positions = state.positions if positions is None else positions
+        velocities = state.velocities if velocities is None else velocities
+        forces = self.interaction_forces(state, positions, velocities, pairs) + \
+            self.wall_forces(state, positions, velocities)
+        forces[:, 2] -= state.mass * self.gravity
+        return forces
+
+
+def pressures(state, forces):
+    # Particle.setPressure: módulo de la fuerza total sobre la superficie de la partícula
+    return np.linalg.norm(forces, axis=1) / state.surface_area()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from .state import ParticleState
+
+
+def generate_particles(number_of_particles, box_width, min_diameter, max_diameter, low_mass, kn, kt, gamma, walls,
+                       rng=None):
+    # CannonballParticleGenerator.kt: posiciones al azar en una capa a la altura z; después de 100 intentos fallidos
+    # seguidos la capa sube un radio. La masa es proporcional al diámetro, con low_mass para el diámetro mínimo.
+    rng = np.random.default_rng() if rng is None else rng
+    positions = np.empty((number_of_particles, 3))
+    radius = np.empty(number_of_particles)
+    layers = np.empty(number_of_particles)
+    count = 0
+    # La capa sólo sube, así que las partículas de capas a más de un diámetro máximo por debajo ya no pueden solaparse
+    # con las nuevas y se dejan de revisar
+    first = 0
+    z_position = 0.0
+    overlap_count = 0
+    while count < number_of_particles:
+        r = rng.uniform(min_diameter, max_diameter) / 2
+        position = np.array([rng.uniform(r, box_width - r), rng.uniform(r, box_width - r), z_position + r])
+        while first < count and z_position - layers[first] >= max_diameter:
+            first += 1
+        distance = np.linalg.norm(positions[first:count] - position, axis=1)
+        overlaps = np.any(distance < radius[first:count] + r) or \
+            any(wall.overlaps_with(position, r) for wall in walls)
+        if not overlaps:
+            positions[count] = position
+            radius[count] = r
+            layers[count] = z_position
+            count += 1
+            overlap_count = 0
+        else:
+            overlap_count += 1
+            if overlap_count > 100:
+                z_position += r
+                overlap_count = 0
+    mass = 2 * radius * low_mass / min_diameter
+    return ParticleState(np.arange(1, number_of_particles + 1), positions, np.zeros((number_of_particles, 3)), radius,
+                         mass, kn, kt, gamma)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from .cells import NeighborList
+from .forces import pressures
+
+
+class BeemanIntegrator:
+    # BeemanIntegrator.kt aplicado a todas las partículas en un solo paso. Las fuerzas de cada partícula se calculan
+    # contra las demás en su estado actual, también la de la velocidad predicha, como hace la versión en Kotlin.
+    def __init__(self, forces_calculator, time_delta, state, skin=None):
+        self.forces_calculator = forces_calculator
+        self.time_delta = time_delta
+        # Por defecto el margen de la lista de vecinos es un cuarto del mayor diámetro
+        self.neighbors = NeighborList(state.radius, state.radius.max() / 2 if skin is None else skin)
+        self.initialize(state)
+
+    def get_forces(self, state, positions=None, velocities=None):
+        self.neighbors.ensure(state.positions, positions)
+        return self.forces_calculator.get_forces(state, self.neighbors.pairs(), positions, velocities)
+
+    def initialize(self, state):
+        # Aceleración previa estimada sólo para las partículas que se mueven; el resto conserva la que traía
+        dt = self.time_delta
+        moving = np.any(state.velocities != 0.0, axis=1)
+        if not moving.any():
+            return
+        forces = self.get_forces(state)
+        state.pressure[moving] = pressures(state, forces)[moving]
+        previous_positions = state.positions - state.velocities * dt + forces * (dt * dt / (2 * state.mass[:, None]))
+        # Igual que en Kotlin, la velocidad previa resta la fuerza (no la aceleración) por dt
+        previous_velocities = state.velocities - forces * dt
+        # Cada partícula retrocede sola, con las demás en su estado actual: es la misma evaluación que la de la
+        # velocidad predicha
+        previous_forces = self.get_forces(state, previous_positions, previous_velocities)
+        state.previous_acceleration[moving] = previous_forces[moving] / state.mass[moving, None]
+
+    def apply(self, state):
+        # Devuelve el estado siguiente; la presión del estado actual queda actualizada, como hace setPressure
+        dt = self.time_delta
+        mass = state.mass[:, None]
+        forces = self.get_forces(state)
+        state.pressure = pressures(state, forces)
+        current_acceleration = forces / mass
+        previous_acceleration = state.previous_acceleration
+
+        next_positions = state.positions + state.velocities * dt + \
+            current_acceleration * (2.0 / 3.0) * dt ** 2 - previous_acceleration * (1.0 / 3.0) * dt ** 2
+        predicted_velocities = state.velocities + current_acceleration * (3.0 / 2.0) * dt - \
+            previous_acceleration * (1.0 / 2.0) * dt
+        next_acceleration = self.get_forces(state, next_positions, predicted_velocities) / mass
+        next_velocities = state.velocities + next_acceleration * (1.0 / 3.0) * dt + \
+            current_acceleration * (5.0 / 6.0) * dt - previous_acceleration * (1.0 / 6.0) * dt
+        return state.moved(next_positions, next_velocities, current_acceleration)
@@ -0,0 +1,31 @@
+class TimeStepSimulator:
+    # TimeStepSimulator.kt: cada frame guardado es el estado al principio del paso en el que se cruza timeToSave
+    def __init__(self, time_delta, save_time_delta, cut_condition, integrator, file_generator, state, name):
+        self.time_delta = time_delta
+        self.save_time_delta = save_time_delta
+        self.cut_condition = cut_condition
+        self.integrator = integrator
+        self.file_generator = file_generator
+        self.state = state
+        self.name = name
+        self.time = 0.0
+        self.time_to_save = save_time_delta
+        self.steps = 0
+
+    def simulate(self, close_file, should_log=False):
+        self.file_generator.add_to_file(self.state, self.time)
+        while not self.cut_condition.is_finished(self.state, self.time):
+            new_state = self.integrator.apply(self.state)
+            self.time += self.time_delta
+            if self.time >= self.time_to_save:
+                self.file_generator.add_to_file(self.state, self.time_to_save)
+                self.time_to_save += self.save_time_delta
+                if should_log:
+                    print(f"{self.name}: t = {self.time:.4f} s")
+            self.state = new_state
+            self.steps += 1
+        if should_log:
+            print(f"{self.name}: simulación terminada en {self.steps} pasos")
+        if close_file:
+            self.file_generator.close_file()
+        return self.state
@@ -0,0 +1,69 @@
+import numpy as np
+
+from xyz_format import HEADERS
+
+ID, X, Y, Z, VX, VY, VZ, RADIUS, MASS, PRESSURE = range(10)
+
+
+class ParticleState:
+    # Todas las partículas como arreglos paralelos (una fila por partícula), en el mismo orden en que el simulador de
+    # Kotlin recorre su Set: primero la cama por id y al final la bala
+    def __init__(self, ids, positions, velocities, radius, mass, kn, kt, gamma, pressure=None,
+                 previous_acceleration=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.velocities = np.asarray(velocities, dtype=np.float64)
+        self.radius = np.asarray(radius, dtype=np.float64)
+        self.mass = np.asarray(mass, dtype=np.float64)
+        self.kn = np.broadcast_to(np.asarray(kn, dtype=np.float64), self.radius.shape).copy()
+        self.kt = np.broadcast_to(np.asarray(kt, dtype=np.float64), self.radius.shape).copy()
+        self.gamma = np.broadcast_to(np.asarray(gamma, dtype=np.float64), self.radius.shape).copy()
+        self.pressure = np.zeros(len(self.ids)) if pressure is None else np.asarray(pressure, dtype=np.float64)
+        self.previous_acceleration = np.zeros((len(self.ids), 3)) if previous_acceleration is None else \
+            np.asarray(previous_acceleration, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def kinetic_energy(self):
+        return 0.5 * np.sum(self.mass * np.einsum('ij,ij->i', self.velocities, self.velocities))
+
+    def surface_area(self):
+        return 4 * np.pi * self.radius ** 2
+
+    def moved(self, positions, velocities, previous_acceleration):
+        # Copia con el nuevo estado cinemático; radio, masa, constantes y presión se conservan como en Particle.copy
+        return ParticleState(self.ids, positions, velocities, self.radius, self.mass, self.kn, self.kt, self.gamma,
+                             self.pressure.copy(), previous_acceleration)
+
+    def __add__(self, other):
+        return ParticleState(*(np.concatenate([getattr(self, field), getattr(other, field)]) for field in FIELDS))
+
+    def save(self, filename):
+        np.savez(filename, **{field: getattr(self, field) for field in FIELDS})
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as stored:
+            return cls(*(stored[field] for field in FIELDS))
+
+    @classmethod
+    def from_frame(cls, block, kn, kt, gamma):
+        # Estado a partir de un frame del .xyz (columnas de HEADERS); las constantes de contacto no se guardan ahí
+        return cls(block[:, ID].astype(np.int64), block[:, X:Z + 1], block[:, VX:VZ + 1], block[:, RADIUS],
+                   block[:, MASS], kn, kt, gamma, block[:, PRESSURE])
+
+    def frame(self, time):
+        # Frame en las columnas de HEADERS, listo para escribirse o compararse con lo que lee read_xyz
+        block = np.empty((len(self), len(HEADERS)))
+        block[:, ID] = self.ids
+        block[:, X:Z + 1] = self.positions
+        block[:, VX:VZ + 1] = self.velocities
+        block[:, RADIUS] = self.radius
+        block[:, MASS] = self.mass
+        block[:, PRESSURE] = self.pressure
+        block[:, -1] = time
+        return block
+
+
+FIELDS = ["ids", "positions", "velocities", "radius", "mass", "kn", "kt", "gamma", "pressure", "previous_acceleration"]
@@ -0,0 +1,140 @@
+import math
+import os
+
+import numpy as np
+
+from xyz_index import load_index
+
+from .cut_condition import KineticEnergyAndTimeCutCondition
+from .file_generator import CannonballFileGenerator
+from .forces import CannonballForcesCalculator, box_walls
+from .generator import generate_particles
+from .integrator import BeemanIntegrator
+from .simulator import TimeStepSimulator
+from .state import ParticleState
+
+# Valores por defecto de Main.kt, con las mismas opciones de la línea de comandos
+DEFAULTS = {
+    "-dt": 0.00005, "-dt2": 0.001, "-ct": 3.0, "-energyThreshold": 1E-3, "-o": "", "-pFile": "", "-pGen": True,
+    "-pStableTime": 0.7, "-pStableEnergy": 1E-3, "-n": 2000, "-pMass": 0.085, "-pld": 0.015, "-pud": 0.03,
+    "-pKn": 2E6, "-pKt": 4E6, "-pGamma": 100.0, "-wallKn": 2E6, "-wallKt": 4E6, "-wallGamma": 200.0, "-ballMass": 17.5,
+    "-ballKn": 2E6, "-ballKt": 4E6, "-ballGamma": 50.0, "-ballAngle": 90.0, "-ballVelocity": 20.0,
+    "-ballDiameter": 0.175, "-ballHeight": 0.1, "-bw": 0.4, "-bh": 1.0, "-g": 9.81, "-logs": False,
+}
+RUNS_FOLDER = "out/runs"
+PARTICLES_FOLDER = "out/particles"
+INIT_PARTICLES_FOLDER = "out/init-particles"
+
+
+def parse_args(tokens):
+    # Opciones con el formato de la línea de comandos del simulador ("-pGamma 150 -pGen true ..."), con el tipo del
+    # valor por defecto de cada una
+    params = {}
+    for option, value in zip(tokens[::2], tokens[1::2]):
+        if option not in DEFAULTS:
+            raise ValueError(f"Opción desconocida: {option}")
+        kind = type(DEFAULTS[option])
+        params[option] = value.lower() == "true" if kind is bool else kind(value)
+    return params
+
+
+def contact_constants(ids, params):
+    # kn, kt y gamma de cada partícula de un frame: la bala (id 0) con los de la bala, invertidos como en
+    # create_cannonball, y el resto con los de la cama
+    params = {**DEFAULTS, **params}
+    ball = np.asarray(ids) == 0
+    kn = np.where(ball, params["-ballKt"], params["-pKn"])
+    kt = np.where(ball, params["-ballKn"], params["-pKt"])
+    gamma = np.where(ball, params["-ballGamma"], params["-pGamma"])
+    return kn, kt, gamma
+
+
+def kotlin_double(value):
+    # Double.toString de Kotlin, para armar los mismos nombres de archivo por defecto que Main.kt
+    value = float(value)
+    if value != 0.0 and not 1E-3 <= abs(value) < 1E7:
+        mantissa, exponent = np.format_float_scientific(value, unique=True, trim='0').split('e')
+        return f"{mantissa}E{int(exponent)}"
+    return repr(value)
+
+
+def default_output_file(params):
+    names = [("nP", "-n"), ("_pMass", "-pMass"), ("_pLowDiam", "-pld"), ("_pUpperDiam", "-pud"), ("_pKn", "-pKn"),
+             ("_pGamma", "-pGamma"), ("_wallKn", "-wallKn"), ("_wallGamma", "-wallGamma"),
+             ("_ballAngle", "-ballAngle"), ("_ballKn", "-ballKn"), ("_ballGamma", "-ballGamma"), ("_cutoff", "-ct"),
+             ("_dT", "-dt"), ("_dT2", "-dt2")]
+    # Main.kt no pone ':' después de wallGamma ni de ballGamma
+    return "".join(f"{label}{'' if label.endswith('Gamma') else ':'}"
+                   f"{params[option] if option == '-n' else kotlin_double(params[option])}"
+                   for label, option in names)
+
+
+def load_bed(p_file):
+    # Un .npz guardado por este paquete trae el estado completo; de un .xyz se toma el último frame
+    path = os.path.join(INIT_PARTICLES_FOLDER, p_file)
+    if path.endswith(".xyz"):
+        with load_index(path[:-len(".xyz")]) as index:
+            return index.last_frame()
+    return ParticleState.load(path if path.endswith(".npz") else f"{path}.npz")
+
+
+class CannonballSystem:
+    def __init__(self, params, rng=None):
+        self.params = {**DEFAULTS, **params}
+        if not self.params["-o"]:
+            self.params["-o"] = default_output_file(self.params)
+        self.rng = np.random.default_rng() if rng is None else rng
+        p = self.params
+        self.walls = box_walls(p["-bw"], p["-wallKn"], p["-wallKt"], p["-wallGamma"])
+
+    def run(self):
+        p = self.params
+        box_particles = self.load_box_particles() if p["-pFile"] else self.run_particles_stabilization()
+        particles = box_particles + self.create_cannonball(self.highest_particle(box_particles))
+        cut_condition = KineticEnergyAndTimeCutCondition(p["-energyThreshold"], p["-ct"], 0.6, 1000, 3 * p["-bw"])
+        return self.simulate(particles, cut_condition, RUNS_FOLDER, p["-o"], "Cannonball")
+
+    def simulate(self, particles, cut_condition, folder, filename, name):
+        p = self.params
+        forces_calculator = CannonballForcesCalculator(p["-g"], self.walls)
+        integrator = BeemanIntegrator(forces_calculator, p["-dt"], particles)
+        file_generator = CannonballFileGenerator(folder, filename)
+        simulator = TimeStepSimulator(p["-dt"], p["-dt2"], cut_condition, integrator, file_generator, particles, name)
+        return simulator.simulate(True, p["-logs"])
+
+    def highest_particle(self, particles):
+        return (particles.positions[:, 2].max() if len(particles) else 0.0) + self.params["-ballHeight"]
+
+    def load_box_particles(self):
+        p = self.params
+        bed = load_bed(p["-pFile"])
+        if not isinstance(bed, ParticleState):
+            # Frame de un .xyz: las constantes de contacto son las de la línea de comandos
+            bed = ParticleState.from_frame(bed, *contact_constants(bed[:, 0], p))
+        return bed
+
+    def run_particles_stabilization(self):
+        p = self.params
+        particles = generate_particles(p["-n"], p["-bw"], p["-pld"], p["-pud"], p["-pMass"], p["-pKn"], p["-pKt"],
+                                       p["-pGamma"], self.walls, self.rng)
+        if p["-pGen"]:
+            os.makedirs(INIT_PARTICLES_FOLDER, exist_ok=True)
+            particles.save(os.path.join(INIT_PARTICLES_FOLDER, f"particles-{p['-o']}.npz"))
+        cut_condition = KineticEnergyAndTimeCutCondition(p["-pStableEnergy"], p["-pStableTime"], 0.4, 100,
+                                                         3 * p["-bw"])
+        stabilized = self.simulate(particles, cut_condition, PARTICLES_FOLDER, f"stabilization-{p['-o']}",
+                                   "Stabilization")
+        if p["-pGen"]:
+            stabilized.save(os.path.join(INIT_PARTICLES_FOLDER, f"stable-particles-{p['-o']}.npz"))
+        return stabilized
+
+    def create_cannonball(self, cannonball_height):
+        p = self.params
+        angle = math.radians(p["-ballAngle"])
+        velocity = [0.0, -p["-ballVelocity"] * math.cos(angle), -p["-ballVelocity"] * math.sin(angle)]
+        radius = p["-ballDiameter"] / 2
+        position = [p["-bw"] / 2, p["-bw"] / 2, cannonball_height + radius]
+        # CannonballSystem.kt pasa ballKn y ballKt en el orden (kt, kn) del constructor de Particle, así que la bala
+        # termina con kn = ballKt y kt = ballKn; se respeta para que las corridas coincidan
+        return ParticleState([0], [position], [velocity], [radius], [p["-ballMass"]], p["-ballKt"], p["-ballKn"],
+                             p["-ballGamma"])
@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from dem import BeemanIntegrator, CannonballForcesCalculator, box_walls, generate_particles
+from dem.system import DEFAULTS
+
+BENCHMARKS_FOLDER = "./out/benchmarks"
+DEFAULT_SIZES = [500, 1000, 2000, 5000, 10000]
+
+
+def benchmark_size(number_of_particles, steps, rebuild, seed=0):
+    # Cama recién generada, con el ancho de caja escalado para que la altura de la cama no dependa de N
+    p = DEFAULTS
+    box_width = p["-bw"] * np.sqrt(number_of_particles / p["-n"])
+    walls = box_walls(box_width, p["-wallKn"], p["-wallKt"], p["-wallGamma"])
+    state = generate_particles(number_of_particles, box_width, p["-pld"], p["-pud"], p["-pMass"], p["-pKn"],
+                               p["-pKt"], p["-pGamma"], walls, np.random.default_rng(seed))
+    integrator = BeemanIntegrator(CannonballForcesCalculator(p["-g"], walls), p["-dt"], state)
+    # Un paso para calentar antes de medir
+    state = integrator.apply(state)
+    start = time.perf_counter()
+    for _ in range(steps):
+        if rebuild:
+            integrator.neighbors.reference = None
+        state = integrator.apply(state)
+    elapsed = time.perf_counter() - start
+    return {"particles": number_of_particles, "box_width": box_width, "steps": steps, "rebuild_every_step": rebuild,
+            "seconds_per_step": elapsed / steps, "microseconds_per_particle_step": 1E6 * elapsed / steps /
+            number_of_particles, "pairs": int(len(integrator.neighbors.first) // 2)}
+
+
+def scaling_exponent(results):
+    # Pendiente de log(tiempo por paso) contra log(N); 1 es costo lineal
+    sizes = np.log([result["particles"] for result in results])
+    times = np.log([result["seconds_per_step"] for result in results])
+    return float(np.polyfit(sizes, times, 1)[0]) if len(results) > 1 else float('nan')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide cómo escala el costo por paso del motor en NumPy con N")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--output", default=os.path.join(BENCHMARKS_FOLDER, "dem_scaling.json"))
+    args = parser.parse_args()
+
+    report = {}
+    for rebuild in (False, True):
+        results = []
+        for size in map(int, args.sizes.split(",")):
+            result = benchmark_size(size, args.steps, rebuild)
+            results.append(result)
+            print(f"N = {size:6d}  {'rearmando vecinos' if rebuild else 'lista de Verlet '}  "
+                  f"{1E3 * result['seconds_per_step']:8.2f} ms/paso  "
+                  f"{result['microseconds_per_particle_step']:6.2f} µs/partícula")
+        key = "rebuild_every_step" if rebuild else "verlet_list"
+        report[key] = {"results": results, "scaling_exponent": scaling_exponent(results)}
+        print(f"Exponente de escala: {report[key]['scaling_exponent']:.2f}")
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
@@ -0,0 +1,18 @@
+import argparse
+import time
+
+import numpy as np
+
+from dem import CannonballSystem, parse_args
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simula el sistema de la bala con el motor de referencia en NumPy. Acepta las mismas opciones que "
+                    "el simulador (por ejemplo -n 500 -pGamma 150 -o prueba) y escribe el mismo .xyz en out/runs")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla para generar la cama de partículas")
+    args, simulator_args = parser.parse_known_args()
+
+    system = CannonballSystem(parse_args(simulator_args), np.random.default_rng(args.seed))
+    start = time.time()
+    system.run()
+    print(f"{system.params['-o']}: {time.time() - start:.1f} s")
@@ -0,0 +1,97 @@
+import argparse
+import os
+import subprocess
+
+import numpy as np
+
+from dem import BeemanIntegrator, CannonballForcesCalculator, ParticleState, TimeCutCondition, TimeStepSimulator, \
+    box_walls, contact_constants, parse_args
+from dem.system import DEFAULTS
+from sweep import DEFAULT_JAR
+from xyz_index import load_index
+
+VALIDATION_OUTPUT = "dem_validation"
+
+
+class FrameRecorder:
+    # Reemplaza al generador de archivos y se queda con los frames en memoria
+    def __init__(self):
+        self.frames = []
+
+    def add_to_file(self, state, time):
+        self.frames.append(state.frame(time))
+
+    def close_file(self):
+        pass
+
+
+def by_id(block):
+    return block[np.argsort(block[:, 0], kind='stable')]
+
+
+def replay(reference, params, duration):
+    # Arranca del primer frame de la corrida de Kotlin y simula duration segundos con el motor en NumPy
+    params = {**DEFAULTS, **params}
+    with load_index(reference) as index:
+        first = index.frame(0)
+    state = ParticleState.from_frame(first, *contact_constants(first[:, 0], params))
+    walls = box_walls(params["-bw"], params["-wallKn"], params["-wallKt"], params["-wallGamma"])
+    integrator = BeemanIntegrator(CannonballForcesCalculator(params["-g"], walls), params["-dt"], state)
+    recorder = FrameRecorder()
+    TimeStepSimulator(params["-dt"], params["-dt2"], TimeCutCondition(duration), integrator, recorder, state,
+                      "Validación").simulate(True)
+    return recorder.frames
+
+
+def compare(reference, frames):
+    # Por frame: error relativo de la energía cinética total, y mayor diferencia de posición y de velocidad entre las
+    # partículas (relativas al menor diámetro y a la mayor velocidad del frame de Kotlin)
+    rows = []
+    with load_index(reference) as index:
+        for k, ours in enumerate(frames[:len(index)]):
+            theirs = by_id(index.frame(k))
+            ours = by_id(ours)
+            energy = [0.5 * np.sum(block[:, 8] * np.sum(block[:, 4:7] ** 2, axis=1)) for block in (theirs, ours)]
+            position = np.abs(ours[:, 1:4] - theirs[:, 1:4]).max() / (2 * theirs[:, 7].min())
+            velocity = np.abs(ours[:, 4:7] - theirs[:, 4:7]).max() / max(np.abs(theirs[:, 4:7]).max(), 1E-12)
+            rows.append((theirs[0, -1], abs(energy[1] - energy[0]) / max(energy[0], 1E-12), position, velocity))
+    return np.array(rows).reshape(-1, 4)
+
+
+def run_kotlin(jar, params):
+    # Corrida corta del simulador de Kotlin con los mismos parámetros, para tener contra qué comparar
+    cmd = ["java", "-jar", jar, "-o", VALIDATION_OUTPUT]
+    for option, value in params.items():
+        cmd += [option, str(value).lower() if isinstance(value, bool) else str(value)]
+    subprocess.run(cmd, check=True)
+    return [os.path.join("out/particles", f"stabilization-{VALIDATION_OUTPUT}"),
+            os.path.join("out/runs", VALIDATION_OUTPUT)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compara el motor en NumPy contra corridas del simulador de Kotlin. Las opciones que no son de este "
+                    "script se interpretan como las del simulador (-n, -pGamma, -dt, ...)")
+    parser.add_argument("references", nargs="*", help="Corridas de Kotlin sin la extensión .xyz")
+    parser.add_argument("--jar", default=None, nargs="?", const=DEFAULT_JAR,
+                        help="Genera primero una corrida corta con el simulador")
+    parser.add_argument("--duration", type=float, default=0.05, help="Segundos a comparar desde el primer frame")
+    parser.add_argument("--tolerance", type=float, default=1E-3)
+    args, simulator_args = parser.parse_known_args()
+
+    params = parse_args(simulator_args)
+    references = args.references
+    if args.jar:
+        params = {"-n": 300, "-pStableTime": args.duration, "-ct": args.duration, **params}
+        references = run_kotlin(args.jar, params) + references
+
+    failed = False
+    for reference in references:
+        errors = compare(reference, replay(reference, params, args.duration))
+        worst = errors[:, 1:].max(axis=0)
+        ok = bool(np.all(worst <= args.tolerance))
+        failed |= not ok
+        print(f"{reference}: {len(errors)} frames hasta t = {errors[-1, 0]:.4f} s, "
+              f"energía cinética {worst[0]:.2e}, posición {worst[1]:.2e}, velocidad {worst[2]:.2e} "
+              f"{'OK' if ok else 'FUERA DE TOLERANCIA'}")
+    raise SystemExit(1 if failed else 0)
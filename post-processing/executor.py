@@ -1,42 +1,31 @@
-from tqdm import tqdm
-import os
-
-REPETITIONS = 5
-
-
-def execute_variation(variation_string, variation_name):
-    for i in tqdm(range(REPETITIONS)):
-        print("Started simulating variations for: " + variation_name + "...")
-        cmd = f"java -jar build/libs/ss-final-1.0.jar -o {variation_name}_rep_{i} {variation_string}"
-        os.system(cmd)
-
-
-def execute_diameters_variation():
-    params = [[0.008, 0.012, "d1"], [0.012, 0.016, "d2"], [0.016, 0.02, "d3"]]
-    for diameters_range in params:
-        execute_variation(f"-pld {diameters_range[0]} -pud {diameters_range[1]}", diameters_range[2])
-
-
-def execute_gammas_variation():
-    params = [[100.0, "g_100"], [125.0, "g_125"], [150.0, "g_150"], [175.0, "g_175"],
-              [200.0, "g_200"], [225.0, "g_225"], [250.0, "g_250"], [275.0, "g_275"], [300.0, "g_300"]]
-    for gamma in params:
-        execute_variation(f"-pGamma {gamma[0]}", gamma[1])
-
-
-def execute_number_of_particles_variation():
-    params = [[2000, "nParticles_2000"], [3000, "nParticles_3500"], [4500, "nParticles_4500"]]
-    for nParticle in params:
-        execute_variation(f"-n {nParticle[0]}", nParticle[1])
-
-
-def execute_angles_variation():
-    params = [[75.0, "bAngle_75"], [80.0, "bAngle_80"], [85.0, "bAngle_85"]]
-    for angle in params:
-        execute_variation(f"-ballAngle {angle[0]}", angle[1])
-
-
-execute_diameters_variation()
-execute_gammas_variation()
-execute_number_of_particles_variation()
-execute_angles_variation()
\ No newline at end of file
+import argparse
+
+from sweep import DEFAULT_JAR, DEFAULT_MANIFEST, load_sweep, run_jobs, sweep_jobs
+
+DEFAULT_SWEEPS = ["diameters", "gammas", "particles", "angles"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejecuta los barridos de simulaciones en paralelo")
+    parser.add_argument("sweeps", nargs="*", default=DEFAULT_SWEEPS,
+                        help="Archivos .json de barrido o nombres de la carpeta sweeps")
+    parser.add_argument("--jar", default=DEFAULT_JAR)
+    parser.add_argument("--workers", type=int, default=None, help="Simulaciones simultáneas")
+    parser.add_argument("--cores-per-job", type=int, default=4)
+    parser.add_argument("--memory-per-job", default="2g")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--resume", action="store_true", help="Saltea los trabajos cuyo .xyz ya está completo")
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--no-bed-cache", action="store_true",
+                        help="Genera y estabiliza la cama de partículas en cada trabajo en lugar de reutilizarla")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    jobs = [job for name in args.sweeps for job in sweep_jobs(load_sweep(name))]
+    if args.dry_run:
+        for job in jobs:
+            print(job["output"], job["args"])
+    else:
+        failed = run_jobs(jobs, args.jar, args.workers, args.manifest, args.resume, args.retries,
+                          args.memory_per_job, args.cores_per_job, reuse_beds=not args.no_bed_cache)
+        raise SystemExit(1 if failed else 0)
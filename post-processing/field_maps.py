@@ -0,0 +1,193 @@
+import argparse
+import os
+from functools import reduce
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from instrumentation import traced
+from parallel import default_workers
+from read_xyz import iter_xyz_frames
+from rendering import add_batch_arguments, configure_from_args, finish_figure, render_figures
+from stabilization_grid import ANALYSIS_FOLDER
+from sweep import BED_DEFAULTS, expand_variations, load_sweep
+from variation_analysis import memoized_map, variation_runs, variation_text
+
+FIELDS_FOLDER = os.path.join(ANALYSIS_FOLDER, "fields")
+FIELD_COLUMNS = ["id", "xPosition", "yPosition", "zPosition", "xVelocity", "yVelocity", "zVelocity", "mass", "pressure"]
+AXES = {"x": 1, "y": 2, "z": 3}
+FIELDS = ["pressure", "kinetic_energy", "speed", "xVelocity", "yVelocity", "zVelocity"]
+FIELD_LABELS = {
+    "pressure": "Presión [Pa]",
+    "kinetic_energy": "Energía cinética [J]",
+    "speed": "Velocidad [m/s]",
+    "xVelocity": "Velocidad en x [m/s]",
+    "yVelocity": "Velocidad en y [m/s]",
+    "zVelocity": "Velocidad en z [m/s]",
+}
+
+
+def field_values(block):
+    # Valores por partícula de cada campo de FIELDS, como filas de un arreglo (campos x partículas)
+    velocities = block[:, 4:7]
+    squared = np.einsum('ij,ij->i', velocities, velocities)
+    return np.vstack([block[:, 8], 0.5 * block[:, 7] * squared, np.sqrt(squared), velocities.T])
+
+
+class FieldMaps:
+    # Sumas y cantidades de partículas por celda de una grilla regular (2-D o 3-D sobre los ejes elegidos) y por
+    # ventana de tiempo. Se acumula de a un frame, así que nunca hace falta tener la corrida en memoria, y dos
+    # acumuladores con la misma grilla se combinan sumándolos.
+    def __init__(self, axes, bins, ranges, window):
+        self.axes = axes
+        self.bins = tuple(int(b) for b in np.broadcast_to(bins, len(axes)))
+        self.ranges = np.asarray(ranges, dtype=np.float64).reshape(len(axes), 2)
+        self.window = window
+        self.counts = {}
+        self.sums = {}
+
+    @property
+    def size(self):
+        return int(np.prod(self.bins))
+
+    def edges(self):
+        return [np.linspace(low, high, n + 1) for (low, high), n in zip(self.ranges, self.bins)]
+
+    def add_frame(self, time, block):
+        window = int(np.floor(time / self.window + 1E-9))
+        low, high = self.ranges[:, 0], self.ranges[:, 1]
+        cells = np.floor((block[:, [AXES[axis] for axis in self.axes]] - low) / (high - low) * self.bins).astype(int)
+        inside = np.all((cells >= 0) & (cells < self.bins), axis=1)
+        flat = np.ravel_multi_index(cells[inside].T, self.bins)
+        values = field_values(block[inside])
+        if window not in self.counts:
+            self.counts[window] = np.zeros(self.size, dtype=np.int64)
+            self.sums[window] = np.zeros((len(FIELDS), self.size))
+        # Un bincount por campo en lugar de un histogramdd pesado por campo: la celda de cada partícula se calcula
+        # una sola vez
+        self.counts[window] += np.bincount(flat, minlength=self.size)
+        for k in range(len(FIELDS)):
+            self.sums[window][k] += np.bincount(flat, weights=values[k], minlength=self.size)
+
+    def compatible(self, other):
+        return self.axes == other.axes and self.bins == other.bins and np.array_equal(self.ranges, other.ranges) \
+            and self.window == other.window
+
+    def merge(self, other):
+        if not self.compatible(other):
+            raise ValueError("Sólo se pueden combinar mapas con la misma grilla y la misma ventana de tiempo")
+        merged = FieldMaps(self.axes, self.bins, self.ranges, self.window)
+        for maps in (self, other):
+            for window, counts in maps.counts.items():
+                if window not in merged.counts:
+                    merged.counts[window] = np.zeros(self.size, dtype=np.int64)
+                    merged.sums[window] = np.zeros((len(FIELDS), self.size))
+                merged.counts[window] += counts
+                merged.sums[window] += maps.sums[window]
+        return merged
+
+    def windows(self):
+        return sorted(self.counts)
+
+    def mean(self, field, window):
+        # Promedio del campo en cada celda; NaN donde no pasó ninguna partícula
+        counts = self.counts[window]
+        sums = self.sums[window][FIELDS.index(field)]
+        return np.divide(sums, counts, out=np.full(self.size, np.nan), where=counts > 0).reshape(self.bins)
+
+    def save(self, path):
+        # Ventanas x celdas; las cantidades en enteros de 32 bits y las sumas en float32, comprimidos
+        windows = self.windows()
+        counts = np.array([self.counts[w] for w in windows], dtype=np.uint32).reshape(-1, *self.bins)
+        sums = np.array([self.sums[w] for w in windows], dtype=np.float32).reshape(-1, len(FIELDS), *self.bins)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, axes=self.axes, bins=self.bins, ranges=self.ranges, window=self.window,
+                            windows=np.array(windows), fields=FIELDS, counts=counts, sums=sums)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as stored:
+            maps = cls(str(stored["axes"]), stored["bins"], stored["ranges"], float(stored["window"]))
+            for k, window in enumerate(stored["windows"].tolist()):
+                maps.counts[window] = stored["counts"][k].reshape(-1).astype(np.int64)
+                maps.sums[window] = stored["sums"][k].reshape(len(FIELDS), -1).astype(np.float64)
+        return maps
+
+
+@traced("field_maps")
+def accumulate_run(filename, axes, bins, ranges, window, time_interval=None, include_ball=False):
+    maps = FieldMaps(axes, bins, ranges, window)
+    for time, block in iter_xyz_frames(filename, columns=FIELD_COLUMNS, time_interval=time_interval):
+        maps.add_frame(time, block if include_ball else block[block[:, 0] != 0])
+    return maps
+
+
+def box_ranges(axes, box_width, height):
+    limits = {"x": (0.0, box_width), "y": (0.0, box_width), "z": (0.0, height)}
+    return [limits[axis] for axis in axes]
+
+
+def analyze_sweep(sweep, axes="xz", bins=40, window=0.05, height=0.5, time_interval=None, include_ball=False,
+                  workers=None, folder=FIELDS_FOLDER):
+    # Un acumulador por corrida, en paralelo; se guardan por repetición y combinados por variación
+    runs = variation_runs(sweep)
+    variations = {variation["name"]: variation for variation in expand_variations(sweep)}
+    results = {}
+    for name, filenames in runs.items():
+        if not filenames:
+            continue
+        box_width = {**BED_DEFAULTS, **variations[name]["args"]}["-bw"]
+        params = {"axes": axes, "bins": bins, "ranges": box_ranges(axes, box_width, height), "window": window,
+                  "time_interval": time_interval, "include_ball": include_ball}
+        repetitions = memoized_map(accumulate_run, filenames, params, workers)
+        for filename, maps in zip(filenames, repetitions):
+            maps.save(os.path.join(folder, f"{os.path.basename(filename)}_{axes}.npz"))
+        results[name] = reduce(FieldMaps.merge, repetitions)
+        results[name].save(os.path.join(folder, f"{name}_{axes}.npz"))
+    return results
+
+
+def plot_field_maps(maps, field, title, filename):
+    # Un mapa de calor por ventana de tiempo, con la misma escala de colores para todas
+    windows = maps.windows()
+    means = [maps.mean(field, window) for window in windows]
+    finite = np.concatenate([mean[np.isfinite(mean)] for mean in means] + [np.zeros(1)])
+    fig, axes = plt.subplots(1, len(windows), figsize=(3 * len(windows), 4), squeeze=False, sharey=True)
+    edges = maps.edges()
+    for ax, window, mean in zip(axes[0], windows, means):
+        image = ax.pcolormesh(edges[0], edges[1], mean.T, vmin=finite.min(), vmax=finite.max(), shading='flat')
+        ax.set_title(f"{window * maps.window:.2f} s", fontsize=12)
+        ax.set_xlabel(f"{maps.axes[0]} [m]")
+        ax.set_aspect('equal')
+    axes[0][0].set_ylabel(f"{maps.axes[1]} [m]")
+    fig.colorbar(image, ax=axes[0].tolist(), label=FIELD_LABELS[field])
+    fig.suptitle(title, fontsize=16)
+    finish_figure(fig, title, filename)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Acumula mapas de presión, energía cinética y velocidad por celda")
+    parser.add_argument("sweeps", nargs="+", help="Archivos .json de barrido o nombres de la carpeta sweeps")
+    parser.add_argument("--axes", default="xz", help="Ejes de la grilla, por ejemplo xz, xy o xyz")
+    parser.add_argument("--bins", type=int, default=40)
+    parser.add_argument("--window", type=float, default=0.05, help="Duración de cada ventana de tiempo [s]")
+    parser.add_argument("--height", type=float, default=0.5, help="Altura máxima de la grilla [m]")
+    parser.add_argument("--time-interval", type=float, default=None)
+    parser.add_argument("--include-ball", action="store_true", help="Incluye a la bala en los mapas")
+    parser.add_argument("--field", choices=FIELDS, default="pressure", help="Campo a graficar")
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    workers = default_workers() if args.workers is None else args.workers
+    for name in args.sweeps:
+        sweep = load_sweep(name)
+        results = analyze_sweep(sweep, args.axes, args.bins, args.window, args.height, args.time_interval,
+                                args.include_ball, workers)
+        if len(args.axes) != 2:
+            continue
+        label_template = sweep.get("analysis", {}).get("label", "{name}")
+        render_figures([(plot_field_maps, (results[variation["name"]], args.field,
+                                           f"{FIELD_LABELS[args.field].split(' [')[0]} con "
+                                           f"{variation_text(label_template, variation)}",
+                                           f"mapa_{args.field}_{variation['name']}"))
+                        for variation in expand_variations(sweep) if variation["name"] in results], workers)
@@ -0,0 +1,222 @@
+import atexit
+import cProfile
+import glob
+import itertools
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+
+# Si está definida SS_TRACE_DIR cada etapa instrumentada registra su tiempo, filas, bytes leídos y pico de memoria.
+# SS_TRACE_PROFILE elige una etapa para capturar además con cProfile o tracemalloc (SS_TRACE_PROFILE_MODE).
+TRACE_ENV = "SS_TRACE_DIR"
+PROFILE_ENV = "SS_TRACE_PROFILE"
+PROFILE_MODE_ENV = "SS_TRACE_PROFILE_MODE"
+# Carpeta de la sesión en curso; la heredan los procesos hijos para escribir sus registros en el mismo lugar
+SESSION_ENV = "SS_TRACE_SESSION"
+PROFILE_MODES = ["cprofile", "tracemalloc"]
+
+trace_settings = {"session": None, "owner": None, "profile_stage": None, "profile_mode": "cprofile"}
+profile_counter = itertools.count()
+
+
+class PeakMemory:
+    # Pico de memoria residente del proceso durante un bloque, muestreando /proc/self/statm desde otro hilo. Donde no
+    # existe /proc se usa ru_maxrss, que es el pico de toda la vida del proceso.
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self.start = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        try:
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * resource.getpagesize()
+        except OSError:
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.start = self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def bytes_read():
+    # Bytes que el proceso leyó con read() hasta ahora (incluye lo que vino de la caché de páginas, no lo que se lee
+    # por mmap); None donde no existe /proc
+    try:
+        with open("/proc/self/io") as file:
+            return next(int(line.split()[1]) for line in file if line.startswith("rchar:"))
+    except (OSError, StopIteration):
+        return None
+
+
+def configure_trace(folder, profile_stage=None, profile_mode="cprofile"):
+    # Abre una sesión nueva; los registros de todos los procesos se juntan al salir del proceso que la abrió
+    session = os.path.join(folder, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+    os.makedirs(session, exist_ok=True)
+    os.environ[SESSION_ENV] = session
+    if profile_stage:
+        os.environ[PROFILE_ENV] = profile_stage
+        os.environ[PROFILE_MODE_ENV] = profile_mode
+    trace_settings.update(session=session, owner=os.getpid(), profile_stage=profile_stage, profile_mode=profile_mode)
+    atexit.register(write_summary)
+
+
+def join_session(session):
+    trace_settings.update(session=session, profile_stage=os.environ.get(PROFILE_ENV),
+                          profile_mode=os.environ.get(PROFILE_MODE_ENV, "cprofile"))
+
+
+def variation_of(filename):
+    # Nombre de la variación de una corrida: sin carpeta, sin extensión y sin el sufijo de repetición
+    name = re.sub(r'\.xyz(\.\w+)?$', '', os.path.basename(filename))
+    return re.sub(r'_rep_\d+$', '', name)
+
+
+def write_record(record):
+    with open(os.path.join(trace_settings["session"], f"records_{os.getpid()}.jsonl"), "a") as file:
+        file.write(json.dumps(record, default=str) + "\n")
+
+
+@contextmanager
+def profiled(name, record):
+    # Captura con cProfile o tracemalloc sólo la etapa elegida; el resultado queda en la carpeta de la sesión
+    if trace_settings["profile_stage"] != name or \
+            (trace_settings["profile_mode"] == "tracemalloc" and tracemalloc.is_tracing()):
+        yield
+        return
+    path = os.path.join(trace_settings["session"], f"{name}_{os.getpid()}_{next(profile_counter)}")
+    if trace_settings["profile_mode"] == "tracemalloc":
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1E6
+            tracemalloc.stop()
+            with open(f"{path}.tracemalloc.txt", "w") as file:
+                file.writelines(f"{statistic}\n" for statistic in snapshot.statistics("lineno")[:25])
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{path}.prof")
+
+
+@contextmanager
+def stage(name, filename=None, variation=None):
+    # Mide un bloque del análisis. Devuelve el registro para que la etapa complete "rows"; sin una sesión abierta no
+    # mide nada.
+    if trace_settings["session"] is None:
+        yield {}
+        return
+    record = {"stage": name, "file": None if filename is None else os.path.basename(filename),
+              "variation": variation if variation is not None or filename is None else variation_of(filename),
+              "pid": os.getpid(), "rows": None}
+    io_start = bytes_read()
+    with PeakMemory() as memory:
+        start, cpu_start = time.perf_counter(), time.process_time()
+        with profiled(name, record):
+            yield record
+        record["wall_seconds"] = time.perf_counter() - start
+        record["cpu_seconds"] = time.process_time() - cpu_start
+    record["bytes_read"] = None if io_start is None else bytes_read() - io_start
+    record["peak_rss_mb"] = memory.peak / 1E6
+    record["started_at"] = time.time() - record["wall_seconds"]
+    write_record(record)
+
+
+def traced(name, rows=None):
+    # Decorador que mide cada llamada como una etapa. Si el primer argumento es un texto se toma como el archivo de
+    # la corrida; rows(resultado, *args, **kwargs) devuelve las filas procesadas.
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if trace_settings["session"] is None:
+                return function(*args, **kwargs)
+            filename = args[0] if args and isinstance(args[0], str) else None
+            with stage(name, filename) as record:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    record["rows"] = rows(result, *args, **kwargs)
+            return result
+        return wrapper
+    return decorator
+
+
+def summarize(records, keys):
+    # Totales por etapa (o por variación y etapa); los tiempos de etapas anidadas se cuentan en cada una
+    totals = records.groupby(keys, sort=False).agg(
+        calls=("wall_seconds", "size"), wall_seconds=("wall_seconds", "sum"), cpu_seconds=("cpu_seconds", "sum"),
+        rows=("rows", "sum"), bytes_read=("bytes_read", "sum"), peak_rss_mb=("peak_rss_mb", "max"))
+    totals["rows_per_second"] = totals["rows"] / totals["wall_seconds"]
+    return totals.sort_values("wall_seconds", ascending=False)
+
+
+def write_summary():
+    # Sólo el proceso que abrió la sesión junta los registros de todos los procesos
+    session = trace_settings["session"]
+    if session is None or trace_settings["owner"] != os.getpid():
+        return
+    records = []
+    for path in sorted(glob.glob(os.path.join(session, "records_*.jsonl"))):
+        with open(path) as file:
+            records.extend(json.loads(line) for line in file)
+    if not records:
+        return
+    with open(os.path.join(session, "trace.json"), "w") as file:
+        json.dump(records, file, indent=2)
+    trace = pd.DataFrame(records).sort_values("started_at")
+    trace.to_csv(os.path.join(session, "trace.csv"), index=False)
+    by_stage = summarize(trace, ["stage"])
+    by_stage.to_csv(os.path.join(session, "summary.csv"))
+    with_variation = trace.dropna(subset=["variation"])
+    if len(with_variation):
+        summarize(with_variation, ["variation", "stage"]).to_csv(os.path.join(session, "summary_variations.csv"))
+    print(f"\nTiempos por etapa (detalle en {session}):")
+    print(by_stage.to_string(float_format=lambda value: f"{value:,.3f}"))
+
+
+def add_trace_arguments(parser):
+    parser.add_argument("--trace", metavar="CARPETA", default=os.environ.get(TRACE_ENV),
+                        help="Registra tiempo, filas, bytes leídos y memoria de cada etapa en la carpeta")
+    parser.add_argument("--profile-stage", default=os.environ.get(PROFILE_ENV),
+                        help="Etapa a capturar con cProfile o tracemalloc (requiere --trace)")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default=os.environ.get(PROFILE_MODE_ENV, "cprofile"))
+
+
+def configure_trace_from_args(args):
+    if args.trace and trace_settings["session"] is None:
+        configure_trace(args.trace, args.profile_stage, args.profile_mode)
+
+
+if os.environ.get(SESSION_ENV):
+    join_session(os.environ[SESSION_ENV])
+elif os.environ.get(TRACE_ENV):
+    configure_trace(os.environ[TRACE_ENV], os.environ.get(PROFILE_ENV), os.environ.get(PROFILE_MODE_ENV, "cprofile"))
@@ -1,10 +1,66 @@
+from functools import partial
+
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 
+from instrumentation import traced
+from parallel import parallel_map
+from read_xyz import iter_xyz_frames, repetition_filenames, snap_to_time_grid
+from rendering import finish_figure
+
+KINETIC_COLUMNS = ["xVelocity", "yVelocity", "zVelocity", "mass"]
+
+
+@traced("frame_kinetic_energies", rows=lambda result, *args, **kwargs: len(result[0]))
+def frame_kinetic_energies(filename, time_interval=None):
+    # Recorremos la corrida de a un frame y nos quedamos sólo con la energía cinética total de cada uno.
+    # Con time_interval, los frames que no caen en la grilla ni siquiera se parsean.
+    times = []
+    energies = []
+    for time, block in iter_xyz_frames(filename, columns=KINETIC_COLUMNS, time_interval=time_interval):
+        times.append(time)
+        energies.append(0.5 * np.sum(block[:, 3] * (block[:, 0] ** 2 + block[:, 1] ** 2 + block[:, 2] ** 2)))
+    return np.asarray(times), np.asarray(energies)
+
+
+@traced("kinetic_energy_groupby",
+        rows=lambda result, repetitions, *args, **kwargs: sum(len(times) for times, _ in repetitions))
+def kinetic_energy_stats_by_frames(repetitions, time_interval):
+    # Recibe (tiempos, energías) por repetición; sólo guardamos la tabla chica (tiempo, repetición, energía)
+    per_frame = []
+    min_time = float('inf')
+    for rep, (times, energies) in enumerate(repetitions):
+        per_frame.append(pd.DataFrame({'time': times, 'repetition': rep, 'kinetic_energy': energies}))
+        min_time = min(min_time, times.max())
+    data = pd.concat(per_frame, ignore_index=True)
+
+    # Igual que read_xyz_repetitions, nos quedamos sólo hasta el menor tiempo final entre repeticiones
+    data = data[data['time'] <= min_time]
+    data = snap_to_time_grid(data, time_interval)
+    return data.groupby('time')['kinetic_energy'].agg(['mean', 'std'])
 
+
+def get_kinetic_energy_avg_streaming(filename_variation, num_repetitions, time_interval, workers=1):
+    print(f"Procesando {num_repetitions} repeticiones de {filename_variation}")
+    filenames = repetition_filenames(filename_variation, num_repetitions)
+    energies = parallel_map(partial(frame_kinetic_energies, time_interval=time_interval), filenames, workers)
+    return kinetic_energy_stats_by_frames(energies, time_interval)
+
+
+def get_kinetic_energy_avg_variations(filename_variations, num_repetitions, time_interval, workers=None):
+    # Cada proceso reduce una corrida a su serie de energías por frame; sólo eso vuelve al proceso principal
+    filenames = [filename for filename_variation in filename_variations.values()
+                 for filename in repetition_filenames(filename_variation, num_repetitions)]
+    results = parallel_map(partial(frame_kinetic_energies, time_interval=time_interval), filenames, workers)
+    return {name: kinetic_energy_stats_by_frames(results[k * num_repetitions:(k + 1) * num_repetitions], time_interval)
+            for k, name in enumerate(filename_variations)}
+
+
+@traced("kinetic_energy_groupby", rows=lambda result, data, *args, **kwargs: len(data))
 def get_kinetic_energy_avg(data, time_interval):
-    # Filtramos los datos para quedarnos sólo con aquellos cuyo tiempo modulo time_interval es 0
-    data = data[np.isclose(data['time'] % time_interval, 0)].copy()
+    # Nos quedamos sólo con los frames más cercanos a cada múltiplo de time_interval
+    data = snap_to_time_grid(data, time_interval)
 
     # Calculamos la velocidad total
     v_total = np.sqrt(data['xVelocity'] ** 2 + data['yVelocity'] ** 2 + data['zVelocity'] ** 2)
@@ -31,10 +87,11 @@ def plot_kinetic_energy_avg(kinetic_energy_stats, title):
     ax.set_title(title, fontsize=20)
     plt.yscale('log')
     plt.tight_layout()
-    plt.show()
+    finish_figure(fig, title)
 
 
-def plot_all_kinetic_energies(kinetic_energy_stats_dict):
+def plot_all_kinetic_energies(kinetic_energy_stats_dict, filename='comparacion_energia_cinetica',
+                              title='Comparación de diferentes gamma'):
     fig, ax = plt.subplots()
 
     # Graficamos cada conjunto de datos en el diccionario
@@ -44,8 +101,8 @@ def plot_all_kinetic_energies(kinetic_energy_stats_dict):
 
     ax.set_xlabel('Tiempo [s]', fontsize=16)
     ax.set_ylabel('Energía cinética [J]', fontsize=16)
-    ax.set_title('Comparación de diferentes gamma', fontsize=20)
+    ax.set_title(title, fontsize=20)
     ax.legend()
     plt.yscale('log')
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    finish_figure(fig, title, filename)
\ No newline at end of file
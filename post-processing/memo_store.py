@@ -0,0 +1,75 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+from xyz_cache import file_fingerprint, read_meta
+from xyz_format import find_xyz
+
+MEMO_FOLDER = "./out/analysis/memo"
+
+
+def run_fingerprint(filename):
+    # Huella de la corrida: la del .xyz (o su versión comprimida), o la que quedó registrada en su caché si ya no está
+    try:
+        return file_fingerprint(find_xyz(filename))
+    except FileNotFoundError:
+        meta = read_meta(filename)
+        if meta is None:
+            raise
+        return meta["source"]
+
+
+def function_name(function):
+    # Al correr un módulo como script su __module__ es __main__. Usamos entonces el nombre de su archivo (el de la
+    # función, no el del decorador traced), que es el mismo con el que la importan los demás scripts.
+    function = getattr(function, "func", function)
+    module = function.__module__
+    if module == "__main__":
+        module = os.path.splitext(os.path.basename(inspect.getfile(inspect.unwrap(function))))[0]
+    return f"{module}.{function.__qualname__}"
+
+
+def memo_key(name, fingerprints, params):
+    description = {"function": name, "inputs": fingerprints, "params": params}
+    return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def memo_path(key, folder=MEMO_FOLDER):
+    return os.path.join(folder, key[:2], f"{key}.pkl")
+
+
+def memo_load(key, folder=MEMO_FOLDER):
+    try:
+        with open(memo_path(key, folder), "rb") as file:
+            return True, pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return False, None
+
+
+def memo_save(key, value, folder=MEMO_FOLDER):
+    path = memo_path(key, folder)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as file:
+        pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def is_failure(value):
+    # None, o una tupla que empieza con None como el (None, None) de read_xyz, es un error de lectura (por ejemplo una
+    # corrida que no se encontró); no se guarda, así la próxima vez se vuelve a intentar
+    return value is None or (isinstance(value, tuple) and len(value) > 0 and value[0] is None)
+
+
+def memoized(function, filenames, params, compute, folder=MEMO_FOLDER):
+    # Resultado de compute() guardado en disco bajo (función, huellas de las corridas, parámetros).
+    # Si cambia alguna corrida cambia su huella, y con ella la clave, así que la entrada vieja deja de usarse.
+    key = memo_key(function_name(function), [run_fingerprint(filename) for filename in filenames], params)
+    found, value = memo_load(key, folder)
+    if not found:
+        value = compute()
+        if not is_failure(value):
+            memo_save(key, value, folder)
+    return value
@@ -0,0 +1,17 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers():
+    # La cantidad de procesos se puede fijar con la variable de entorno SS_WORKERS
+    return int(os.environ.get("SS_WORKERS", os.cpu_count() or 1))
+
+
+def parallel_map(function, items, workers=None):
+    # Igual que map pero repartiendo los elementos entre procesos; el orden de los resultados se conserva
+    items = list(items)
+    workers = min(default_workers() if workers is None else workers, len(items))
+    if workers <= 1:
+        return [function(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, items))
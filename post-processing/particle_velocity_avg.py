@@ -1,10 +1,44 @@
+from functools import partial
+
 import numpy as np
 import matplotlib.pyplot as plt
 
+from instrumentation import traced
+from parallel import parallel_map
+from read_xyz import combine_repetitions, read_xyz, read_xyz_repetitions, repetition_filenames, snap_to_time_grid
+from rendering import finish_figure
+
+VELOCITY_COLUMNS = ["id", "xVelocity", "yVelocity", "zVelocity", "time"]
+
+
+def read_particle_repetitions(filename_variation, num_repetitions, particle_id, workers=1, time_interval=None):
+    # Leemos sólo las filas de la partícula y las columnas que usa get_particle_velocity_avg
+    return read_xyz_repetitions(filename_variation, num_repetitions, particle_ids=[particle_id],
+                                columns=VELOCITY_COLUMNS, workers=workers, time_interval=time_interval)
+
+
+def read_particle_rows(filename, particle_id, time_interval=None):
+    return read_xyz(filename, particle_ids=[particle_id], columns=VELOCITY_COLUMNS, time_interval=time_interval)
 
+
+def get_particle_velocity_avg_variations(filename_variations, num_repetitions, particle_id, time_interval,
+                                         workers=None):
+    # Leemos las filas de la partícula de todas las corridas de todas las variaciones en un único pool de procesos
+    filenames = [filename for filename_variation in filename_variations.values()
+                 for filename in repetition_filenames(filename_variation, num_repetitions)]
+    read = partial(read_particle_rows, particle_id=particle_id, time_interval=time_interval)
+    results = parallel_map(read, filenames, workers)
+    velocity_stats = {}
+    for k, name in enumerate(filename_variations):
+        data, _ = combine_repetitions(results[k * num_repetitions:(k + 1) * num_repetitions])
+        velocity_stats[name] = get_particle_velocity_avg(data, particle_id, time_interval)
+    return velocity_stats
+
+
+@traced("velocity_groupby", rows=lambda result, data, *args, **kwargs: len(data))
 def get_particle_velocity_avg(data, particle_id, time_interval):
-    # Filtramos los datos para quedarnos sólo con aquellos cuyo tiempo modulo time_interval es 0
-    data = data[np.isclose(data['time'] % time_interval, 0)].copy()
+    # Nos quedamos sólo con los frames más cercanos a cada múltiplo de time_interval
+    data = snap_to_time_grid(data, time_interval)
     # Filtramos los datos para quedarnos sólo con los de la partícula de interés
     data = data[data['id'] == particle_id].copy()
 
@@ -32,10 +66,10 @@ def plot_particle_velocity_avg(velocity_stats, title):
     ax.set_ylabel('Velocidad total [m/s]', fontsize=16)
     ax.set_title(title, fontsize=20)
     plt.tight_layout()
-    plt.show()
+    finish_figure(fig, title)
 
 
-def plot_all_velocities(velocity_stats_dict):
+def plot_all_velocities(velocity_stats_dict, filename='comparacion_velocidad', title='Comparación de diferentes'):
     fig, ax = plt.subplots()
 
     # Graficamos cada conjunto de datos en el diccionario
@@ -45,8 +79,8 @@ def plot_all_velocities(velocity_stats_dict):
 
     ax.set_xlabel('Tiempo [s]', fontsize=16)
     ax.set_ylabel('Velocidad total [m/s]', fontsize=16)
-    ax.set_title('Comparación de diferentes', fontsize=20)
+    ax.set_title(title, fontsize=20)
     ax.legend()
     plt.yscale('log')
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    finish_figure(fig, title, filename)
\ No newline at end of file
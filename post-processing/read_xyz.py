@@ -1,54 +1,116 @@
+from functools import partial
+
+import numpy as np
 import pandas as pd
 
+from instrumentation import traced
+from parallel import parallel_map
+from xyz_cache import ensure_cache, is_fresh, iter_cache_frames, load_cache
+from xyz_format import HEADERS, find_xyz, iter_frames, open_xyz, parse_xyz, snap_frame_times
+
 
-def read_xyz(filename):
-    filename_xyz = f'{filename}.xyz'
+@traced("read_xyz", rows=lambda result, *args, **kwargs: 0 if result[0] is None else len(result[0]))
+def read_xyz(filename, use_cache=True, particle_ids=None, columns=None, time_interval=None):
+    # Con time_interval sólo se leen los frames más cercanos a cada múltiplo del intervalo, con el tiempo ajustado a él
+    filename_xyz = find_xyz(filename)
+    filtered = particle_ids is not None or columns is not None or time_interval is not None
+    if use_cache:
+        try:
+            # Una lectura completa convierte la corrida al caché binario; una filtrada sólo lo usa si ya está al día
+            if not filtered:
+                ensure_cache(filename)
+            if is_fresh(filename):
+                data, times_df = load_cache(filename, columns, particle_ids, time_interval)
+                # El caché guarda float32 e int32; devolvemos float64 como al parsear, así el resultado no depende de
+                # si la corrida ya estaba en caché
+                return pd.DataFrame({column: np.asarray(values, dtype=np.float64)
+                                     for column, values in data.items()}), times_df
+        except OSError:
+            pass
     try:
-        with open(filename_xyz, 'r') as file:
-            lines = file.readlines()
+        # Sin caché, el filtro de partículas y la proyección de columnas se aplican mientras se parsea cada frame
+        values, times_df, _ = parse_xyz(filename_xyz, particle_ids, columns, time_interval)
     except FileNotFoundError:
         print(f"El archivo {filename_xyz} no fue encontrado.")
         return None, None
 
-    data_df = []
-    times_df = []
-    headers = ["id", "xPosition", "yPosition", "zPosition", "xVelocity", "yVelocity", "zVelocity", "radius", "mass",
-               "pressure", "time"]
-    i = 0
-    while i < len(lines):
-        num_particles = int(lines[i].strip())
-        i += 2  # Saltamos el header
-        for j in range(num_particles):
-            particle_data = lines[i + j].strip().split()
-            data_df.append({headers[k]: float(particle_data[k]) for k in range(len(headers))})
-        times_df.append(float(particle_data[-1]))
-        i += num_particles
-    return pd.DataFrame(data_df), times_df
-
-
-def read_xyz_repetitions(filename_variation, num_repetitions):
-    all_data = pd.DataFrame()
+    return pd.DataFrame(values, columns=HEADERS if columns is None else columns, copy=False), times_df
+
+
+def repetition_filenames(filename_variation, num_repetitions):
+    return [f'{filename_variation}_rep_{rep}' for rep in range(num_repetitions)]
+
+
+@traced("concat", rows=lambda result, *args, **kwargs: len(result[0]))
+def combine_repetitions(repetitions):
+    # Recibe una lista de (data_df, times) en orden de repetición y arma el DataFrame conjunto
+    all_data = []
     min_time = float('inf')  # Iniciamos el menor tiempo con un valor muy alto
 
-    for rep in range(0, num_repetitions):
-        print(f"Procesando repetición {rep}")
-        filename_rep = f'{filename_variation}_rep_{rep}'
-        data_df, times = read_xyz(filename_rep)
+    for rep, (data_df, times) in enumerate(repetitions):
         # Agregamos una columna para la repetición
         data_df['repetition'] = rep
-        all_data = pd.concat([all_data, data_df])
+        all_data.append(data_df)
         # Actualizamos el menor tiempo, si es necesario
         max_time_rep = max(times)
         if max_time_rep < min_time:
             min_time = max_time_rep
 
+    # Concatenamos una única vez para evitar copias cuadráticas
+    all_data = pd.concat(all_data, ignore_index=True)
+
     # Filtramos los datos para incluir sólo hasta el menor tiempo
     all_data = all_data[all_data['time'] <= min_time]
 
     # Ordenamos los datos por tiempo y repetición
-    all_data.sort_values(by=['time', 'repetition'], inplace=True)
+    all_data = all_data.sort_values(by=['time', 'repetition'], kind='stable')
 
     # Creamos la lista de times_frames
     times_frames = all_data['time'].unique().tolist()
 
     return all_data, times_frames
+
+
+def projected_columns(columns):
+    # combine_repetitions necesita la columna de tiempo aunque no se la pida
+    if columns is not None and "time" not in columns:
+        return [*columns, "time"]
+    return columns
+
+
+def read_xyz_repetitions(filename_variation, num_repetitions, particle_ids=None, columns=None, workers=1,
+                         time_interval=None):
+    print(f"Procesando {num_repetitions} repeticiones de {filename_variation}")
+    read = partial(read_xyz, particle_ids=particle_ids, columns=projected_columns(columns), time_interval=time_interval)
+    return combine_repetitions(parallel_map(read, repetition_filenames(filename_variation, num_repetitions), workers))
+
+
+def iter_xyz_frames(filename, particle_ids=None, columns=None, use_cache=True, time_interval=None):
+    # Recorre la corrida frame a frame, desde el caché binario si está al día o parseando el texto si no
+    if use_cache and is_fresh(filename):
+        yield from iter_cache_frames(filename, columns, particle_ids, time_interval)
+        return
+    with open_xyz(find_xyz(filename)) as (file, _):
+        yield from iter_frames(file, particle_ids, columns, time_interval)
+
+
+def snap_repetition(data, time_interval):
+    times = np.unique(data['time'].to_numpy())
+    indices, snapped = snap_frame_times(times, time_interval)
+    mapping = pd.Series(snapped, index=times[indices])
+    data = data[data['time'].isin(mapping.index)].copy()
+    data['time'] = data['time'].map(mapping)
+    return data
+
+
+@traced("filter", rows=lambda result, data, *args, **kwargs: len(data))
+def snap_to_time_grid(data, time_interval):
+    # Se queda con el frame más cercano a cada múltiplo de time_interval y ajusta su tiempo al múltiplo exacto.
+    # Reemplaza el filtro np.isclose(time % time_interval, 0), que falla con la deriva de los tiempos guardados.
+    if 'repetition' not in data or data.empty:
+        return snap_repetition(data, time_interval)
+    # Cada repetición deriva distinto, así que se ajusta por separado: con los tiempos de todas juntos, el paso entre
+    # tiempos vecinos se achica y los frames de una repetición quedan fuera de la tolerancia
+    snapped = pd.concat([snap_repetition(group, time_interval)
+                         for _, group in data.groupby('repetition', sort=False)])
+    return snapped.sort_values(by=['time', 'repetition'], kind='stable')
@@ -0,0 +1,75 @@
+import os
+import re
+import unicodedata
+from functools import partial
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+from instrumentation import add_trace_arguments, configure_trace_from_args, traced
+from parallel import parallel_map
+
+# Si está definida SS_PLOTS_DIR los gráficos se guardan ahí en lugar de abrirse en una ventana
+BATCH_ENV = "SS_PLOTS_DIR"
+FORMATS_ENV = "SS_PLOT_FORMATS"
+
+batch_settings = {"output_dir": None, "formats": ["png"]}
+
+
+def configure_batch(output_dir, formats=("png",)):
+    matplotlib.use("Agg")
+    os.makedirs(output_dir, exist_ok=True)
+    batch_settings["output_dir"] = output_dir
+    batch_settings["formats"] = list(formats)
+
+
+def figure_filename(title):
+    # Nombre de archivo determinístico a partir del título: sin tildes, en minúsculas y con guiones bajos
+    ascii_title = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "_", ascii_title.lower()).strip("_")
+
+
+def finish_figure(fig, title, filename=None):
+    if batch_settings["output_dir"] is None:
+        plt.show()
+        return
+    name = filename or figure_filename(title)
+    for extension in batch_settings["formats"]:
+        fig.savefig(os.path.join(batch_settings["output_dir"], f"{name}.{extension}"))
+    # Cerramos la figura explícitamente para que la memoria no crezca con cada gráfico
+    plt.close(fig)
+
+
+def render_task(output_dir, formats, task):
+    configure_batch(output_dir, formats)
+    function, args = task
+    function(*args)
+
+
+@traced("plot", rows=lambda result, tasks, *args, **kwargs: len(tasks))
+def render_figures(tasks, workers=None):
+    # Cada tarea es (función de graficado, argumentos); en modo batch se reparten entre procesos
+    if batch_settings["output_dir"] is None:
+        for function, args in tasks:
+            function(*args)
+        return
+    parallel_map(partial(render_task, batch_settings["output_dir"], batch_settings["formats"]), tasks, workers)
+
+
+def add_batch_arguments(parser):
+    parser.add_argument("--batch", metavar="CARPETA", default=os.environ.get(BATCH_ENV),
+                        help="Guarda los gráficos en la carpeta en lugar de mostrarlos")
+    parser.add_argument("--formats", default=os.environ.get(FORMATS_ENV, "png"),
+                        help="Formatos separados por coma, por ejemplo png,svg,pdf")
+    parser.add_argument("--workers", type=int, default=None)
+    add_trace_arguments(parser)
+
+
+def configure_from_args(args):
+    configure_trace_from_args(args)
+    if args.batch:
+        configure_batch(args.batch, args.formats.split(","))
+
+
+if os.environ.get(BATCH_ENV):
+    configure_batch(os.environ[BATCH_ENV], os.environ.get(FORMATS_ENV, "png").split(","))
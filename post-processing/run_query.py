@@ -0,0 +1,408 @@
+import argparse
+import glob
+import json
+import os
+import re
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from dem.system import DEFAULTS
+from instrumentation import traced
+from parallel import parallel_map
+from sweep import DEFAULT_MANIFEST, RUNS_FOLDER, SWEEPS_FOLDER, Manifest, expand_variations, \
+    load_sweep
+from xyz_cache import is_fresh, load_column, load_frames, read_meta
+from xyz_format import HEADERS, find_xyz, is_compressed, iter_frame_lines, open_xyz, parse_frame_lines, \
+    run_filenames, snap_frame_times
+from xyz_index import load_index
+
+PLANS_FOLDER = "./out/sweeps"
+# Columnas calculadas a partir de las del .xyz, con las columnas que necesita cada una
+DERIVED = {
+    "speed": (["xVelocity", "yVelocity", "zVelocity"],
+              lambda data: np.sqrt(data["xVelocity"] ** 2 + data["yVelocity"] ** 2 + data["zVelocity"] ** 2)),
+    "kinetic_energy": (["mass", "xVelocity", "yVelocity", "zVelocity"],
+                       lambda data: 0.5 * data["mass"] * (data["xVelocity"] ** 2 + data["yVelocity"] ** 2 +
+                                                          data["zVelocity"] ** 2)),
+}
+# Opciones de la línea de comandos que no describen a la simulación, como la cama con la que arranca
+IGNORED_OPTIONS = ["-o", "-pFile", "-pGen", "-logs"]
+AGGREGATIONS = ["count", "sum", "mean", "std", "min", "max"]
+# Filas que se juntan antes de reducirlas a sumas parciales, para no tener una corrida entera en memoria
+CHUNK_ROWS = 1 << 20
+
+
+def option_column(option):
+    return option.lstrip('-')
+
+
+def sweep_definitions():
+    # Los barridos declarados y los que arma adaptive_planner.py con sus puntos
+    paths = sorted(glob.glob(os.path.join(SWEEPS_FOLDER, "*.json")))
+    paths += sorted(path for path in glob.glob(os.path.join(PLANS_FOLDER, "adaptive_*.json"))
+                    if not path.endswith(".state.json"))
+    definitions = []
+    for path in paths:
+        with open(path) as file:
+            definitions.append(json.load(file))
+    return definitions
+
+
+def catalog_filenames(folder):
+    # Corridas en .xyz, comprimidas o que sólo conservan el caché binario (compactadas a float32)
+    filenames = set(run_filenames(folder))
+    for directory in glob.glob(os.path.join(folder, "*.cache")):
+        filename = directory[:-len(".cache")]
+        if read_meta(filename) is not None:
+            filenames.add(filename)
+    return sorted(filename for filename in filenames if not filename.endswith('.old'))
+
+
+def run_catalog(folder=RUNS_FOLDER, manifest_path=DEFAULT_MANIFEST):
+    # Una fila por corrida: variación, repetición, barrido y los parámetros de la simulación como columnas. Los
+    # parámetros salen del manifiesto o, para corridas anteriores a él, de las definiciones de los barridos; lo que
+    # una corrida no fija toma el valor por defecto del simulador.
+    manifest = Manifest(manifest_path).entries
+    declared = {}
+    for sweep in sweep_definitions():
+        for variation in expand_variations(sweep):
+            args = {**sweep.get("base_args", {}), **variation["args"]}
+            declared.setdefault(variation["name"], (sweep["name"], args))
+    rows = []
+    for filename in catalog_filenames(folder):
+        run = os.path.basename(filename)
+        match = re.match(r'^(.*)_rep_(\d+)$', run)
+        variation, repetition = (match.group(1), int(match.group(2))) if match else (run, 0)
+        entry = manifest.get(run)
+        sweep, args = (entry["sweep"], entry["args"]) if entry is not None else declared.get(variation, (None, {}))
+        rows.append({"run": run, "filename": filename, "sweep": sweep, "variation": variation,
+                     "repetition": repetition, **{option_column(option): value for option, value in args.items()
+                                                   if option not in IGNORED_OPTIONS}})
+    catalog = pd.DataFrame(rows, columns=["run", "filename", "sweep", "variation", "repetition"] +
+                           sorted({key for row in rows for key in row} - {"run", "filename", "sweep", "variation",
+                                                                         "repetition"}))
+    for column in catalog.columns[5:]:
+        default = DEFAULTS.get(f"-{column}")
+        if default is not None:
+            catalog[column] = catalog[column].fillna(default)
+    return catalog
+
+
+def select_frames(times, start=None, end=None, at=None, time_interval=None):
+    # Índices de los frames elegidos y el tiempo con el que se informan. Con at, el frame más cercano a cada tiempo
+    # pedido si está a menos de medio paso de guardado: una corrida que terminó antes no aporta nada.
+    times = np.asarray(times, dtype=np.float64)
+    if time_interval:
+        indices, reported = snap_frame_times(times, time_interval)
+    elif at is not None and len(times):
+        at = np.asarray(at, dtype=np.float64)
+        nearest = np.clip(np.searchsorted(times, at), 0, len(times) - 1)
+        previous = np.clip(nearest - 1, 0, None)
+        nearest = np.where(np.abs(times[previous] - at) <= np.abs(times[nearest] - at), previous, nearest)
+        spacing = np.diff(times).mean() if len(times) > 1 else 0.0
+        close = np.abs(times[nearest] - at) <= spacing / 2
+        indices, reported = nearest[close], at[close]
+    else:
+        indices, reported = np.arange(len(times)), times
+    inside = np.ones(len(indices), dtype=bool)
+    if start is not None:
+        inside &= reported >= start
+    if end is not None:
+        inside &= reported <= end
+    return indices[inside], reported[inside]
+
+
+def cached_frames(filename, columns, particle_ids, frames):
+    # Del caché columnar sólo se leen, por mmap, las columnas pedidas de los frames elegidos
+    times, starts, counts = load_frames(filename)
+    indices, reported = select_frames(times, **frames)
+    stored = {column: load_column(filename, column) for column in columns}
+    ids = load_column(filename, "id")
+    for k, time in zip(indices, reported):
+        rows = slice(starts[k], starts[k] + counts[k])
+        if particle_ids is not None:
+            rows = starts[k] + np.flatnonzero(np.isin(ids[rows], particle_ids))
+        yield float(time), {column: np.asarray(stored[column][rows], dtype=np.float64) for column in columns}
+
+
+def indexed_frames(filename, columns, particle_ids, frames):
+    # Sin caché, el índice de frames dice dónde empieza cada frame elegido y sólo se parsean esos bytes. En un
+    # archivo comprimido no se puede saltar, así que se recorre una vez y se corta después del último frame elegido.
+    index = load_index(filename)
+    indices, reported = select_frames(index.times, **frames)
+    columns_at = [HEADERS.index(column) for column in columns]
+    ids = None if particle_ids is None else {str(int(particle_id)).encode() for particle_id in particle_ids}
+    if not is_compressed(find_xyz(filename)):
+        with index:
+            for k, time in zip(indices, reported):
+                values = index.frame(int(k))
+                if particle_ids is not None:
+                    values = values[np.isin(values[:, 0], particle_ids)]
+                yield float(time), dict(zip(columns, values[:, columns_at].T))
+        return
+    wanted = dict(zip(indices.tolist(), reported.tolist()))
+    if not wanted:
+        return
+    last = max(wanted)
+    with open_xyz(find_xyz(filename)) as (file, _):
+        for k, (_, lines) in enumerate(iter_frame_lines(file)):
+            if k in wanted:
+                values = parse_frame_lines(lines, ids, columns_at)
+                yield wanted[k], dict(zip(columns, values.T))
+            if k >= last:
+                return
+
+
+def run_frames(filename, columns, particle_ids=None, frames=None):
+    # Frames elegidos de una corrida con las columnas pedidas, del lector más barato disponible
+    frames = frames or {}
+    read = cached_frames if read_meta(filename) is not None and is_fresh(filename) else indexed_frames
+    raw = sorted({column for column in columns if column in HEADERS and column != "time"} |
+                 {needed for column in columns if column in DERIVED for needed in DERIVED[column][0]})
+    for time, data in read(filename, raw, particle_ids, frames):
+        data["time"] = np.full(len(next(iter(data.values()))) if data else 0, time)
+        for column in columns:
+            if column in DERIVED:
+                data[column] = DERIVED[column][1](data)
+        yield pd.DataFrame({column: data[column] for column in columns})
+
+
+def partial_sums(data, keys, metrics):
+    # Cantidad, suma, suma de cuadrados, mínimo y máximo por grupo; se combinan sumando (o con min y max) entre
+    # bloques y entre corridas
+    grouped = data.assign(**{f"{metric}__sq": data[metric] ** 2 for metric in metrics}).groupby(keys, sort=False)
+    parts = {}
+    for metric in metrics:
+        parts[f"{metric}__count"] = grouped[metric].count()
+        parts[f"{metric}__sum"] = grouped[metric].sum()
+        parts[f"{metric}__sq"] = grouped[f"{metric}__sq"].sum()
+        parts[f"{metric}__min"] = grouped[metric].min()
+        parts[f"{metric}__max"] = grouped[metric].max()
+    return pd.DataFrame(parts).reset_index()
+
+
+def combine_partials(partials, keys):
+    if not partials:
+        return None
+    data = pd.concat(partials, ignore_index=True)
+    functions = {column: column.rsplit("__", 1)[1] for column in data.columns if "__" in column}
+    return data.groupby(keys, sort=False).agg({column: "min" if function == "min" else "max" if function == "max"
+                                               else "sum" for column, function in functions.items()}).reset_index()
+
+
+@traced("query_run")
+def aggregate_run(filename, columns, keys, metrics, particle_ids=None, frames=None):
+    # Reduce la corrida de a bloques de CHUNK_ROWS filas; sólo quedan en memoria las sumas parciales por grupo
+    partials, chunk, rows = [], [], 0
+    for data in run_frames(filename, columns, particle_ids, frames):
+        chunk.append(data.assign(all=0))
+        rows += len(data)
+        if rows >= CHUNK_ROWS:
+            partials.append(partial_sums(pd.concat(chunk, ignore_index=True), keys, metrics))
+            chunk, rows = [], 0
+    if chunk:
+        partials.append(partial_sums(pd.concat(chunk, ignore_index=True), keys, metrics))
+    return combine_partials(partials, keys)
+
+
+@traced("query_run")
+def scan_run(filename, columns, particle_ids=None, frames=None):
+    data = list(run_frames(filename, columns, particle_ids, frames))
+    return pd.concat(data, ignore_index=True) if data else pd.DataFrame(columns=columns)
+
+
+def finish(totals, metrics, aggregations):
+    # De las sumas parciales a las estadísticas pedidas
+    result = totals[[column for column in totals.columns if "__" not in column]].copy()
+    for metric, function in aggregations:
+        count, total = totals[f"{metric}__count"], totals[f"{metric}__sum"]
+        if function == "count":
+            result[f"{metric}_count"] = count
+        elif function == "sum":
+            result[f"{metric}_sum"] = total
+        elif function == "mean":
+            result[f"{metric}_mean"] = total / count
+        elif function == "std":
+            variance = (totals[f"{metric}__sq"] - total ** 2 / count) / (count - 1)
+            result[f"{metric}_std"] = np.sqrt(variance.clip(lower=0))
+        else:
+            result[f"{metric}_{function}"] = totals[f"{metric}__{function}"]
+    return result
+
+
+class RunQuery:
+    # Todas las corridas como una sola tabla que no se lee hasta pedir el resultado. Los filtros por parámetros de
+    # la variación descartan corridas enteras; los de tiempo y partículas y la proyección de columnas se resuelven
+    # dentro de los lectores, así que de cada corrida sólo se lee lo que la consulta usa.
+    def __init__(self, catalog=None, columns=None, particle_ids=None, frames=None):
+        self.catalog = run_catalog() if catalog is None else catalog
+        self.columns = columns
+        self.particle_ids = particle_ids
+        self.frames = frames or {}
+
+    def _with(self, **changes):
+        options = {"catalog": self.catalog, "columns": self.columns, "particle_ids": self.particle_ids,
+                   "frames": self.frames}
+        return RunQuery(**{**options, **changes})
+
+    def where(self, **conditions):
+        # parámetro=valor, parámetro=[valores] o parámetro=(mínimo, máximo) sobre las columnas del catálogo
+        selected = np.ones(len(self.catalog), dtype=bool)
+        for column, condition in conditions.items():
+            if column not in self.catalog:
+                raise KeyError(f"No hay ninguna corrida con el parámetro {column}")
+            values = self.catalog[column]
+            if isinstance(condition, tuple):
+                low, high = condition
+                selected &= (values >= low if low is not None else True) & (values <= high if high is not None
+                                                                                 else True)
+            elif isinstance(condition, list):
+                selected &= values.isin(condition)
+            else:
+                selected &= values == condition
+        return self._with(catalog=self.catalog[selected])
+
+    def between(self, start=None, end=None):
+        return self._with(frames={**self.frames, "start": start, "end": end})
+
+    def at(self, *times):
+        return self._with(frames={**self.frames, "at": list(times)})
+
+    def sample(self, time_interval):
+        return self._with(frames={**self.frames, "time_interval": time_interval})
+
+    def particles(self, *particle_ids):
+        return self._with(particle_ids=list(particle_ids))
+
+    def select(self, *columns):
+        unknown = set(columns) - set(HEADERS) - set(DERIVED) - set(self.catalog.columns)
+        if unknown:
+            raise KeyError(f"Columnas desconocidas: {', '.join(sorted(unknown))}")
+        return self._with(columns=list(columns))
+
+    def _read_columns(self, extra=()):
+        # Columnas que hay que leer de las corridas; las del catálogo se agregan después, son constantes por corrida
+        requested = (self.columns or HEADERS) + list(extra)
+        return list(dict.fromkeys(["time", *[column for column in requested if column not in self.catalog.columns]]))
+
+    def _attach(self, data, run, columns):
+        for column in columns:
+            data[column] = run[column]
+        return data
+
+    def collect(self, workers=None):
+        # Las filas que pasan los filtros, con los parámetros de su corrida; pensado para consultas acotadas
+        columns = self._read_columns(["id"])
+        runs = parallel_map(partial(scan_run, columns=columns, particle_ids=self.particle_ids,
+                                    frames=self.frames), self.catalog["filename"].tolist(), workers)
+        run_columns = [column for column in self.catalog.columns if column != "filename"]
+        data = [self._attach(result, run, run_columns)
+                for result, (_, run) in zip(runs, self.catalog.iterrows()) if len(result)]
+        return pd.concat(data, ignore_index=True) if data else pd.DataFrame(columns=run_columns + columns)
+
+    def aggregate(self, by, aggregations, workers=None):
+        # aggregations: pares (columna, función). Cada corrida se reduce por separado y en paralelo a sumas
+        # parciales por grupo, que después se combinan por los parámetros pedidos en by.
+        metrics = list(dict.fromkeys(metric for metric, _ in aggregations))
+        for metric, function in aggregations:
+            if function not in AGGREGATIONS:
+                raise ValueError(f"Agregación desconocida {function}: se espera {'|'.join(AGGREGATIONS)}")
+        run_keys = [key for key in by if key in self.catalog.columns]
+        frame_keys = [key for key in by if key not in self.catalog.columns]
+        columns = self._read_columns(frame_keys + metrics)
+        # "all" es una clave constante, para que sin agrupar por frame cada corrida se reduzca a un solo grupo
+        partials = parallel_map(partial(aggregate_run, columns=columns, keys=frame_keys + ["all"], metrics=metrics,
+                                        particle_ids=self.particle_ids, frames=self.frames),
+                                self.catalog["filename"].tolist(), workers)
+        partials = [self._attach(result, run, run_keys)
+                    for result, (_, run) in zip(partials, self.catalog.iterrows()) if result is not None]
+        totals = combine_partials(partials, by + ["all"])
+        if totals is None:
+            return pd.DataFrame(columns=by + [f"{metric}_{function}" for metric, function in aggregations])
+        result = finish(totals, metrics, aggregations).drop(columns="all")
+        return result.sort_values(by).reset_index(drop=True) if by else result
+
+
+def parse_condition(text):
+    # "parámetro=valor", "parámetro=v1,v2" o "parámetro=mínimo:máximo" (un extremo vacío no acota)
+    column, _, value = text.partition("=")
+    if not value:
+        raise argparse.ArgumentTypeError(f"Condición inválida {text}: se espera parámetro=valor")
+
+    def number(token):
+        try:
+            return float(token)
+        except ValueError:
+            return token
+    if ":" in value:
+        low, high = value.split(":", 1)
+        return column, (float(low) if low else None, float(high) if high else None)
+    if "," in value:
+        return column, [number(token) for token in value.split(",")]
+    return column, number(value)
+
+
+def parse_aggregation(text):
+    # "columna:función", por ejemplo speed:mean
+    metric, _, function = text.partition(":")
+    if function not in AGGREGATIONS:
+        raise argparse.ArgumentTypeError(f"Agregación inválida {text}: se espera columna:{'|'.join(AGGREGATIONS)}")
+    return metric, function
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consulta todas las corridas como una sola tabla, con los parámetros "
+                                                 "de cada variación como columnas")
+    parser.add_argument("--folder", default=RUNS_FOLDER)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--sweep", action="append", default=None, help="Sólo las corridas de estos barridos")
+    parser.add_argument("--variation", action="append", default=None, help="Sólo las corridas de estas variaciones")
+    parser.add_argument("--where", type=parse_condition, action="append", default=[],
+                        help="Filtro por parámetro: pGamma=100, pGamma=100,150 o ballAngle=60:80")
+    parser.add_argument("--start", type=float, default=None, help="Tiempo inicial [s]")
+    parser.add_argument("--end", type=float, default=None, help="Tiempo final [s]")
+    parser.add_argument("--at", type=float, action="append", default=None, help="Frame más cercano a este tiempo [s]")
+    parser.add_argument("--time-interval", type=float, default=None, help="Un frame por intervalo de tiempo [s]")
+    parser.add_argument("--ids", default=None, help="Ids de las partículas, separados por coma (la bala es el 0)")
+    parser.add_argument("--columns", default=None, help="Columnas a devolver, separadas por coma")
+    parser.add_argument("--by", default="", help="Columnas por las que se agrupa, separadas por coma")
+    parser.add_argument("--agg", type=parse_aggregation, action="append", default=[],
+                        help="Agregación columna:función, por ejemplo speed:mean")
+    parser.add_argument("--output", default=None, help="Archivo .csv con el resultado")
+    parser.add_argument("--limit", type=int, default=50, help="Filas a mostrar en pantalla")
+    parser.add_argument("--list-runs", action="store_true", help="Muestra el catálogo de corridas y sale")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    query = RunQuery(run_catalog(args.folder, args.manifest))
+    if args.sweep:
+        # Por las variaciones del barrido y no por la columna sweep: una corrida puede ser parte de varios barridos
+        query = query.where(variation=[variation["name"] for name in args.sweep
+                                       for variation in expand_variations(load_sweep(name))])
+    if args.variation:
+        query = query.where(variation=args.variation)
+    if args.where:
+        query = query.where(**dict(args.where))
+    if args.list_runs:
+        print(query.catalog.drop(columns="filename").to_string(index=False))
+        raise SystemExit(0)
+    if args.start is not None or args.end is not None:
+        query = query.between(args.start, args.end)
+    if args.at:
+        query = query.at(*args.at)
+    if args.time_interval:
+        query = query.sample(args.time_interval)
+    if args.ids:
+        query = query.particles(*[int(particle_id) for particle_id in args.ids.split(",")])
+    if args.columns:
+        query = query.select(*args.columns.split(","))
+    print(f"Consultando {len(query.catalog)} corridas")
+    by = [column for column in args.by.split(",") if column]
+    result = query.aggregate(by, args.agg, args.workers) if args.agg else query.collect(args.workers)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        result.to_csv(args.output, index=False)
+        print(f"{len(result)} filas escritas en {args.output}")
+    print(result.head(args.limit).to_string(index=False))
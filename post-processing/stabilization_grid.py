@@ -0,0 +1,186 @@
+import argparse
+import os
+from collections import deque
+from functools import partial
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from kinetic_energy_avg import frame_kinetic_energies
+from memo_store import memoized
+from parallel import default_workers, parallel_map
+from sweep import BED_DEFAULTS, expand_variations, load_sweep
+from variation_analysis import variation_runs
+
+ANALYSIS_FOLDER = "./out/analysis"
+# Valores con los que CannonballSystem arma KineticEnergyAndTimeCutCondition para el disparo
+DEFAULT_THRESHOLD = 1E-3
+DEFAULT_WINDOW = 1000
+DEFAULT_MINIMUM_TIME = 0.6
+
+
+def window_frames(window_steps, dt, save_interval):
+    # El simulador evalúa la condición en cada paso dt, pero sólo tenemos la energía de los frames guardados.
+    # La ventana de averageSize pasos se traduce a la misma duración en frames.
+    return max(1, int(round(window_steps * dt / save_interval)))
+
+
+def save_interval_of(times):
+    return float(np.median(np.diff(times))) if len(times) > 1 else 1.0
+
+
+def variation_deviations(energies, window):
+    # |promedio de las window energías anteriores - energía actual|; infinito mientras la ventana se llena
+    deviations = np.full(len(energies), np.inf)
+    if len(energies) > window:
+        sums = np.cumsum(np.concatenate([[0.0], energies]))
+        averages = (sums[window:-1] - sums[:-window - 1]) / window
+        deviations[window:] = np.abs(averages - energies[window:])
+    return deviations
+
+
+def first_below(values, thresholds, strict):
+    # Primer índice donde values < threshold (o <=) para cada umbral, usando el mínimo acumulado, que no crece.
+    # Devuelve len(values) si ningún valor cumple.
+    running_min = np.minimum.accumulate(values) if len(values) else values
+    return np.searchsorted(-running_min, -np.asarray(thresholds), side='right' if strict else 'left')
+
+
+def stabilization_grid(times, energies, thresholds, windows, minimum_times, dt=BED_DEFAULTS["-dt"],
+                       cutoff_time=None):
+    # Reproduce KineticEnergyAndTimeCutCondition sobre la serie guardada para toda la grilla a la vez.
+    # Corta en el primer frame con tiempo > minimum_time y energía <= umbral, o con la energía a menos del umbral del
+    # promedio de la ventana. Devuelve un arreglo (umbrales x ventanas x tiempos mínimos) con el tiempo de corte, o
+    # NaN si la corrida terminó antes de que se cumpliera la condición.
+    times = np.asarray(times, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    save_interval = save_interval_of(times)
+    cut = len(times) if cutoff_time is None else int(np.searchsorted(times, cutoff_time, side='left'))
+    result = np.full((len(thresholds), len(windows), len(minimum_times)), np.nan)
+    for j, window in enumerate(windows):
+        deviations = variation_deviations(energies, window_frames(window, dt, save_interval))
+        for k, minimum_time in enumerate(minimum_times):
+            start = int(np.searchsorted(times, minimum_time, side='right'))
+            by_energy = first_below(energies[start:], thresholds, strict=False)
+            by_variation = first_below(deviations[start:], thresholds, strict=True)
+            stop = start + np.minimum(by_energy, by_variation)
+            # Si se llega al tiempo de corte antes, la simulación termina ahí
+            stop = np.minimum(stop, cut)
+            found = stop < len(times)
+            result[found, j, k] = times[stop[found]]
+            # Antes de minimum_time el simulador congela la ventana en los pasos con variación chica, así que desde ahí
+            # la ventana deja de ser la de los frames anteriores. Esas combinaciones se recorren frame a frame.
+            frozen = thresholds > np.min(deviations[:min(start, cut)], initial=np.inf)
+            for i in np.flatnonzero(frozen):
+                result[i, j, k] = stabilization_reference(times, energies, thresholds[i], window, minimum_time, dt,
+                                                          cutoff_time)
+    return result
+
+
+def stabilization_reference(times, energies, threshold, window, minimum_time, dt=BED_DEFAULTS["-dt"],
+                            cutoff_time=None):
+    # Traducción directa de KineticEnergyAndTimeCutCondition.isFinished, frame a frame
+    size = window_frames(window, dt, save_interval_of(times))
+    last_energies = deque()
+    total = 0.0
+    for time, energy in zip(times, energies):
+        if cutoff_time is not None and time >= cutoff_time:
+            return time
+        if len(last_energies) < size:
+            last_energies.append(energy)
+            total += energy
+        else:
+            if abs(total / size - energy) < threshold:
+                if time > minimum_time:
+                    return time
+                continue
+            total += energy - last_energies.popleft()
+            last_energies.append(energy)
+        if time > minimum_time and energy <= threshold:
+            return time
+    return np.nan
+
+
+def run_energies(filename):
+    return memoized(frame_kinetic_energies, [filename], {}, lambda: frame_kinetic_energies(filename))
+
+
+def run_stabilization_grid(filename, thresholds, windows, minimum_times, dt, cutoff_time=None):
+    times, energies = run_energies(filename)
+    return stabilization_grid(times, energies, thresholds, windows, minimum_times, dt, cutoff_time)
+
+
+def grid_table(results, thresholds, windows, minimum_times):
+    # Pasa los arreglos por corrida a una tabla larga (variación, repetición, umbral, ventana, tiempo mínimo, tiempo)
+    grid = list(product(thresholds, windows, minimum_times))
+    rows = []
+    for (variation, repetition), result in results.items():
+        for (threshold, window, minimum_time), time in zip(grid, result.reshape(-1)):
+            rows.append((variation, repetition, threshold, window, minimum_time, time))
+    return pd.DataFrame(rows, columns=["variation", "repetition", "threshold", "window", "minimum_time",
+                                       "stabilization_time"])
+
+
+def sweep_stabilization_grid(sweep, thresholds, windows, minimum_times, cutoff_time=None, workers=None):
+    runs = variation_runs(sweep)
+    tasks = []
+    for variation in expand_variations(sweep):
+        dt = {**BED_DEFAULTS, **variation["args"]}["-dt"]
+        for repetition, filename in enumerate(runs.get(variation["name"], [])):
+            tasks.append((variation["name"], repetition, filename, dt))
+    print(f"Evaluando {len(thresholds) * len(windows) * len(minimum_times)} combinaciones en {len(tasks)} corridas "
+          f"de {sweep['name']}")
+    results = parallel_map(partial(grid_task, thresholds=thresholds, windows=windows, minimum_times=minimum_times,
+                                   cutoff_time=cutoff_time), tasks, workers)
+    return grid_table({(task[0], task[1]): result for task, result in zip(tasks, results)},
+                      thresholds, windows, minimum_times)
+
+
+def grid_task(task, thresholds, windows, minimum_times, cutoff_time):
+    _, _, filename, dt = task
+    return run_stabilization_grid(filename, thresholds, windows, minimum_times, dt, cutoff_time)
+
+
+def summarize(table):
+    # Media y desvío por variación y combinación; "censored" cuenta las corridas que terminaron antes del corte
+    grouped = table.groupby(["variation", "threshold", "window", "minimum_time"], sort=False)["stabilization_time"]
+    summary = grouped.agg(['mean', 'std', 'count'])
+    summary['censored'] = grouped.size() - summary['count']
+    return summary
+
+
+def float_list(text):
+    return [float(value) for value in text.split(",")]
+
+
+def int_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calcula tiempos de estabilización para una grilla de condiciones de corte sin volver a simular")
+    parser.add_argument("sweeps", nargs="+", help="Archivos .json de barrido o nombres de la carpeta sweeps")
+    parser.add_argument("--thresholds", type=float_list, default=[DEFAULT_THRESHOLD],
+                        help="Umbrales de energía separados por comas")
+    parser.add_argument("--windows", type=int_list, default=[DEFAULT_WINDOW],
+                        help="Tamaños de la ventana del promedio, en pasos del simulador, separados por comas")
+    parser.add_argument("--minimum-times", type=float_list, default=[DEFAULT_MINIMUM_TIME],
+                        help="Tiempos mínimos separados por comas")
+    parser.add_argument("--cutoff-time", type=float, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=ANALYSIS_FOLDER, help="Carpeta donde se guardan las tablas .csv")
+    args = parser.parse_args()
+
+    workers = default_workers() if args.workers is None else args.workers
+    os.makedirs(args.output, exist_ok=True)
+    for name in args.sweeps:
+        sweep = load_sweep(name)
+        table = sweep_stabilization_grid(sweep, args.thresholds, args.windows, args.minimum_times, args.cutoff_time,
+                                         workers)
+        table.to_csv(os.path.join(args.output, f"estabilizacion_{sweep['name']}.csv"), index=False)
+        summary = summarize(table)
+        summary.to_csv(os.path.join(args.output, f"estabilizacion_{sweep['name']}_resumen.csv"))
+        print(summary.to_string())
@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+from rendering import figure_filename, finish_figure
+
 
 def plot_avg_stabilization_times(times_dict, x_label, title):
     # Calculamos la media y la desviación estándar de los tiempos de estabilización para cada gamma
@@ -20,4 +22,4 @@ def plot_avg_stabilization_times(times_dict, x_label, title):
     ax.set_title(title, fontsize=20)
     ax.legend()  # Mostramos la leyenda
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    finish_figure(fig, title, f'estabilizacion_{figure_filename(x_label)}')
\ No newline at end of file
@@ -0,0 +1,234 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from xyz_cache import file_fingerprint, read_meta
+from xyz_format import find_xyz, is_compressed, xyz_path
+from xyz_index import load_index
+
+SWEEPS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sweeps")
+RUNS_FOLDER = "./out/runs"
+DEFAULT_JAR = "build/libs/ss-final-1.0.jar"
+DEFAULT_MANIFEST = "./out/sweeps/manifest.json"
+INIT_PARTICLES_FOLDER = "./out/init-particles"
+BEDS_FOLDER = os.path.join(INIT_PARTICLES_FOLDER, "beds")
+
+# Parámetros que cambian la cama de partículas estabilizada, con sus valores por defecto de Main.kt. Los de la bala no
+# están porque sólo actúan en el impacto. -pKn, -pKt y -pGamma sí: además de amortiguar el asentamiento, la cama se
+# guarda serializando cada Particle con su kn, kt y gamma, y al cargarla con -pFile el simulador usa esos valores y no
+# los de la línea de comandos, así que compartir la cama entre gammas correría el impacto con el gamma de la cama.
+BED_DEFAULTS = {
+    "-n": 2000, "-pld": 0.015, "-pud": 0.03, "-pMass": 0.085, "-pKn": 2E6, "-pKt": 4E6, "-pGamma": 100.0,
+    "-wallKn": 2E6, "-wallKt": 4E6, "-wallGamma": 200.0, "-bw": 0.4, "-bh": 1.0, "-g": 9.81, "-dt": 0.00005,
+    "-pStableTime": 0.7, "-pStableEnergy": 1E-3,
+}
+
+
+def load_sweep(path):
+    # Acepta tanto una ruta a un .json como el nombre de un barrido de la carpeta sweeps
+    if not os.path.exists(path):
+        path = os.path.join(SWEEPS_FOLDER, f"{path}.json")
+    with open(path) as file:
+        return json.load(file)
+
+
+def expand_variations(sweep):
+    # Las variaciones pueden venir listadas explícitamente o como una grilla de parámetros con un nombre plantilla
+    variations = list(sweep.get("variations", []))
+    grid = sweep.get("grid", {})
+    if grid:
+        options = list(grid)
+        for values in itertools.product(*(grid[option] for option in options)):
+            args = dict(zip(options, values))
+            name = sweep["name_template"].format(**{option.lstrip('-'): value for option, value in args.items()})
+            variations.append({"name": name, "args": args})
+    return variations
+
+
+def variation_jobs(sweep, variation, repetitions):
+    base_args = sweep.get("base_args", {})
+    return [{
+        "sweep": sweep["name"],
+        "variation": variation["name"],
+        "repetition": rep,
+        "output": f"{variation['name']}_rep_{rep}",
+        "args": {**base_args, **variation["args"]},
+    } for rep in repetitions]
+
+
+def sweep_jobs(sweep):
+    return [job for variation in expand_variations(sweep)
+            for job in variation_jobs(sweep, variation, range(sweep.get("repetitions", 1)))]
+
+
+def bed_key(job):
+    # La semilla es la repetición: la repetición i de cada variación comparte cama, y las repeticiones siguen
+    # siendo independientes entre sí
+    params = {option: float(job["args"].get(option, default)) for option, default in BED_DEFAULTS.items()}
+    params["seed"] = job.get("bed_seed", job["repetition"])
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def bed_path(key):
+    return os.path.join(BEDS_FOLDER, f"{key}.dat")
+
+
+def with_bed(job, key):
+    # El simulador carga out/init-particles/<pFile>.dat
+    return {**job, "bed": key, "args": {**job["args"], "-pFile": f"beds/{key}"}}
+
+
+def store_bed(job, key):
+    # La corrida que generó la cama la dejó estabilizada en out/init-particles/stable-particles-<salida>.dat
+    generated = os.path.join(INIT_PARTICLES_FOLDER, f"stable-particles-{job['output']}.dat")
+    if os.path.exists(generated):
+        shutil.copyfile(generated, f"{bed_path(key)}.tmp")
+        os.replace(f"{bed_path(key)}.tmp", bed_path(key))
+
+
+def plan_beds(jobs):
+    # Separa los trabajos en los que tienen que generar una cama nueva y los que pueden reutilizar una
+    producers = []
+    consumers = []
+    seen = set()
+    for job in jobs:
+        key = bed_key(job)
+        if "-pFile" in job["args"] or os.path.exists(bed_path(key)) or key in seen:
+            consumers.append(job)
+        else:
+            seen.add(key)
+            producers.append({**job, "bed": key, "args": {**job["args"], "-pGen": "true"}})
+    return producers, consumers
+
+
+def job_command(job, jar, memory_per_job=None):
+    cmd = ["java"]
+    if memory_per_job:
+        cmd.append(f"-Xmx{memory_per_job}")
+    cmd += ["-jar", jar, "-o", job["output"]]
+    for option, value in job["args"].items():
+        cmd += [option, str(value)]
+    return cmd
+
+
+def parse_memory(memory):
+    units = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+    suffix = memory[-1].lower()
+    return int(float(memory[:-1]) * units[suffix]) if suffix in units else int(memory)
+
+
+def default_job_slots(cores_per_job, memory_per_job):
+    # Cada JVM usa varios hilos, así que limitamos por núcleos y por memoria física disponible
+    by_cores = (os.cpu_count() or 1) // cores_per_job
+    try:
+        total_memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        by_memory = total_memory // parse_memory(memory_per_job)
+    except (ValueError, OSError, AttributeError):
+        by_memory = by_cores
+    return max(1, min(by_cores, by_memory))
+
+
+class Manifest:
+    # Registro persistente de cada trabajo: parámetros, código de salida, duración y huella del .xyz generado
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries = json.load(file)
+
+    def record(self, job, **fields):
+        with self.lock:
+            self.entries[job["output"]] = {**self.entries.get(job["output"], {}), **job, **fields}
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(self.entries, file, indent=2)
+        os.replace(tmp, self.path)
+
+
+def run_is_complete(job, manifest):
+    filename = os.path.join(RUNS_FOLDER, job["output"])
+    source = find_xyz(filename)
+    if is_compressed(source):
+        # xyz_compact.py sólo compacta corridas con el último frame entero
+        return True
+    try:
+        fingerprint = file_fingerprint(source)
+    except FileNotFoundError:
+        # Sin el .xyz puede quedar el caché binario, si la corrida se compactó a float32
+        return read_meta(filename) is not None
+    entry = manifest.entries.get(job["output"])
+    if entry is not None:
+        return entry.get("exit_status") == 0 and entry.get("fingerprint") == fingerprint
+    # Corridas previas al manifiesto: las damos por completas si el último frame está entero
+    index = load_index(filename)
+    return len(index) > 0 and index.end == fingerprint["size"]
+
+
+def run_job(job, jar, manifest, memory_per_job=None, retries=0, logs_folder="./out/sweeps/logs"):
+    os.makedirs(logs_folder, exist_ok=True)
+    cmd = job_command(job, jar, memory_per_job)
+    for attempt in range(1, retries + 2):
+        print(f"Simulando {job['output']} (intento {attempt})")
+        manifest.record(job, status="running", attempt=attempt, command=cmd, started_at=time.time())
+        start = time.time()
+        with open(os.path.join(logs_folder, f"{job['output']}.log"), "w") as log:
+            exit_status = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT).returncode
+        wall_time = time.time() - start
+        if exit_status == 0:
+            fingerprint = file_fingerprint(xyz_path(os.path.join(RUNS_FOLDER, job["output"])))
+            manifest.record(job, status="done", exit_status=0, wall_time=wall_time, fingerprint=fingerprint)
+            return exit_status
+        manifest.record(job, status="failed", exit_status=exit_status, wall_time=wall_time)
+        print(f"Falló {job['output']} con código {exit_status}")
+    return exit_status
+
+
+def run_batch(jobs, jar, manifest, workers, memory_per_job, retries):
+    # Cada hilo sólo espera a su proceso java, así que alcanza con un pool de hilos
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda job: run_job(job, jar, manifest, memory_per_job, retries), jobs))
+
+
+def run_jobs(jobs, jar=DEFAULT_JAR, workers=None, manifest_path=DEFAULT_MANIFEST, resume=False, retries=0,
+             memory_per_job="2g", cores_per_job=4, reuse_beds=True):
+    manifest = Manifest(manifest_path)
+    if resume:
+        pending = [job for job in jobs if not run_is_complete(job, manifest)]
+        print(f"Salteando {len(jobs) - len(pending)} trabajos ya completos")
+    else:
+        pending = list(jobs)
+    workers = default_job_slots(cores_per_job, memory_per_job) if workers is None else workers
+    print(f"Ejecutando {len(pending)} trabajos con {workers} simulaciones en paralelo")
+
+    if reuse_beds:
+        # Primero generamos una cama por cada clave que falta y después corremos el resto cargándolas con -pFile
+        os.makedirs(BEDS_FOLDER, exist_ok=True)
+        producers, consumers = plan_beds(pending)
+        print(f"Generando {len(producers)} camas de partículas nuevas")
+        statuses = run_batch(producers, jar, manifest, workers, memory_per_job, retries)
+        for job, status in zip(producers, statuses):
+            if status == 0:
+                store_bed(job, job["bed"])
+        consumers = [with_bed(job, bed_key(job)) if os.path.exists(bed_path(bed_key(job))) else job
+                     for job in consumers]
+        pending = producers + consumers
+        statuses += run_batch(consumers, jar, manifest, workers, memory_per_job, retries)
+    else:
+        statuses = run_batch(pending, jar, manifest, workers, memory_per_job, retries)
+
+    failed = [job["output"] for job, status in zip(pending, statuses) if status != 0]
+    if failed:
+        print(f"Trabajos fallidos: {', '.join(failed)}")
+    return failed
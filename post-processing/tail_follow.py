@@ -0,0 +1,133 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from kinetic_energy_avg import kinetic_energy_stats_by_frames
+from read_xyz import repetition_filenames, snap_to_time_grid
+from xyz_format import HEADERS, find_xyz, is_compressed, iter_frame_lines, open_xyz, parse_frame_lines
+
+ID, VX, VY, VZ, MASS = (HEADERS.index(column) for column in ["id", "xVelocity", "yVelocity", "zVelocity", "mass"])
+SERIES = ["times", "kinetic_energies", "cannonball_velocities"]
+
+
+def checkpoint_path(filename):
+    return f'{filename}.tail.npz'
+
+
+def empty_checkpoint(stat):
+    checkpoint = {"offset": 0, "inode": stat.st_ino, "device": stat.st_dev}
+    checkpoint.update({series: np.empty(0) for series in SERIES})
+    return checkpoint
+
+
+def load_checkpoint(filename, stat):
+    path = checkpoint_path(filename)
+    if not os.path.exists(path):
+        return empty_checkpoint(stat)
+    with np.load(path) as stored:
+        checkpoint = {key: stored[key] for key in stored.files}
+    checkpoint["offset"] = int(checkpoint["offset"])
+    # El simulador renombra la corrida anterior y crea un archivo nuevo: si cambió el inodo o se achicó, empezamos de cero
+    if int(checkpoint["inode"]) != stat.st_ino or int(checkpoint["device"]) != stat.st_dev or \
+            checkpoint["offset"] > stat.st_size:
+        return empty_checkpoint(stat)
+    return checkpoint
+
+
+def save_checkpoint(filename, checkpoint):
+    tmp = f'{checkpoint_path(filename)}.tmp.npz'
+    np.savez(tmp, **checkpoint)
+    os.replace(tmp, checkpoint_path(filename))
+
+
+def update_checkpoint(filename):
+    # Procesa sólo los frames completos agregados desde la última vez y actualiza las series acumuladas
+    path = find_xyz(filename)
+    stat = os.stat(path)
+    checkpoint = load_checkpoint(filename, stat)
+    if checkpoint["offset"] == stat.st_size:
+        return checkpoint, 0
+    # Una corrida comprimida ya terminó y en el stream comprimido no se puede saltar a un offset: se procesa entera
+    # una sola vez y el offset queda en el tamaño del archivo comprimido, así no se vuelve a leer
+    compressed = is_compressed(path)
+    if compressed:
+        checkpoint = empty_checkpoint(stat)
+
+    times, energies, velocities = [], [], []
+    with open_xyz(path) as (file, raw):
+        if not compressed:
+            file.seek(checkpoint["offset"])
+        for _, lines in iter_frame_lines(file):
+            block = parse_frame_lines(lines)
+            times.append(block[0, -1])
+            energies.append(0.5 * np.sum(block[:, MASS] * (block[:, VX] ** 2 + block[:, VY] ** 2 + block[:, VZ] ** 2)))
+            cannonball = block[block[:, ID] == 0]
+            velocities.append(np.linalg.norm(cannonball[0, [VX, VY, VZ]]) if len(cannonball) else np.nan)
+            # Sólo avanzamos el offset hasta el final del último frame completo
+            checkpoint["offset"] = raw.tell()
+    if compressed:
+        checkpoint["offset"] = stat.st_size
+
+    for series, values in zip(SERIES, [times, energies, velocities]):
+        checkpoint[series] = np.concatenate([checkpoint[series], values])
+    save_checkpoint(filename, checkpoint)
+    return checkpoint, len(times)
+
+
+def live_series(filename_variation, num_repetitions, series):
+    # (tiempos, valores) de las repeticiones que ya existen, aunque todavía se estén escribiendo
+    repetitions = []
+    for filename in repetition_filenames(filename_variation, num_repetitions):
+        if os.path.exists(find_xyz(filename)):
+            checkpoint, _ = update_checkpoint(filename)
+            if len(checkpoint["times"]):
+                repetitions.append((checkpoint["times"], checkpoint[series]))
+    return repetitions
+
+
+def get_kinetic_energy_avg_live(filename_variation, num_repetitions, time_interval):
+    repetitions = live_series(filename_variation, num_repetitions, "kinetic_energies")
+    return kinetic_energy_stats_by_frames(repetitions, time_interval) if repetitions else None
+
+
+def cannonball_velocity_stats_by_frames(repetitions, time_interval):
+    # Misma tabla que get_particle_velocity_avg (media y desviación de la velocidad de la bala por tiempo), a partir
+    # de la velocidad por frame que ya guarda el checkpoint
+    data = pd.concat([pd.DataFrame({'time': times, 'repetition': rep, 'total_velocity': velocities})
+                      for rep, (times, velocities) in enumerate(repetitions)], ignore_index=True)
+    # Igual que combine_repetitions, nos quedamos sólo hasta el menor tiempo final entre repeticiones
+    data = data[data['time'] <= min(times.max() for times, _ in repetitions)]
+    data = snap_to_time_grid(data, time_interval)
+    return data.groupby('time')['total_velocity'].agg(['mean', 'std'])
+
+
+def get_cannonball_velocity_avg_live(filename_variation, num_repetitions, time_interval):
+    repetitions = live_series(filename_variation, num_repetitions, "cannonball_velocities")
+    return cannonball_velocity_stats_by_frames(repetitions, time_interval) if repetitions else None
+
+
+def follow(filenames, interval):
+    while True:
+        for filename in filenames:
+            if not os.path.exists(find_xyz(filename)):
+                continue
+            checkpoint, new_frames = update_checkpoint(filename)
+            if new_frames:
+                print(f"{filename}: +{new_frames} frames, t = {checkpoint['times'][-1]:.3f} s, "
+                      f"energía cinética = {checkpoint['kinetic_energies'][-1]:.4e} J, "
+                      f"velocidad de bala = {checkpoint['cannonball_velocities'][-1]:.4f} m/s")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sigue corridas que todavía se están escribiendo")
+    parser.add_argument("filenames", nargs="+", help="Corridas sin la extensión .xyz (pueden estar comprimidas)")
+    parser.add_argument("--follow", type=float, default=None, metavar="SEGUNDOS",
+                        help="Vuelve a revisar los archivos cada tantos segundos")
+    args = parser.parse_args()
+    follow(args.filenames, args.follow)
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive_planner import METRICS, PlanState, initial_state, pending_jobs, plan_refinement, \
+    plan_repetitions, record_failures, summarize  # noqa: E402
+from sweep import Manifest, load_sweep  # noqa: E402
+
+TARGETS = {"stabilization_time": (0.05, False)}
+
+
+def measurements(state, means):
+    # Tres repeticiones por punto, con poca dispersión alrededor de la media pedida
+    return {name: pd.DataFrame([{METRICS[0]: mean + delta, METRICS[1]: 1.0} for delta in (-0.01, 0.0, 0.01)])
+            for name, mean in zip(sorted(state.points, key=lambda name: state.points[name]["value"]), means)}
+
+
+def test_gammas_sweep_gets_a_refinement_point(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sweep = load_sweep("gammas")
+    state = initial_state(str(tmp_path / "plan.state.json"), sweep, Manifest(str(tmp_path / "manifest.json")), 3)
+    # La respuesta salta entre gamma 100 y 125 y después queda plana
+    means = [1.0] + [2.0] * (len(state.points) - 1)
+    summary = summarize(state, measurements(state, means), TARGETS)
+    added = plan_refinement(sweep, state, summary, METRICS[0], 0.25, 0.0, 3, 50)
+    assert added == ["g_112.5"]
+    assert state.points["g_112.5"]["args"] == {"-pGamma": 112.5}
+    assert [job["output"] for job in pending_jobs(sweep, state, Manifest(str(tmp_path / "manifest.json")))
+            if job["variation"] == "g_112.5"] == ["g_112.5_rep_0", "g_112.5_rep_1", "g_112.5_rep_2"]
+
+
+def test_failed_runs_are_not_planned_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sweep = {"name": "mini", "grid": {"-pGamma": [100.0, 125.0]}, "name_template": "g_{pGamma:g}"}
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    state = PlanState(str(tmp_path / "plan.state.json"), "mini", "-pGamma",
+                      {f"g_{value}": {"args": {"-pGamma": float(value)}, "value": float(value), "repetitions": 3}
+                       for value in (100, 125)})
+    manifest.entries["g_100_rep_2"] = {"exit_status": 1}
+
+    assert record_failures(sweep, state, manifest) == {"g_100": [2]}
+    assert "g_100_rep_2" not in [job["output"] for job in pending_jobs(sweep, state, manifest)]
+    # Con dos repeticiones completas y una fallida el punto puede pedir un reemplazo, que es una repetición nueva
+    summary = summarize(state, {"g_100": pd.DataFrame({METRICS[0]: [1.0, 1.5], METRICS[1]: [1.0, 1.0]}),
+                                "g_125": pd.DataFrame(columns=METRICS)}, TARGETS)
+    assert plan_repetitions(state, summary, TARGETS, 10, 2) == {"g_100": 2}
+    assert record_failures(sweep, state, manifest) == {}
+    assert [job["output"] for job in pending_jobs(sweep, state, manifest) if job["variation"] == "g_100"] == \
+        ["g_100_rep_0", "g_100_rep_1", "g_100_rep_3", "g_100_rep_4"]
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_benchmark import synthetic_run  # noqa: E402
+from variation_analysis import analyze_sweep  # noqa: E402
+from xyz_compact import compact_run  # noqa: E402
+from xyz_format import xyz_path  # noqa: E402
+from xyz_index import read_last_time  # noqa: E402
+
+
+def test_analyze_sweep_after_float32_compaction(tmp_path, monkeypatch):
+    # Con --format float32 --remove-original sólo queda el caché; el análisis tiene que seguir leyendo la corrida
+    monkeypatch.chdir(tmp_path)
+    runs = os.path.join("out", "runs")
+    sweep = {"name": "compactado", "variations": [{"name": "v", "args": {}}], "repetitions": 2}
+    filenames = [os.path.join(runs, f"v_rep_{rep}") for rep in range(2)]
+    for rep, filename in enumerate(filenames):
+        synthetic_run(runs, os.path.basename(filename), 20, 40, seed=rep)
+    # Sin pasar por el memo, así la primera lectura de analyze_sweep es la de la corrida ya compactada
+    expected = [read_last_time(filename) for filename in filenames]
+
+    for filename in filenames:
+        assert compact_run(filename, "float32", remove_original=True)["removed"]
+        assert not os.path.exists(xyz_path(filename))
+    results = analyze_sweep(sweep, time_interval=0.01, workers=1)
+
+    assert results["v"]["stabilization_times"] == expected
+    assert None not in results["v"]["stabilization_times"]
@@ -0,0 +1,40 @@
+import functools
+import inspect
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import traced  # noqa: E402
+from kinetic_energy_avg import frame_kinetic_energies  # noqa: E402
+from memo_store import function_name, memoized  # noqa: E402
+
+
+def test_function_name_does_not_depend_on_main():
+    # La misma función, decorada como queda cuando kinetic_energy_avg.py se corre como script
+    function = inspect.unwrap(frame_kinetic_energies)
+    as_script = types.FunctionType(function.__code__, function.__globals__, function.__name__)
+    as_script.__module__ = "__main__"
+    as_script = traced("frame_kinetic_energies")(as_script)
+    assert function_name(frame_kinetic_energies) == "kinetic_energy_avg.frame_kinetic_energies"
+    assert function_name(as_script) == "kinetic_energy_avg.frame_kinetic_energies"
+    assert function_name(functools.partial(as_script, time_interval=None)) == \
+        "kinetic_energy_avg.frame_kinetic_energies"
+
+
+def test_failed_reads_are_not_stored(tmp_path):
+    filename = str(tmp_path / "faltante_rep_0")
+    with open(f"{filename}.xyz", "w") as file:
+        file.write("0\n")
+    calls = []
+
+    def failed_read():
+        calls.append(None)
+        return None, None
+    for _ in range(2):
+        assert memoized(failed_read, [filename], {}, failed_read, folder=str(tmp_path / "memo")) == (None, None)
+    assert len(calls) == 2
+    assert memoized(failed_read, [filename], {}, lambda: (1, 2), folder=str(tmp_path / "memo")) == (1, 2)
+    assert memoized(failed_read, [filename], {}, failed_read, folder=str(tmp_path / "memo")) == (1, 2)
+    assert len(calls) == 2
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from read_xyz import snap_to_time_grid  # noqa: E402
+
+
+def test_snap_each_repetition_with_its_own_drift():
+    # La repetición 1 guarda con una deriva distinta; juntas, sus tiempos quedarían a 0.0001 de los de la 0
+    rows = [{"id": particle, "time": time, "repetition": rep}
+            for rep, times in enumerate([[0.0, 0.001, 0.002], [0.0, 0.0011, 0.0021]])
+            for time in times for particle in range(2)]
+    data = pd.DataFrame(rows).sort_values(by=["time", "repetition"], kind="stable")
+    snapped = snap_to_time_grid(data, 0.001)
+    for rep in (0, 1):
+        assert snapped[snapped["repetition"] == rep]["time"].tolist() == [0.0, 0.0, 0.001, 0.001, 0.002, 0.002]
+    assert snapped["time"].is_monotonic_increasing
+    assert snapped["time"].unique().tolist() == [0.0, 0.001, 0.002]
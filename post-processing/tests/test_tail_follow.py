@@ -0,0 +1,39 @@
+import gzip
+import os
+import shutil
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tail_follow import get_cannonball_velocity_avg_live, update_checkpoint  # noqa: E402
+from xyz_format import HEADERS  # noqa: E402
+
+
+def write_run(filename, times, speed):
+    with open(f"{filename}.xyz", "w") as file:
+        for time in times:
+            file.write(f"2\n{' '.join(HEADERS)}\n")
+            file.write(f"1 0.1 0.2 0.3 0.0 0.0 0.0 0.01 0.085 0.0 {time}\n")
+            file.write(f"0 0.1 0.2 0.3 {speed * 0.6} 0.0 {-speed * 0.8} 0.1 17.5 0.0 {time}\n")
+
+
+def test_compressed_and_live_repetitions(tmp_path):
+    variation = str(tmp_path / "g_100")
+    write_run(f"{variation}_rep_0", [0.0, 0.001, 0.002], 2.0)
+    write_run(f"{variation}_rep_1", [0.0, 0.0011, 0.0019, 0.003], 4.0)
+    # La repetición 0 ya terminó y se comprimió
+    with open(f"{variation}_rep_0.xyz", "rb") as source, gzip.open(f"{variation}_rep_0.xyz.gz", "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.remove(f"{variation}_rep_0.xyz")
+
+    checkpoint, new_frames = update_checkpoint(f"{variation}_rep_0")
+    assert new_frames == 3
+    np.testing.assert_allclose(checkpoint["cannonball_velocities"], [2.0, 2.0, 2.0])
+    assert update_checkpoint(f"{variation}_rep_0")[1] == 0
+
+    stats = get_cannonball_velocity_avg_live(variation, 2, 0.001)
+    assert stats.index.tolist() == [0.0, 0.001, 0.002]
+    np.testing.assert_allclose(stats["mean"], [3.0, 3.0, 3.0])
+    assert update_checkpoint(f"{variation}_rep_1")[1] == 0
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from read_xyz import read_xyz  # noqa: E402
+from xyz_cache import is_fresh, load_frames, write_cache  # noqa: E402
+from xyz_format import HEADERS  # noqa: E402
+
+
+def write_run(filename, times, particles=3):
+    with open(f"{filename}.xyz", "w") as file:
+        for frame, time in enumerate(times):
+            file.write(f"{particles}\n{' '.join(HEADERS)}\n")
+            for particle in range(particles, 0, -1):
+                particle_id = particle % particles
+                file.write(f"{particle_id} {frame}.1 0.2 0.3 1.5 0.0 -2.25 0.01 0.085 {frame * 10.0} {time}\n")
+
+
+def test_frames_with_the_same_printed_time(tmp_path):
+    # Dos frames seguidos con el mismo tiempo redondeado no pueden correr el inicio de los frames siguientes
+    filename = str(tmp_path / "repetido_rep_0")
+    write_run(filename, [0.0, 0.001, 0.001, 0.002])
+    write_cache(filename)
+    times, starts, counts = load_frames(filename)
+    assert times.tolist() == [0.0, 0.001, 0.001, 0.002]
+    assert counts.tolist() == [3, 3, 3, 3]
+    assert starts.tolist() == [0, 3, 6, 9]
+
+
+def test_read_xyz_does_not_depend_on_the_cache(tmp_path):
+    filename = str(tmp_path / "tipos_rep_0")
+    write_run(filename, [0.0, 0.001, 0.002])
+    parsed, parsed_times = read_xyz(filename, use_cache=False)
+    write_cache(filename)
+    assert is_fresh(filename)
+    cached, cached_times = read_xyz(filename)
+    assert cached_times == parsed_times
+    assert (cached.dtypes == parsed.dtypes).all()
+    np.testing.assert_allclose(cached.to_numpy(), parsed.to_numpy(), rtol=2.0 ** -24)
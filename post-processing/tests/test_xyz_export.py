@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from read_xyz import read_xyz  # noqa: E402
+from xyz_export import export_path, export_run  # noqa: E402
+from xyz_format import HEADERS  # noqa: E402
+
+
+def test_frames_without_selected_particles_round_trip(tmp_path):
+    filename = str(tmp_path / "g_100_rep_0")
+    with open(f"{filename}.xyz", "w") as file:
+        for frame, particles in enumerate([[0, 1], [0, 1, 7], [0, 1], [7, 0]]):
+            file.write(f"{len(particles)}\n{' '.join(HEADERS)}\n")
+            for particle in particles:
+                file.write(f"{particle} 0.1 0.2 0.3 0.0 0.0 -1.0 0.01 0.085 0.0 {frame * 0.001}\n")
+    result = export_run(filename, folder=str(tmp_path / "exports"), particle_ids=[7])
+    assert (result["frames"], result["rows"], result["empty_frames"]) == (2, 2, 2)
+
+    exported = export_path(filename, str(tmp_path / "exports"))[:-len(".xyz")]
+    data, times = read_xyz(exported, use_cache=False)
+    assert times == [0.001, 0.003]
+    assert data["id"].tolist() == [7.0, 7.0]
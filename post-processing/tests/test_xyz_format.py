@@ -0,0 +1,35 @@
+import io
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xyz_format import BLOCK_ROWS, HEADERS, id_tokens, iter_frames, parse_frame_lines  # noqa: E402
+
+
+def frame_lines(frame, particles):
+    return [f"{particle} {frame}.015839929238987506 0.0135414680000866 1.0E-5 -0.07725228249653497 0.0 -2.25 "
+            f"0.010674144368516325 0.085 1869.6388578706603 {frame * 0.001}\n".encode() for particle in particles]
+
+
+def test_parse_frame_lines_matches_float():
+    lines = frame_lines(3, [2, 0, 1])
+    expected = np.array([[float(value) for value in line.split()] for line in lines])
+    np.testing.assert_allclose(parse_frame_lines(lines), expected, rtol=2.0 ** -51)
+    # Filtro de partículas y columnas en el orden pedido, aunque no sea el del archivo
+    projected = parse_frame_lines(lines, id_tokens([0]), [HEADERS.index("time"), HEADERS.index("id")])
+    assert projected.tolist() == [[0.003, 0.0]]
+    assert parse_frame_lines(lines, id_tokens([7])).shape == (0, len(HEADERS))
+
+
+def test_iter_frames_splits_blocks_into_frames():
+    # Suficientes frames para que la conversión se haga en más de un bloque
+    num_frames = BLOCK_ROWS // 1000 + 2
+    data = b''.join(f"1000\n{' '.join(HEADERS)}\n".encode() + b''.join(frame_lines(frame, range(1000)))
+                    for frame in range(num_frames))
+    frames = list(iter_frames(io.BytesIO(data), columns=["id", "time"]))
+    assert [time for time, _ in frames] == [frame * 0.001 for frame in range(num_frames)]
+    assert all(block.shape == (1000, 2) and (block[:, 1] == time).all() for time, block in frames)
+    assert frames[-1][1][:, 0].tolist() == list(range(1000))
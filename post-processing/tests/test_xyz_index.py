@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xyz_index  # noqa: E402
+from xyz_format import HEADERS  # noqa: E402
+from xyz_index import load_index  # noqa: E402
+
+
+def test_load_index_closes_the_npz(tmp_path, monkeypatch):
+    filename = str(tmp_path / "indice_rep_0")
+    with open(f"{filename}.xyz", "w") as file:
+        for frame in range(3):
+            file.write(f"1\n{' '.join(HEADERS)}\n0 0.1 0.2 0.3 0.0 0.0 -1.0 0.1 17.5 0.0 {frame * 0.001}\n")
+    opened = []
+    original_load = np.load
+
+    def tracked_load(*args, **kwargs):
+        opened.append(original_load(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(xyz_index.np, "load", tracked_load)
+    load_index(filename)
+    index = load_index(filename)
+    assert opened and all(stored.zip is None for stored in opened)
+    assert index.times.tolist() == [0.0, 0.001, 0.002]
+    assert index.frame(1)[0, -1] == 0.001
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from read_xyz import iter_xyz_frames
+from xyz_cache import is_fresh, read_meta
+from xyz_format import HEADERS
+from xyz_index import load_index
+
+# Columnas que cambian en cada frame; id, radio y masa son constantes por partícula y se guardan una sola vez
+FIELDS = ["xPosition", "yPosition", "zPosition", "xVelocity", "yVelocity", "zVelocity", "pressure"]
+POSITION = slice(0, 3)
+VELOCITY = slice(3, 6)
+PRESSURE = 6
+
+
+def frame_count(filename):
+    if is_fresh(filename):
+        return read_meta(filename)["frames"]
+    return len(load_index(filename))
+
+
+class Trajectory:
+    # Corrida completa como arreglo denso (frames x partículas x campos), ordenada por id de partícula
+    def __init__(self, times, ids, radius, mass, fields):
+        self.times = times
+        self.ids = ids
+        self.radius = radius
+        self.mass = mass
+        self.fields = fields
+
+    @classmethod
+    def from_file(cls, filename, dtype=np.float32, time_interval=None):
+        # Con time_interval sólo se cargan los frames de esa grilla; el arreglo se reserva para todos y se recorta al final
+        num_frames = frame_count(filename)
+        columns = ["id", *FIELDS, "radius", "mass"]
+        times = np.empty(num_frames)
+        fields = None
+        for k, (time, block) in enumerate(iter_xyz_frames(filename, columns=columns, time_interval=time_interval)):
+            if k == num_frames:
+                # El archivo creció mientras lo leíamos; nos quedamos con los frames que contamos al principio
+                break
+            order = np.argsort(block[:, 0], kind='stable')
+            block = block[order]
+            if fields is None:
+                ids = block[:, 0].astype(np.int32)
+                radius = block[:, -2].astype(dtype)
+                mass = block[:, -1].astype(dtype)
+                fields = np.empty((num_frames, len(block), len(FIELDS)), dtype=dtype)
+            elif len(block) != len(ids) or not np.array_equal(block[:, 0], ids):
+                raise ValueError(f"El frame {k} de {filename} no tiene las mismas partículas que el primero")
+            times[k] = time
+            fields[k] = block[:, 1:1 + len(FIELDS)]
+        if fields is None:
+            return cls(times[:0], np.empty(0, dtype=np.int32), np.empty(0, dtype), np.empty(0, dtype),
+                       np.empty((0, 0, len(FIELDS)), dtype=dtype))
+        return cls(times[:k + 1], ids, radius, mass, fields[:k + 1])
+
+    @property
+    def num_frames(self):
+        return len(self.times)
+
+    @property
+    def num_particles(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.times, self.ids, self.radius, self.mass, self.fields])
+
+    def positions(self):
+        return self.fields[:, :, POSITION]
+
+    def velocities(self):
+        return self.fields[:, :, VELOCITY]
+
+    def pressures(self):
+        return self.fields[:, :, PRESSURE]
+
+    def particle_index(self, particle_id):
+        k = int(np.searchsorted(self.ids, particle_id))
+        if k == len(self.ids) or self.ids[k] != particle_id:
+            raise KeyError(f"No existe la partícula {particle_id}")
+        return k
+
+    def speeds(self):
+        # Velocidad total de cada partícula en cada frame (frames x partículas)
+        return np.sqrt(np.einsum('fpc,fpc->fp', self.velocities(), self.velocities(), dtype=np.float64))
+
+    def particle_speeds(self, particle_id):
+        velocity = self.fields[:, self.particle_index(particle_id), VELOCITY].astype(np.float64)
+        return np.sqrt(np.sum(velocity ** 2, axis=1))
+
+    def kinetic_energies(self):
+        # Energía cinética total de cada frame, acumulada en float64
+        squared = np.einsum('fpc,fpc->fp', self.velocities(), self.velocities(), dtype=np.float64)
+        return 0.5 * squared @ self.mass.astype(np.float64)
+
+    def to_dataframe(self, repetition=None):
+        # Formato largo compatible con read_xyz (una fila por partícula y frame)
+        num_frames, num_particles = self.num_frames, self.num_particles
+        data = {
+            "id": np.tile(self.ids, num_frames),
+            **{field: self.fields[:, :, k].reshape(-1) for k, field in enumerate(FIELDS)},
+            "radius": np.tile(self.radius, num_frames),
+            "mass": np.tile(self.mass, num_frames),
+            "time": np.repeat(self.times, num_particles),
+        }
+        data_df = pd.DataFrame({header: data[header] for header in HEADERS})
+        if repetition is not None:
+            data_df['repetition'] = repetition
+        return data_df
@@ -0,0 +1,139 @@
+import argparse
+from functools import partial
+
+from instrumentation import stage
+from kinetic_energy_avg import frame_kinetic_energies, kinetic_energy_stats_by_frames, plot_all_kinetic_energies, \
+    plot_kinetic_energy_avg
+from memo_store import memoized, run_fingerprint
+from parallel import default_workers, parallel_map
+from particle_velocity_avg import get_particle_velocity_avg, plot_all_velocities, plot_particle_velocity_avg, \
+    read_particle_rows
+from read_xyz import combine_repetitions, repetition_filenames
+from rendering import add_batch_arguments, configure_from_args, render_figures
+from stabilization_time_avg import plot_avg_stabilization_times
+from sweep import RUNS_FOLDER, expand_variations, load_sweep
+from xyz_index import read_last_time
+
+DEFAULT_ANALYSIS = {
+    "label": "{name}",
+    "velocity_title": "Velocidad de bala con {name}",
+    "kinetic_title": "Energía cinética con {name}",
+    "x_label": "Variación",
+    "stabilization_title": "Tiempo promedio de estabilización",
+    "kinetic_comparison_title": "Comparación de energía cinética",
+    "velocity_comparison_title": "Comparación de velocidad de bala",
+}
+
+
+def run_exists(filename):
+    try:
+        run_fingerprint(filename)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def variation_runs(sweep):
+    # Corridas existentes de cada variación; las repeticiones que faltan se informan y se saltean
+    runs = {}
+    for variation in expand_variations(sweep):
+        filenames = repetition_filenames(f"{RUNS_FOLDER}/{variation['name']}", sweep.get("repetitions", 1))
+        runs[variation["name"]] = [filename for filename in filenames if run_exists(filename)]
+        for filename in sorted(set(filenames) - set(runs[variation["name"]])):
+            print(f"La corrida {filename} no fue encontrada.")
+    return runs
+
+
+def memo_task(function, params, filename):
+    return memoized(function, [filename], params, lambda: function(filename, **params))
+
+
+def memoized_map(function, filenames, params, workers=None):
+    # Sólo las corridas nuevas o modificadas se vuelven a procesar; el resto sale del memo en disco
+    return parallel_map(partial(memo_task, function, params), filenames, workers)
+
+
+def analyze_sweep(sweep, time_interval=0.01, particle_id=0, workers=None):
+    runs = variation_runs(sweep)
+    filenames = [filename for variation_files in runs.values() for filename in variation_files]
+    print(f"Analizando {len(filenames)} corridas de {sweep['name']}")
+    # Los frames se diezman al leer, así que cada corrida sólo parsea los frames de la grilla de time_interval
+    kinetic_series = dict(zip(filenames, memoized_map(frame_kinetic_energies, filenames,
+                                                      {"time_interval": time_interval}, workers)))
+    cannonball_rows = dict(zip(filenames, memoized_map(read_particle_rows, filenames,
+                                                       {"particle_id": particle_id, "time_interval": time_interval},
+                                                       workers)))
+    last_times = dict(zip(filenames, memoized_map(read_last_time, filenames, {}, workers)))
+
+    results = {}
+    for name, variation_files in runs.items():
+        if not variation_files:
+            continue
+        # Lo que se mide de cada variación es la agregación de sus repeticiones; la lectura se mide por archivo
+        with stage("variation", variation=name):
+            kinetic_stats = memoized(
+                kinetic_energy_stats_by_frames, variation_files, {"time_interval": time_interval},
+                lambda: kinetic_energy_stats_by_frames([kinetic_series[f] for f in variation_files], time_interval))
+            velocity_stats = memoized(
+                get_particle_velocity_avg, variation_files,
+                {"time_interval": time_interval, "particle_id": particle_id},
+                lambda: get_particle_velocity_avg(
+                    combine_repetitions([cannonball_rows[f] for f in variation_files])[0], particle_id, time_interval))
+            results[name] = {
+                "kinetic_energy": kinetic_stats,
+                "velocity": velocity_stats,
+                "stabilization_times": [last_times[f] for f in variation_files],
+            }
+    return results
+
+
+def variation_text(template, variation):
+    return template.format(name=variation["name"], **{option.lstrip('-'): value
+                                                      for option, value in variation["args"].items()})
+
+
+def plot_sweep(sweep, results, workers=None):
+    analysis = {**DEFAULT_ANALYSIS, **sweep.get("analysis", {})}
+    all_kinetic_energies = {}
+    all_velocities = {}
+    all_times = {}
+    figures = []
+    for variation in expand_variations(sweep):
+        if variation["name"] not in results:
+            continue
+        result = results[variation["name"]]
+        label = variation_text(analysis["label"], variation)
+        all_velocities[label] = result["velocity"]
+        all_kinetic_energies[label] = result["kinetic_energy"]
+        all_times[label] = result["stabilization_times"]
+        figures.append((plot_particle_velocity_avg,
+                        (result["velocity"], variation_text(analysis["velocity_title"], variation))))
+        figures.append((plot_kinetic_energy_avg,
+                        (result["kinetic_energy"], variation_text(analysis["kinetic_title"], variation))))
+    # Nombres de archivo por barrido, para que analizar varios barridos juntos no pise las comparaciones
+    figures.append((plot_all_kinetic_energies, (all_kinetic_energies, f"comparacion_energia_cinetica_{sweep['name']}",
+                                                analysis["kinetic_comparison_title"])))
+    figures.append((plot_all_velocities, (all_velocities, f"comparacion_velocidad_{sweep['name']}",
+                                          analysis["velocity_comparison_title"])))
+    figures.append((plot_avg_stabilization_times, (all_times, analysis["x_label"], analysis["stabilization_title"])))
+    render_figures(figures, workers)
+
+
+def main(default_sweeps=None):
+    parser = argparse.ArgumentParser(description="Analiza barridos de simulaciones con resultados memorizados")
+    parser.add_argument("sweeps", nargs="*" if default_sweeps else "+", default=default_sweeps,
+                        help="Archivos .json de barrido o nombres de la carpeta sweeps")
+    parser.add_argument("--time-interval", type=float, default=0.01)
+    parser.add_argument("--particle-id", type=int, default=0)
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+    workers = default_workers() if args.workers is None else args.workers
+    for name in args.sweeps:
+        sweep = load_sweep(name)
+        results = analyze_sweep(sweep, args.time_interval, args.particle_id, workers)
+        plot_sweep(sweep, results, workers)
+
+
+if __name__ == "__main__":
+    main()
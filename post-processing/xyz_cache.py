@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+from parallel import parallel_map
+from xyz_format import HEADERS, find_xyz, parse_xyz, run_filenames, snap_frame_times
+
+# Columnas físicas guardadas en float32; el id se guarda como int32 y el tiempo una sola vez por frame en float64
+FLOAT_COLUMNS = [header for header in HEADERS if header not in ("id", "time")]
+# La versión 2 guarda las filas por frame contadas al parsear y no a partir de los tiempos únicos
+CACHE_VERSION = 2
+
+
+def cache_dir(filename):
+    return f'{filename}.cache'
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_meta(filename):
+    try:
+        with open(os.path.join(cache_dir(filename), 'meta.json')) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def is_fresh(filename):
+    meta = read_meta(filename)
+    if meta is None:
+        return False
+    try:
+        fingerprint = file_fingerprint(find_xyz(filename))
+    except FileNotFoundError:
+        # Sin el .xyz original ni una versión comprimida el caché es lo único que queda, lo damos por válido aunque
+        # sea de una versión anterior
+        return True
+    return meta.get("version") == CACHE_VERSION and meta["source"] == fingerprint
+
+
+def write_cache(filename):
+    source = find_xyz(filename)
+    fingerprint = file_fingerprint(source)
+    values, times, counts = parse_xyz(source)
+    frame_counts = np.asarray(counts, dtype=np.int32)
+
+    # Escribimos en un directorio temporal y lo renombramos al final para no dejar un caché a medias
+    target = cache_dir(filename)
+    tmp = f'{target}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'id.npy'), values[:, 0].astype(np.int32))
+    for k, header in enumerate(HEADERS):
+        if header in FLOAT_COLUMNS:
+            np.save(os.path.join(tmp, f'{header}.npy'), values[:, k].astype(np.float32))
+    np.save(os.path.join(tmp, 'frame_times.npy'), np.asarray(times, dtype=np.float64))
+    np.save(os.path.join(tmp, 'frame_counts.npy'), frame_counts)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as file:
+        json.dump({"version": CACHE_VERSION, "source": fingerprint, "rows": len(values), "frames": len(times)}, file)
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(tmp, target)
+
+
+def load_column(filename, column):
+    return np.load(os.path.join(cache_dir(filename), f'{column}.npy'), mmap_mode='r')
+
+
+def load_frames(filename, time_interval=None):
+    # Tiempos, primera fila y cantidad de filas de cada frame, opcionalmente sólo los más cercanos a la grilla
+    directory = cache_dir(filename)
+    frame_times = np.load(os.path.join(directory, 'frame_times.npy'))
+    frame_counts = np.load(os.path.join(directory, 'frame_counts.npy')).astype(np.int64)
+    frame_starts = np.cumsum(frame_counts) - frame_counts
+    if time_interval is None:
+        return frame_times, frame_starts, frame_counts
+    indices, snapped = snap_frame_times(frame_times, time_interval)
+    return snapped, frame_starts[indices], frame_counts[indices]
+
+
+def load_cache(filename, columns=None, particle_ids=None, time_interval=None):
+    columns = HEADERS if columns is None else columns
+    times, starts, counts = load_frames(filename, time_interval)
+    if particle_ids is None and time_interval is None:
+        data = {column: np.repeat(times, counts) if column == "time" else load_column(filename, column)
+                for column in columns}
+        return data, times.tolist()
+
+    # Con filtros sólo materializamos las filas seleccionadas de cada columna
+    frame_of_row = np.repeat(np.arange(len(times)), counts)
+    rows = np.repeat(starts, counts) + np.arange(len(frame_of_row)) - np.repeat(np.cumsum(counts) - counts, counts)
+    if particle_ids is not None:
+        selected = np.isin(load_column(filename, "id")[rows], particle_ids)
+        rows = rows[selected]
+        frame_of_row = frame_of_row[selected]
+    data = {column: times[frame_of_row] if column == "time" else load_column(filename, column)[rows]
+            for column in columns}
+    return data, times.tolist()
+
+
+def iter_cache_frames(filename, columns=None, particle_ids=None, time_interval=None):
+    columns = HEADERS if columns is None else columns
+    times, starts, counts = load_frames(filename, time_interval)
+    ids = load_column(filename, "id")
+    stored = {column: load_column(filename, column) for column in columns if column != "time"}
+    for time, start, count in zip(times, starts, counts):
+        rows = slice(start, start + count)
+        if particle_ids is not None:
+            rows = start + np.flatnonzero(np.isin(ids[rows], particle_ids))
+        block = np.empty((count if particle_ids is None else len(rows), len(columns)))
+        for k, column in enumerate(columns):
+            block[:, k] = time if column == "time" else stored[column][rows]
+        yield float(time), block
+
+
+def ensure_cache(filename):
+    if not is_fresh(filename):
+        write_cache(filename)
+
+
+def convert_run(filename):
+    if is_fresh(filename):
+        print(f"Caché al día: {find_xyz(filename)}")
+        return
+    print(f"Convirtiendo {find_xyz(filename)}")
+    write_cache(filename)
+
+
+def convert_runs(folder, workers=None):
+    parallel_map(convert_run, run_filenames(folder), workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte las corridas .xyz a un caché binario columnar")
+    parser.add_argument("folder", nargs="?", default="./out/runs")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    convert_runs(args.folder, args.workers)
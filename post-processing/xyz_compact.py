@@ -0,0 +1,157 @@
+import argparse
+import gzip
+import itertools
+import json
+import os
+import shutil
+from functools import partial
+
+import numpy as np
+
+from parallel import parallel_map
+from xyz_cache import cache_dir, file_fingerprint, is_fresh, iter_cache_frames, read_meta, write_cache
+from xyz_format import CHUNK_SIZE, iter_frames, open_xyz, run_filenames, xyz_path, zstandard
+from xyz_index import index_path, load_index
+
+FORMATS = ["gz", "zst", "float32"]
+LEVELS = {"gz": 6, "zst": 10}
+# Tolerancia (relativa, absoluta) con la que se verifica cada formato contra el .xyz original. gz y zst guardan el
+# mismo texto, así que tienen que coincidir exacto; float32 redondea cada valor a 24 bits de mantisa, con un error
+# relativo de a lo sumo 2^-24, y lleva a cero los valores menores que el menor float32 normal.
+TOLERANCES = {"gz": (0.0, 0.0), "zst": (0.0, 0.0), "float32": (2.0 ** -24, float(np.finfo(np.float32).tiny))}
+
+
+def compressed_path(filename, fmt):
+    return f'{xyz_path(filename)}.{fmt}'
+
+
+def compressed_writer(raw, fmt, level):
+    if fmt == "gz":
+        # Con mtime=0 el mismo contenido da siempre el mismo archivo
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=level, mtime=0)
+    return zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=False)
+
+
+def compress(filename, fmt, level):
+    # Comprime el .xyz de a bloques en un temporal que se renombra al terminar, para no dejar un archivo a medias
+    if fmt == "zst" and zstandard is None:
+        raise RuntimeError("Para comprimir con zstd hace falta el paquete zstandard (pip install zstandard)")
+    target = compressed_path(filename, fmt)
+    tmp = f'{target}.tmp'
+    with open(xyz_path(filename), 'rb') as source, open(tmp, 'wb') as raw:
+        with compressed_writer(raw, fmt, level) as writer:
+            shutil.copyfileobj(source, writer, CHUNK_SIZE)
+    os.replace(tmp, target)
+    return os.path.getsize(target)
+
+
+def cache_size(filename):
+    directory = cache_dir(filename)
+    return sum(os.path.getsize(os.path.join(directory, entry)) for entry in os.listdir(directory))
+
+
+def decoded_frames(filename, fmt):
+    if fmt == "float32":
+        yield from iter_cache_frames(filename)
+        return
+    with open_xyz(compressed_path(filename, fmt)) as (file, _):
+        yield from iter_frames(file)
+
+
+def round_trip_error(filename, fmt):
+    # Recorre a la par, de a un frame, el .xyz y lo decodificado del formato compacto y devuelve el mayor error
+    # relativo. Falla si cambia la cantidad de frames, algún tiempo o id, o si un valor se pasa de la tolerancia.
+    relative_tolerance, absolute_tolerance = TOLERANCES[fmt]
+    worst = 0.0
+    with open(xyz_path(filename), 'rb') as file:
+        for original, decoded in itertools.zip_longest(iter_frames(file), decoded_frames(filename, fmt)):
+            if original is None or decoded is None:
+                raise ValueError("la cantidad de frames no coincide")
+            (time, expected), (decoded_time, values) = original, decoded
+            if time != decoded_time or expected.shape != values.shape or \
+                    not np.array_equal(expected[:, 0], values[:, 0]):
+                raise ValueError(f"el frame de t={time} no coincide")
+            error = np.abs(values - expected)
+            if np.any(error > relative_tolerance * np.abs(expected) + absolute_tolerance):
+                raise ValueError(f"el frame de t={time} se pasa de la tolerancia relativa {relative_tolerance:g}")
+            relative = np.divide(error, np.abs(expected), out=np.zeros_like(error), where=expected != 0)
+            worst = max(worst, float(relative.max(initial=0.0)))
+    return worst
+
+
+def retarget_sidecars(filename, previous, source):
+    # El caché y el índice describen el mismo contenido que el comprimido; los apuntamos a él para no tener que
+    # rearmarlos (el índice de un comprimido se arma descomprimiendo el archivo entero)
+    fingerprint = file_fingerprint(source)
+    meta = read_meta(filename)
+    if meta is not None and meta.get("source") == previous:
+        meta["source"] = fingerprint
+        with open(os.path.join(cache_dir(filename), 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+    path = index_path(filename)
+    if os.path.exists(path):
+        with np.load(path) as stored:
+            index = {key: stored[key] for key in stored.files}
+        if int(index["size"]) == previous["size"] and int(index["mtime_ns"]) == previous["mtime_ns"]:
+            index.update(size=fingerprint["size"], mtime_ns=fingerprint["mtime_ns"])
+            np.savez(path, **index)
+
+
+def compact_run(filename, fmt="gz", level=None, remove_original=False):
+    source = xyz_path(filename)
+    if not os.path.exists(source):
+        print(f"No hay un .xyz para compactar en {filename}")
+        return None
+    fingerprint = file_fingerprint(source)
+    index = load_index(filename)
+    if len(index) == 0 or index.end != fingerprint["size"]:
+        # Una corrida con el último frame a medias probablemente se siga escribiendo
+        print(f"Salteando {source}: el último frame está incompleto")
+        return None
+    print(f"Compactando {source} a {fmt}")
+    if fmt == "float32":
+        if not is_fresh(filename):
+            write_cache(filename)
+        size = cache_size(filename)
+    else:
+        size = compress(filename, fmt, LEVELS[fmt] if level is None else level)
+    row = {"run": os.path.basename(filename), "format": fmt, "original_bytes": fingerprint["size"],
+           "compact_bytes": size, "max_relative_error": None, "removed": False}
+    try:
+        row["max_relative_error"] = round_trip_error(filename, fmt)
+    except ValueError as error:
+        print(f"La verificación de {source} en {fmt} falló: {error}")
+        if fmt != "float32":
+            os.remove(compressed_path(filename, fmt))
+        return row
+    if remove_original and file_fingerprint(source) == fingerprint:
+        os.remove(source)
+        if fmt != "float32":
+            retarget_sidecars(filename, fingerprint, compressed_path(filename, fmt))
+        row["removed"] = True
+    return row
+
+
+def compact_runs(folder, fmt="gz", level=None, remove_original=False, workers=None):
+    compact = partial(compact_run, fmt=fmt, level=level, remove_original=remove_original)
+    rows = [row for row in parallel_map(compact, run_filenames(folder), workers) if row is not None]
+    for row in rows:
+        error = row["max_relative_error"]
+        status = "FALLÓ" if error is None else f"error relativo máximo {error:.2e}"
+        print(f"{row['run']}: {row['original_bytes'] / 1E6:.1f} MB -> {row['compact_bytes'] / 1E6:.1f} MB "
+              f"({row['original_bytes'] / max(row['compact_bytes'], 1):.1f}x), {status}"
+              f"{', original borrado' if row['removed'] else ''}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compacta las corridas .xyz y verifica que se decodifiquen igual")
+    parser.add_argument("folder", nargs="?", default="./out/runs")
+    parser.add_argument("--format", choices=FORMATS, default="gz",
+                        help="gz o zst (sin pérdida) o float32 (el caché binario, con pérdida)")
+    parser.add_argument("--level", type=int, default=None, help="Nivel de compresión de gz o zst")
+    parser.add_argument("--remove-original", action="store_true",
+                        help="Borra el .xyz de cada corrida que pasó la verificación")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    compact_runs(args.folder, args.format, args.level, args.remove_original, args.workers)
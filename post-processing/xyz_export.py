@@ -0,0 +1,160 @@
+import argparse
+import gzip
+import os
+from functools import partial
+
+import numpy as np
+
+from parallel import parallel_map
+from sweep import load_sweep
+from variation_analysis import variation_runs
+from xyz_format import HEADERS, TimeSampler, find_xyz, iter_frame_lines, open_xyz, parse_frame_lines
+
+EXPORTS_FOLDER = "./out/exports"
+POSITION_COLUMNS = [HEADERS.index(column) for column in ["xPosition", "yPosition", "zPosition"]]
+
+
+def parse_bounds(text):
+    # "xmin,xmax,ymin,ymax,zmin,zmax"; un límite vacío no recorta en ese sentido
+    values = [float(value) if value.strip() else np.nan for value in text.split(",")]
+    if len(values) != 6:
+        raise argparse.ArgumentTypeError("La región necesita seis límites: xmin,xmax,ymin,ymax,zmin,zmax")
+    bounds = np.array(values).reshape(3, 2)
+    bounds[np.isnan(bounds[:, 0]), 0] = -np.inf
+    bounds[np.isnan(bounds[:, 1]), 1] = np.inf
+    return bounds
+
+
+def ball_bounds(values, half_width):
+    # Columna de lado 2 * half_width centrada en la posición horizontal de la bala, a toda altura
+    ball = values[values[:, 0] == 0]
+    if not len(ball):
+        raise ValueError("El frame no tiene a la bala (id 0) para centrar la región")
+    x, y = ball[0, POSITION_COLUMNS[0]], ball[0, POSITION_COLUMNS[1]]
+    return np.array([[x - half_width, x + half_width], [y - half_width, y + half_width], [-np.inf, np.inf]])
+
+
+class FrameFilter:
+    # Elige las filas de cada frame por id y por región (con keep_ball la bala queda aunque salga de la región, para
+    # ver el impacto) y proyecta las columnas que se conservan sobre el texto original de cada fila, sin volver a
+    # formatear los números
+    def __init__(self, particle_ids=None, bounds=None, around_ball=None, keep_ball=True, columns=None):
+        self.particle_ids = None if particle_ids is None else np.asarray(particle_ids, dtype=np.float64)
+        self.bounds = bounds
+        self.around_ball = around_ball
+        self.keep_ball = keep_ball
+        self.indices = None if columns is None else [HEADERS.index(column) for column in columns]
+        self.header = " ".join(HEADERS if columns is None else columns)
+
+    def rows(self, lines):
+        if self.particle_ids is None and self.bounds is None and self.around_ball is None:
+            return lines
+        values = parse_frame_lines(lines)
+        selected = np.ones(len(values), dtype=bool)
+        if self.particle_ids is not None:
+            selected &= np.isin(values[:, 0], self.particle_ids)
+        if self.bounds is None and self.around_ball is not None:
+            # La región alrededor de la bala se fija con el primer frame exportado, así no se mueve entre frames
+            self.bounds = ball_bounds(values, self.around_ball)
+        if self.bounds is not None:
+            positions = values[:, POSITION_COLUMNS]
+            inside = np.all((positions >= self.bounds[:, 0]) & (positions <= self.bounds[:, 1]), axis=1)
+            selected &= inside | (self.keep_ball & (values[:, 0] == 0))
+        return [line for line, keep in zip(lines, selected) if keep]
+
+    def frame(self, lines):
+        rows = self.rows(lines)
+        if not rows:
+            # Un frame sin filas no se escribe: los lectores toman el tiempo del frame de su primera fila
+            return None
+        if self.indices is not None:
+            rows = [b" ".join(tokens[k] for k in self.indices) + b"\n" for tokens in map(bytes.split, rows)]
+        return b"".join([f"{len(rows)}\n{self.header}\n".encode(), *rows])
+
+
+def selected_frames(file, stride=1, start=None, end=None, time_interval=None):
+    # Frames que quedan por tiempo: dentro de [start, end], uno cada stride y, con time_interval, el más cercano a
+    # cada múltiplo. Los descartados no se parsean y pasado end se deja de leer.
+    sampler = TimeSampler(time_interval) if time_interval else None
+    kept = 0
+    for time, lines in iter_frame_lines(file, sampler):
+        if end is not None and time > end:
+            return
+        if start is not None and time < start:
+            continue
+        if kept % stride == 0:
+            yield time, lines
+        kept += 1
+
+
+def export_path(filename, folder, compress=False):
+    return os.path.join(folder, f"{os.path.basename(filename)}.xyz{'.gz' if compress else ''}")
+
+
+def export_run(filename, folder=EXPORTS_FOLDER, stride=1, start=None, end=None, time_interval=None, particle_ids=None,
+               bounds=None, around_ball=None, keep_ball=True, columns=None, compress=False):
+    # Recorre la corrida de a un frame y escribe la versión reducida; la memoria no depende del largo de la corrida
+    frame_filter = FrameFilter(particle_ids, bounds, around_ball, keep_ball, columns)
+    target = export_path(filename, folder, compress)
+    tmp = f"{target}.tmp"
+    os.makedirs(folder, exist_ok=True)
+    frames = rows = empty = 0
+    with open_xyz(find_xyz(filename)) as (file, _), (gzip.open if compress else open)(tmp, "wb") as output:
+        for _, lines in selected_frames(file, stride, start, end, time_interval):
+            block = frame_filter.frame(lines)
+            if block is None:
+                empty += 1
+                continue
+            output.write(block)
+            frames += 1
+            rows += block.count(b"\n") - 2
+    os.replace(tmp, target)
+    print(f"Exportados {frames} frames y {rows} filas de {filename} a {target}" +
+          (f" ({empty} frames sin partículas seleccionadas no se escribieron)" if empty else ""))
+    return {"run": os.path.basename(filename), "frames": frames, "rows": rows, "empty_frames": empty,
+            "bytes": os.path.getsize(target)}
+
+
+def kept_columns(drop):
+    dropped = [column for column in drop.split(",") if column] if drop else []
+    unknown = set(dropped) - set(HEADERS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Columnas desconocidas: {', '.join(sorted(unknown))}")
+    return None if not dropped else [column for column in HEADERS if column not in dropped]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta corridas reducidas (menos frames, una región, algunas "
+                                                 "partículas o columnas) para revisarlas en OVITO")
+    parser.add_argument("runs", nargs="*", help="Corridas sin la extensión .xyz")
+    parser.add_argument("--sweep", action="append", default=[], help="Exporta todas las corridas del barrido")
+    parser.add_argument("--output", default=EXPORTS_FOLDER)
+    parser.add_argument("--stride", type=int, default=1, help="Exporta uno de cada stride frames")
+    parser.add_argument("--start", type=float, default=None, help="Tiempo inicial [s]")
+    parser.add_argument("--end", type=float, default=None, help="Tiempo final [s]")
+    parser.add_argument("--time-interval", type=float, default=None, help="Un frame por intervalo de tiempo [s]")
+    parser.add_argument("--ids", default=None, help="Ids de las partículas a exportar, separados por coma")
+    parser.add_argument("--region", type=parse_bounds, default=None, help="xmin,xmax,ymin,ymax,zmin,zmax [m]")
+    parser.add_argument("--around-ball", type=float, default=None, metavar="MEDIO_LADO",
+                        help="Región de lado 2 * MEDIO_LADO centrada en la bala en el primer frame exportado")
+    parser.add_argument("--no-ball", action="store_true", help="No conserva la bala fuera de la región")
+    parser.add_argument("--drop", type=kept_columns, default=None, help="Columnas a descartar, separadas por coma")
+    parser.add_argument("--gzip", action="store_true", help="Escribe .xyz.gz, que OVITO lee directamente")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    filenames = list(args.runs)
+    for name in args.sweep:
+        filenames.extend(filename for variation_files in variation_runs(load_sweep(name)).values()
+                         for filename in variation_files)
+    if not filenames:
+        parser.error("Indicá al menos una corrida o un barrido con --sweep")
+    if args.stride < 1:
+        parser.error("--stride tiene que ser al menos 1")
+    particle_ids = None if args.ids is None else [int(particle_id) for particle_id in args.ids.split(",")]
+    export = partial(export_run, folder=args.output, stride=args.stride, start=args.start, end=args.end,
+                     time_interval=args.time_interval, particle_ids=particle_ids, bounds=args.region,
+                     around_ball=args.around_ball, keep_ball=not args.no_ball, columns=args.drop, compress=args.gzip)
+    results = parallel_map(export, filenames, args.workers)
+    print(f"{sum(result['frames'] for result in results)} frames en {len(results)} archivos, "
+          f"{sum(result['bytes'] for result in results) / 1E6:.1f} MB")
@@ -0,0 +1,241 @@
+import gzip
+import io
+import itertools
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import traced
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HEADERS = ["id", "xPosition", "yPosition", "zPosition", "xVelocity", "yVelocity", "zVelocity", "radius", "mass",
+           "pressure", "time"]
+
+
+# Variantes comprimidas que se leen igual que el .xyz, en orden de preferencia
+COMPRESSED_SUFFIXES = ['.zst', '.gz']
+CHUNK_SIZE = 1 << 20
+# Filas que se juntan antes de convertirlas a float. Cada llamada al tokenizer de pandas tiene un costo fijo de unos
+# milisegundos, así que convertimos varios frames de una vez en lugar de uno por uno.
+BLOCK_ROWS = 20_000
+
+
+def xyz_path(filename):
+    return f'{filename}.xyz'
+
+
+def find_xyz(filename):
+    # El .xyz de la corrida o, si se compactó, su versión comprimida. Sin ninguno devolvemos el .xyz, para que el
+    # error de archivo inexistente nombre el archivo que escribe el simulador.
+    path = xyz_path(filename)
+    for candidate in [path] + [f'{path}{suffix}' for suffix in COMPRESSED_SUFFIXES]:
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def run_filenames(folder):
+    # Corridas de la carpeta, en .xyz o comprimidas, sin las copias .old que deja el simulador
+    filenames = set()
+    for entry in os.listdir(folder):
+        for suffix in [''] + COMPRESSED_SUFFIXES:
+            if entry.endswith(f'.xyz{suffix}'):
+                filenames.add(os.path.join(folder, entry[:-len(f'.xyz{suffix}')]))
+    return sorted(filename for filename in filenames if not filename.endswith('.old'))
+
+
+def is_compressed(path):
+    return any(path.endswith(suffix) for suffix in COMPRESSED_SUFFIXES)
+
+
+@contextmanager
+def open_xyz(path):
+    # Devuelve el archivo descomprimido como un stream binario y el archivo crudo, cuya posición sirve para estimar
+    # el avance. Se descomprime de a bloques de CHUNK_SIZE, así que la memoria no crece con el tamaño del archivo.
+    with open(path, 'rb') as raw:
+        if path.endswith('.gz'):
+            with gzip.GzipFile(fileobj=raw) as file:
+                yield file, raw
+        elif path.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError(f"Para leer {path} hace falta el paquete zstandard (pip install zstandard)")
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=CHUNK_SIZE)
+            with io.BufferedReader(reader, buffer_size=CHUNK_SIZE) as file:
+                yield file, raw
+        else:
+            yield raw, raw
+
+
+def column_indices(columns):
+    return None if columns is None else [HEADERS.index(column) for column in columns]
+
+
+def id_tokens(particle_ids):
+    # Los ids se escriben como enteros, así que comparamos contra su representación en bytes
+    return None if particle_ids is None else {str(int(particle_id)).encode() for particle_id in particle_ids}
+
+
+def frame_time(lines):
+    return float(lines[0].rsplit(None, 1)[-1])
+
+
+def parse_rows(data, num_rows, indices=None):
+    # Convertimos las filas con el tokenizer en C de pandas, leyendo sólo las columnas pedidas. Su conversión de
+    # decimales puede diferir de strtod en el último bit, muy por debajo de la precisión de la simulación.
+    num_columns = len(HEADERS) if indices is None else len(indices)
+    if num_rows == 0:
+        return np.empty((0, num_columns))
+    usecols = None if indices is None else sorted(set(indices))
+    values = pd.read_csv(io.BytesIO(data), sep=' ', header=None, engine='c', dtype=np.float64,
+                         float_precision='legacy', usecols=usecols)
+    if indices is not None:
+        values = values[indices]
+    # Devolvemos un arreglo propio y escribible, no una vista de sólo lectura sobre el DataFrame
+    return values.to_numpy(copy=True).reshape(num_rows, num_columns)
+
+
+def filter_lines(lines, ids):
+    # Descartamos las filas de otras partículas antes de convertir nada a float
+    return lines if ids is None else [line for line in lines if line.split(None, 1)[0] in ids]
+
+
+def time_index(indices):
+    # Posición de la columna time entre las pedidas, o None si no se pidió
+    time_column = HEADERS.index("time")
+    if indices is None:
+        return time_column
+    return indices.index(time_column) if time_column in indices else None
+
+
+def parse_frame_lines(lines, ids=None, indices=None):
+    lines = filter_lines(lines, ids)
+    values = parse_rows(b''.join(lines), len(lines), indices)
+    time_column = time_index(indices)
+    if lines and time_column is not None:
+        # El tiempo del frame se convierte con float(), para que la columna coincida exactamente con él
+        values[:, time_column] = frame_time(lines)
+    return values
+
+
+class TimeSampler:
+    # Elige, a medida que se leen los tiempos de los frames, el frame más cercano a cada múltiplo de interval.
+    # Un frame se toma si está a menos de medio paso de guardado de su múltiplo, lo que tolera la deriva de timeToSave.
+    def __init__(self, interval):
+        self.interval = interval
+        self.previous = None
+        self.last_step = None
+
+    def accept(self, time):
+        step = round(time / self.interval)
+        tolerance = self.interval / 2 if self.previous is None else (time - self.previous) / 2
+        self.previous = time
+        if step == self.last_step or abs(time - step * self.interval) > tolerance:
+            return None
+        self.last_step = step
+        return round(step * self.interval, 12)
+
+
+def snap_frame_times(times, interval):
+    # Misma regla que TimeSampler pero sobre un arreglo de tiempos ya conocido; devuelve los índices elegidos y
+    # sus tiempos ajustados a la grilla
+    times = np.asarray(times, dtype=np.float64)
+    steps = np.rint(times / interval)
+    tolerance = np.empty_like(times)
+    tolerance[:1] = interval / 2
+    tolerance[1:] = np.diff(times) / 2
+    indices = np.flatnonzero(np.abs(times - steps * interval) <= tolerance)
+    first = np.ones(len(indices), dtype=bool)
+    first[1:] = steps[indices][1:] != steps[indices][:-1]
+    indices = indices[first]
+    return indices, np.round(steps[indices] * interval, 12)
+
+
+def iter_frame_lines(file, sampler=None):
+    # Recorremos el archivo (abierto en modo binario) frame a frame: cantidad, header de columnas y N filas.
+    # Con un sampler, los frames que no se eligen se saltean sin guardar ni convertir sus filas.
+    while True:
+        count_line = file.readline()
+        if not count_line.strip():
+            return
+        num_particles = int(count_line)
+        file.readline()  # Saltamos el header
+        first_line = file.readline()
+        if not first_line.endswith(b'\n'):
+            return
+        time = frame_time([first_line])
+        if sampler is not None:
+            snapped = sampler.accept(time)
+            if snapped is None:
+                if sum(1 for _ in itertools.islice(file, num_particles - 1)) < num_particles - 1:
+                    return
+                continue
+            time = snapped
+        lines = [first_line, *itertools.islice(file, num_particles - 1)]
+        if len(lines) < num_particles or not lines[-1].endswith(b'\n'):
+            # El último frame quedó a medio escribir, lo descartamos
+            return
+        yield time, lines
+
+
+def split_block(frames, indices, time_column):
+    # Convierte juntas las filas de varios frames y devuelve cada frame como una vista sobre el bloque. La columna
+    # time se pisa con el tiempo de cada frame: el ajustado a la grilla si hay sampler y, si no, el que convirtió
+    # float(), así coincide exactamente con la lista de tiempos aunque el tokenizer difiera en el último bit.
+    counts = [len(lines) for _, lines in frames]
+    values = parse_rows(b''.join(itertools.chain.from_iterable(lines for _, lines in frames)), sum(counts), indices)
+    if time_column is not None:
+        values[:, time_column] = np.repeat([time for time, _ in frames], counts)
+    stops = np.cumsum(counts)
+    for (time, _), start, stop in zip(frames, stops - counts, stops):
+        yield time, values[start:stop]
+
+
+def iter_frames(file, particle_ids=None, columns=None, time_interval=None):
+    ids = id_tokens(particle_ids)
+    indices = column_indices(columns)
+    sampler = TimeSampler(time_interval) if time_interval else None
+    time_column = time_index(indices)
+    frames = []
+    rows = 0
+    for time, lines in iter_frame_lines(file, sampler):
+        lines = filter_lines(lines, ids)
+        frames.append((time, lines))
+        rows += len(lines)
+        if rows >= BLOCK_ROWS:
+            yield from split_block(frames, indices, time_column)
+            frames = []
+            rows = 0
+    if frames:
+        yield from split_block(frames, indices, time_column)
+
+
+@traced("parse_xyz", rows=lambda result, *args, **kwargs: len(result[0]))
+def parse_xyz(filename_xyz, particle_ids=None, columns=None, time_interval=None):
+    file_size = os.path.getsize(filename_xyz)
+    num_columns = len(HEADERS if columns is None else columns)
+    values = np.empty((0, num_columns))
+    times = []
+    counts = []
+    filled = 0
+    with open_xyz(filename_xyz) as (file, raw):
+        for time, block in iter_frames(file, particle_ids, columns, time_interval):
+            if filled + len(block) > len(values):
+                # Estimamos la cantidad de filas restantes según los bytes leídos hasta ahora y reservamos de una vez.
+                # Usamos la posición en el archivo crudo, que en los comprimidos es la que se compara con su tamaño.
+                bytes_per_row = raw.tell() / (filled + len(block))
+                rows = filled + len(block) + int((file_size - raw.tell()) / bytes_per_row * 1.1) + len(block)
+                grown = np.empty((rows, num_columns))
+                grown[:filled] = values[:filled]
+                values = grown
+            values[filled:filled + len(block)] = block
+            filled += len(block)
+            times.append(time)
+            counts.append(len(block))
+    # Las filas de cada frame, que no se pueden deducir de la columna time si dos frames imprimen el mismo tiempo
+    return values[:filled], times, counts
@@ -0,0 +1,215 @@
+import itertools
+import mmap
+import os
+
+import numpy as np
+
+from instrumentation import traced
+from xyz_cache import file_fingerprint, is_fresh, load_frames, read_meta
+from xyz_format import CHUNK_SIZE, HEADERS, find_xyz, frame_time, is_compressed, open_xyz
+
+NEWLINE = ord('\n')
+
+
+def index_path(filename):
+    return f'{filename}.idx.npz'
+
+
+def skip_lines(buffer, start, num_lines, line_size_hint):
+    # Buscamos el final de las próximas num_lines líneas contando saltos de línea en bloque sobre el buffer
+    if num_lines == 0:
+        return start
+    size = len(buffer)
+    found = 0
+    pos = start
+    window = max(int(num_lines * line_size_hint * 1.2), 4096)
+    while pos < size:
+        end = min(pos + window, size)
+        newlines = np.flatnonzero(np.frombuffer(buffer, dtype=np.uint8, count=end - pos, offset=pos) == NEWLINE)
+        if found + len(newlines) >= num_lines:
+            return pos + int(newlines[num_lines - found - 1]) + 1
+        found += len(newlines)
+        pos = end
+    return None
+
+
+def scan_frames(buffer, start=0):
+    offsets, counts, times = [], [], []
+    pos = start
+    size = len(buffer)
+    line_size_hint = 200
+    while pos < size:
+        count_end = buffer.find(b'\n', pos)
+        if count_end < 0:
+            break
+        num_particles = int(buffer[pos:count_end])
+        header_end = buffer.find(b'\n', count_end + 1)
+        first_row_end = buffer.find(b'\n', header_end + 1) if header_end >= 0 else -1
+        if first_row_end < 0:
+            break
+        frame_end = skip_lines(buffer, first_row_end + 1, num_particles - 1, line_size_hint)
+        if frame_end is None:
+            # El último frame quedó a medio escribir
+            break
+        # El tiempo es la última columna de cualquier fila del frame, alcanza con la primera
+        times.append(float(buffer[header_end + 1:first_row_end].split()[-1]))
+        offsets.append(pos)
+        counts.append(num_particles)
+        line_size_hint = (frame_end - header_end) / num_particles
+        pos = frame_end
+    return offsets, counts, times, pos
+
+
+def scan_stream(file):
+    # Igual que scan_frames pero sobre un stream (un .xyz comprimido), sin cargarlo entero: los offsets son
+    # posiciones en el texto descomprimido
+    offsets, counts, times = [], [], []
+    pos = 0
+    while True:
+        count_line = file.readline()
+        if not count_line.strip():
+            break
+        num_particles = int(count_line)
+        header = file.readline()
+        first_line = file.readline()
+        if not first_line.endswith(b'\n'):
+            break
+        rest = list(itertools.islice(file, num_particles - 1))
+        if len(rest) < num_particles - 1 or (rest and not rest[-1].endswith(b'\n')):
+            # El último frame quedó a medio escribir
+            break
+        times.append(frame_time([first_line]))
+        offsets.append(pos)
+        counts.append(num_particles)
+        pos += len(count_line) + len(header) + len(first_line) + sum(len(line) for line in rest)
+    return offsets, counts, times, pos
+
+
+def build_index(filename):
+    source = find_xyz(filename)
+    fingerprint = file_fingerprint(source)
+    if is_compressed(source):
+        with open_xyz(source) as (file, _):
+            offsets, counts, times, end = scan_stream(file)
+    else:
+        with open(source, 'rb') as file:
+            if fingerprint["size"] == 0:
+                offsets, counts, times, end = [], [], [], 0
+            else:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    offsets, counts, times, end = scan_frames(buffer)
+    np.savez(index_path(filename),
+             offsets=np.asarray(offsets, dtype=np.int64),
+             counts=np.asarray(counts, dtype=np.int32),
+             times=np.asarray(times, dtype=np.float64),
+             end=end, size=fingerprint["size"], mtime_ns=fingerprint["mtime_ns"])
+
+
+class FrameIndex:
+    def __init__(self, filename, offsets, counts, times, end):
+        self.filename = filename
+        self.offsets = offsets
+        self.counts = counts
+        self.times = times
+        self.end = end
+        self._file = None
+        self._buffer = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _mapped(self):
+        if self._buffer is None:
+            self._file = open(find_xyz(self.filename), 'rb')
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._buffer
+
+    def _decompressed(self, start, end):
+        # En un archivo comprimido no se puede saltar al offset: descomprimimos de a bloques hasta llegar a él,
+        # sin guardar lo anterior
+        with open_xyz(find_xyz(self.filename)) as (file, _):
+            remaining = start
+            while remaining > 0:
+                skipped = len(file.read(min(remaining, CHUNK_SIZE)))
+                if not skipped:
+                    break
+                remaining -= skipped
+            return file.read(end - start)
+
+    def frame(self, k):
+        # Devuelve el frame k como arreglo (partículas x columnas) leyendo sólo sus bytes
+        k = range(len(self))[k]
+        start = self.offsets[k]
+        end = self.offsets[k + 1] if k + 1 < len(self) else self.end
+        if is_compressed(find_xyz(self.filename)):
+            buffer = self._decompressed(start, end)
+            start, end = 0, len(buffer)
+        else:
+            buffer = self._mapped()
+        header_end = buffer.find(b'\n', buffer.find(b'\n', start) + 1)
+        values = np.fromstring(buffer[header_end + 1:end], sep=' ')
+        return values.reshape(self.counts[k], len(HEADERS))
+
+    def nearest(self, time):
+        # Índice del frame con el tiempo más cercano al pedido
+        k = int(np.searchsorted(self.times, time))
+        if k == len(self):
+            return k - 1
+        if k > 0 and time - self.times[k - 1] <= self.times[k] - time:
+            return k - 1
+        return k
+
+    def frame_at(self, time):
+        return self.frame(self.nearest(time))
+
+    def last_frame(self):
+        return self.frame(-1)
+
+    def last_time(self):
+        return float(self.times[-1])
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._file.close()
+            self._buffer = None
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def stored_fingerprint(path):
+    with np.load(path) as stored:
+        return {"size": int(stored["size"]), "mtime_ns": int(stored["mtime_ns"])}
+
+
+@traced("frame_index", rows=lambda result, *args, **kwargs: len(result))
+def load_index(filename):
+    # Construye el índice si no existe o si el .xyz (o su versión comprimida) cambió desde que se generó
+    fingerprint = file_fingerprint(find_xyz(filename))
+    path = index_path(filename)
+    if not os.path.exists(path) or stored_fingerprint(path) != fingerprint:
+        build_index(filename)
+    # Copiamos los arreglos y cerramos el .npz, que si no queda abierto en cada llamada
+    with np.load(path) as stored:
+        return FrameIndex(filename, stored["offsets"], stored["counts"], stored["times"], int(stored["end"]))
+
+
+def read_frame_times(filename):
+    if read_meta(filename) is not None and is_fresh(filename):
+        # El caché ya tiene los tiempos de los frames; es lo único que queda si la corrida se compactó a float32
+        return load_frames(filename)[0].tolist()
+    try:
+        return load_index(filename).times.tolist()
+    except FileNotFoundError:
+        print(f"El archivo {find_xyz(filename)} no fue encontrado.")
+        return None
+
+
+def read_last_time(filename):
+    times = read_frame_times(filename)
+    return None if times is None else max(times)
@@ -96,7 +96,11 @@ class CannonballSystem(
             )
         val stabilizedParticles = simulator.simulate(true, shouldLog)
         if (pGenSave) {
-            Particle.saveParticlesToFile(particles, "out/init-particles/stable-particles-$outputFile", shouldLog)
+            Particle.saveParticlesToFile(
+                stabilizedParticles,
+                "out/init-particles/stable-particles-$outputFile",
+                shouldLog
+            )
         }
 
         return stabilizedParticles